@@ -0,0 +1,335 @@
+###############################################################################
+# Compute a climatology (count, mean, standard deviation and percentiles of
+# temperature, dewpoint and wind speed) per station, month, hour and pressure
+# level from an archive of retrieved TEXT:LIST soundings.
+#
+# The archive is streamed in chunks of files, so memory use doesn't grow with
+# the number of years. Each chunk is parsed, interpolated onto the pressure
+# levels (see analysis/interp.py) and folded into running statistics:
+#   - count, mean and sum of squared differences from the mean, merged using
+#     the parallel form of Welford's algorithm (Chan et al, 1979) so they are
+#     numerically stable over decades of data, and
+#   - a fixed-bin histogram of each variable, from which percentiles are
+#     estimated to within a fraction of a bin.
+# Both merge exactly, so the archive can be split across a pool of processes
+# and the partial climatologies combined at the end. Memory depends only on
+# the number of station/month/hours, levels and histogram bins.
+#
+# To run (from the src dir):
+#   python3 -m analysis.climatology --archive DIR --output clim.csv
+#       [--levels 1000,850,...] [--quantiles 0.05,0.5,0.95]
+#       [--chunksize 200] [--processes 4]
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import csv
+import glob
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from raobtype.sounding import read_textlist
+from analysis.interp import interpolate_soundings
+from lib.messageHandler import printmsg
+from lib.storage import SUFFIX
+
+# Mandatory pressure levels (hPa)
+LEVELS = [1000, 925, 850, 700, 500, 400, 300, 250, 200, 150, 100, 70, 50,
+          30, 20, 10]
+
+# Variables to summarize, with the range and bin width of their histograms.
+# Values outside the range are counted in the end bins.
+VARIABLES = {
+    'TEMP': (-100.0, 60.0, 0.5),   # C
+    'DWPT': (-120.0, 40.0, 0.5),   # C
+    'SKNT': (0.0, 300.0, 1.0),     # knots
+}
+
+QUANTILES = [0.05, 0.5, 0.95]
+
+
+class RunningStats():
+
+    def __init__(self, nlevels, low, high, width):
+        """
+        Running statistics of one variable at each of nlevels levels
+
+        Parameters:
+            nlevels: number of levels
+            low, high, width: range and bin width of the histogram
+        """
+        self.low = low
+        self.width = width
+        nbins = int(np.ceil((high - low) / width))
+        self.count = np.zeros(nlevels, dtype=np.int64)
+        self.mean = np.zeros(nlevels)
+        self.m2 = np.zeros(nlevels)  # Sum of squared differences from mean
+        self.hist = np.zeros((nlevels, nbins), dtype=np.uint32)
+
+    def get_bins(self, values):
+        """ Return the histogram bin of each value """
+        nbins = self.hist.shape[1]
+        return(np.clip(np.floor((values - self.low) / self.width), 0,
+                       nbins - 1).astype(np.int64))
+
+    def combine(self, count, mean, m2, hist):
+        """ Merge in statistics of another set of values at each level """
+        total = self.count + count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = mean - self.mean
+            self.mean = np.where(total > 0,
+                                 self.mean + delta * count / total, 0.0)
+            self.m2 = np.where(total > 0, self.m2 + m2 +
+                               delta ** 2 * self.count * count / total, 0.0)
+        self.count = total
+        self.hist += hist.astype(np.uint32)
+
+    def merge(self, other):
+        """ Merge in another RunningStats of the same variable and levels """
+        self.combine(other.count, other.mean, other.m2, other.hist)
+
+    def get_std(self):
+        """ Return the sample standard deviation at each level """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return(np.where(self.count > 1,
+                            np.sqrt(self.m2 / (self.count - 1)), np.nan))
+
+    def get_mean(self):
+        return(np.where(self.count > 0, self.mean, np.nan))
+
+    def get_quantiles(self, quantiles):
+        """
+        Estimate quantiles at each level from the histogram, interpolating
+        linearly within bins.
+
+        Returns a (levels x quantiles) array, NaN at levels with no values.
+        """
+        result = np.full((self.hist.shape[0], len(quantiles)), np.nan)
+        cumulative = np.cumsum(self.hist, axis=1, dtype=np.int64)
+        for level in range(self.hist.shape[0]):
+            total = cumulative[level, -1]
+            if total == 0:
+                continue
+            target = np.asarray(quantiles) * total
+            b = np.minimum(np.searchsorted(cumulative[level], target,
+                                           side='left'),
+                           self.hist.shape[1] - 1)
+            below = cumulative[level, b] - self.hist[level, b]
+            fraction = (target - below) / np.maximum(self.hist[level, b], 1)
+            result[level] = self.low + self.width * (b + fraction)
+        return(result)
+
+
+class Climatology():
+
+    def __init__(self, levels=LEVELS, variables=VARIABLES):
+        """
+        Running statistics per (station, month, hour) and level
+
+        Parameters:
+            levels: pressure levels (hPa)
+            variables: dictionary of TEXT:LIST columns to summarize, with the
+                       (low, high, bin width) of their histograms
+        """
+        self.levels = list(levels)
+        self.variables = dict(variables)
+        self.stats = {}     # (station, month, hour) -> {variable: stats}
+        self.soundings = 0  # Number of soundings added
+
+    def get_stats(self, key):
+        """ Return the statistics of a station/month/hour, creating them """
+        if key not in self.stats:
+            self.stats[key] = {
+                name: RunningStats(len(self.levels), *self.variables[name])
+                for name in self.variables}
+        return(self.stats[key])
+
+    def add(self, soundings):
+        """ Add a chunk of soundings """
+        soundings = [s for s in soundings
+                     if s.get_station() != '' and s.get_time() is not None]
+        if len(soundings) == 0:
+            return
+
+        # Group the soundings by station/month/hour
+        keys = []
+        group = {}
+        for key in keys_of(soundings):
+            if key not in group:
+                group[key] = len(keys)
+                keys.append(key)
+        index = np.array([group[key] for key in keys_of(soundings)])
+        ngroups = len(keys)
+        nlevels = len(self.levels)
+
+        # Interpolate all the soundings in the chunk at once, then sum each
+        # group/level with bincount
+        values = interpolate_soundings(soundings, self.levels,
+                                       list(self.variables))
+        cell = index[:, np.newaxis] * nlevels + np.arange(nlevels)
+        for name, value in values.items():
+            ok = np.isfinite(value)
+            v = value[ok]
+            c = cell[ok]
+            size = ngroups * nlevels
+            count = np.bincount(c, minlength=size)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.bincount(c, weights=v, minlength=size) / count
+            m2 = np.bincount(c, weights=(v - mean[c]) ** 2, minlength=size)
+            mean = np.nan_to_num(mean)
+
+            template = RunningStats(nlevels, *self.variables[name])
+            nbins = template.hist.shape[1]
+            hist = np.bincount(c * nbins + template.get_bins(v),
+                               minlength=size * nbins)
+
+            count = count.reshape(ngroups, nlevels)
+            mean = mean.reshape(ngroups, nlevels)
+            m2 = m2.reshape(ngroups, nlevels)
+            hist = hist.reshape(ngroups, nlevels, nbins)
+            for i, key in enumerate(keys):
+                self.get_stats(key)[name].combine(count[i], mean[i], m2[i],
+                                                  hist[i])
+        self.soundings += len(soundings)
+
+    def merge(self, other):
+        """ Merge in a climatology of other soundings, e.g. from a worker """
+        for key, stats in other.stats.items():
+            mine = self.get_stats(key)
+            for name in stats:
+                mine[name].merge(stats[name])
+        self.soundings += other.soundings
+
+    def get_size(self):
+        """ Return the memory used by the statistics, in bytes """
+        size = 0
+        for stats in self.stats.values():
+            for s in stats.values():
+                size += s.count.nbytes + s.mean.nbytes + s.m2.nbytes + \
+                    s.hist.nbytes
+        return(size)
+
+    def rows(self, quantiles=QUANTILES):
+        """
+        Yield a summary row per station, month, hour, level and variable:
+        [station, month, hour, level, variable, count, mean, std, quantiles..]
+        """
+        for key in sorted(self.stats):
+            for name, s in self.stats[key].items():
+                mean = s.get_mean()
+                std = s.get_std()
+                q = s.get_quantiles(quantiles)
+                for i, level in enumerate(self.levels):
+                    if s.count[i] == 0:
+                        continue
+                    yield(list(key) + [level, name, int(s.count[i]),
+                                       round(mean[i], 2), round(std[i], 2)] +
+                          [round(x, 2) for x in q[i]])
+
+    def write(self, outfile, quantiles=QUANTILES):
+        """ Write the climatology to a CSV file """
+        with open(outfile, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['station', 'month', 'hour', 'level', 'variable',
+                             'count', 'mean', 'std'] +
+                            ['p' + ('%g' % (100 * q)) for q in quantiles])
+            for row in self.rows(quantiles):
+                writer.writerow(row)
+
+
+def keys_of(soundings):
+    """ Return the (station, month, hour) of each sounding """
+    keys = []
+    for s in soundings:
+        time = s.get_time()
+        keys.append((s.get_station(), time.month, time.hour))
+    return(keys)
+
+
+def find_files(archive):
+    """ Return the TEXT:LIST files, compressed or not, under an archive
+    directory """
+    files = []
+    for suffix in [''] + list(SUFFIX.values()):
+        files += glob.glob(os.path.join(archive, '**', '*.txt' + suffix),
+                           recursive=True)
+    return(sorted(files))
+
+
+def summarize(files, levels=LEVELS, variables=VARIABLES, chunksize=200,
+              log=""):
+    """
+    Compute the climatology of a list of TEXT:LIST files, reading chunksize
+    files at a time.
+    """
+    climatology = Climatology(levels, variables)
+    for start in range(0, len(files), chunksize):
+        soundings = []
+        for datafile in files[start:start + chunksize]:
+            try:
+                soundings += read_textlist(datafile)
+            except (OSError, ValueError) as e:
+                printmsg(log, "WARNING: Skipping " + datafile + ": " + str(e))
+        climatology.add(soundings)
+    return(climatology)
+
+
+def summarize_archive(files, levels=LEVELS, variables=VARIABLES,
+                      chunksize=200, processes=1, log=""):
+    """
+    Compute the climatology of a list of TEXT:LIST files, splitting them
+    across a pool of processes
+    """
+    if processes <= 1 or len(files) <= chunksize:
+        return(summarize(files, levels, variables, chunksize, log))
+
+    climatology = Climatology(levels, variables)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(summarize, files[i::processes], levels,
+                               variables, chunksize)
+                   for i in range(processes)]
+        for future in futures:
+            climatology.merge(future.result())
+    return(climatology)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compute a climatology per station, month, hour and " +
+        "pressure level from an archive of TEXT:LIST soundings")
+    parser.add_argument('--archive', type=str, required=True,
+                        help='Directory containing TEXT:LIST (.txt) files, ' +
+                        'searched recursively')
+    parser.add_argument('--output', type=str, default='climatology.csv',
+                        help='CSV file to write [climatology.csv]')
+    parser.add_argument('--levels', type=str,
+                        default=','.join([str(p) for p in LEVELS]),
+                        help='Comma separated pressure levels (hPa)')
+    parser.add_argument('--quantiles', type=str,
+                        default=','.join([str(q) for q in QUANTILES]),
+                        help='Comma separated quantiles to estimate')
+    parser.add_argument('--chunksize', type=int, default=200,
+                        help='Number of files to read at a time [200]')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Number of processes to use [1]')
+    args = parser.parse_args()
+
+    levels = [float(p) if '.' in p else int(p)
+              for p in args.levels.split(',')]
+    quantiles = [float(q) for q in args.quantiles.split(',')]
+
+    files = find_files(args.archive)
+    printmsg("", "Summarizing " + str(len(files)) + " files in " +
+             args.archive)
+    climatology = summarize_archive(files, levels, VARIABLES, args.chunksize,
+                                    args.processes)
+    climatology.write(args.output, quantiles)
+    printmsg("", "Wrote climatology of " + str(climatology.soundings) +
+             " soundings to " + args.output)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,345 @@
+###############################################################################
+# Thermodynamic diagnostics computed for many soundings at once.
+#
+# Takes padded (n_soundings x n_levels) arrays of pressure (hPa), temperature
+# (C) and dewpoint (C), as returned by raobtype.sounding.stack(), and
+# computes for a surface-based parcel:
+#    the lifted condensation level (LCL)
+#    the level of free convection (LFC) and equilibrium level (EL)
+#    convective available potential energy (CAPE) and inhibition (CIN)
+#    precipitable water (PW)
+#    lifted index (LI)
+# Every calculation is a NumPy operation across all the soundings, rather
+# than a loop over soundings, and works on plain floats rather than pint
+# quantities.
+#
+# The formulations follow MetPy 1.7 so results agree with metpy.calc:
+# saturation vapor pressure from Ambaum (2020), LCL from Romps (2017), moist
+# pseudo-adiabats from Bakhshaii (2013) (integrated here with fixed-step
+# Runge-Kutta rather than an adaptive ODE solver), and CAPE/CIN integrated
+# over log pressure using virtual temperature. CAPE and CIN match
+# metpy.calc.cape_cin(p, T, Td, parcel_profile(p, T, Td)).
+#
+# Levels in each row must be ordered by decreasing pressure and be packed
+# from the first element, with NaN padding at the end.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import numpy as np
+from scipy.special import lambertw
+
+# Constants, as used by MetPy
+Rd = 287.04749097718457     # Dry air gas constant (J/K/kg)
+Rv = 461.52311572606084     # Water vapor gas constant (J/K/kg)
+Cp_d = 1004.6662184201462   # Dry air specific heat at constant p (J/K/kg)
+Cp_v = 1860.078011865639    # Water vapor specific heat at constant p
+Cp_l = 4219.400000000001    # Liquid water specific heat (J/K/kg)
+Lv = 2500840.0              # Latent heat of vaporization at T0 (J/kg)
+T0 = 273.16                 # Triple point of water (K)
+epsilon = Rd / Rv           # Ratio of molecular weights of water and dry air
+kappa = Rd / Cp_d
+g = 9.80665                 # Gravitational acceleration (m/s^2)
+rho_l = 999.97495           # Density of liquid water (kg/m^3)
+sat_pressure_0c = 6.112     # Saturation vapor pressure at T0 (hPa)
+ZERO_C = 273.15             # 0 C in K
+
+
+def saturation_vapor_pressure(temperature):
+    """ Saturation vapor pressure (hPa) over liquid water at temperature (K)
+    """
+    latent_heat = Lv - (Cp_l - Cp_v) * (temperature - T0)
+    heat_power = (Cp_l - Cp_v) / Rv
+    exp_term = (Lv / T0 - latent_heat / temperature) / Rv
+    return(sat_pressure_0c * (T0 / temperature) ** heat_power *
+           np.exp(exp_term))
+
+
+def mixing_ratio(partial_press, total_press):
+    """ Mixing ratio (kg/kg) of a gas at partial_press in total_press """
+    return(epsilon * partial_press / (total_press - partial_press))
+
+
+def saturation_mixing_ratio(pressure, temperature):
+    """ Saturation mixing ratio (kg/kg) at pressure (hPa), temperature (K).
+    NaN where it is undefined (saturation vapor pressure >= pressure). """
+    e_s = saturation_vapor_pressure(temperature)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return(np.where(e_s >= pressure, np.nan,
+                        mixing_ratio(e_s, pressure)))
+
+
+def virtual_temperature(temperature, mixing):
+    """ Virtual temperature (K) of air at temperature (K) and mixing ratio """
+    return(temperature * (mixing + epsilon) / (epsilon * (1 + mixing)))
+
+
+def lcl(pressure, temperature, dewpoint):
+    """
+    Return the pressure (hPa) and temperature (K) of the lifted condensation
+    level of parcels starting at pressure (hPa), temperature and dewpoint
+    (K). Solved directly (Romps, 2017, Eq. 22) rather than iteratively.
+    """
+    w = saturation_mixing_ratio(pressure, dewpoint)
+    q = w / (1 + w)
+    moist_heat_ratio = (Cp_d + q * (Cp_v - Cp_d)) / (Rd + q * (Rv - Rd))
+    spec_heat_diff = Cp_l - Cp_v
+    a = moist_heat_ratio + spec_heat_diff / Rv
+    b = -(Lv + spec_heat_diff * T0) / (Rv * temperature)
+    c = b / a
+    rh = (saturation_vapor_pressure(dewpoint) /
+          saturation_vapor_pressure(temperature))
+    w_minus1 = lambertw(rh ** (1 / a) * c * np.exp(c), k=-1).real
+    t_lcl = c / w_minus1 * temperature
+    p_lcl = pressure * (t_lcl / temperature) ** moist_heat_ratio
+    return(p_lcl, t_lcl)
+
+
+def dry_lapse(pressure, temperature, reference_pressure):
+    """ Temperature (K) of parcels lifted dry adiabatically to pressure """
+    return(temperature * (pressure / reference_pressure) ** kappa)
+
+
+def moist_lapse_rate(lnp, temperature):
+    """ dT/dln(p) (K) of saturated parcels along a pseudo-adiabat """
+    rs = saturation_mixing_ratio(np.exp(lnp), temperature)
+    return((Rd * temperature + Lv * rs) /
+           (Cp_d + Lv * Lv * rs * epsilon / (Rd * temperature ** 2)))
+
+
+def moist_lapse(pressure, temperature, reference_pressure, step=0.01):
+    """
+    Temperature (K) of saturated parcels starting at reference_pressure and
+    temperature (one per sounding), lifted pseudo-adiabatically through the
+    levels in pressure (n_soundings x n_levels). Levels below the reference
+    pressure (or NaN) are returned as NaN.
+
+    All soundings are integrated together, level by level, with fourth order
+    Runge-Kutta steps in ln(p) of at most step.
+    """
+    lnp = np.log(pressure)
+    x = np.log(reference_pressure)  # Where each parcel has got to
+    t = np.array(temperature, dtype=float)
+    result = np.full(pressure.shape, np.nan)
+
+    for k in range(pressure.shape[1]):
+        target = lnp[:, k]
+        with np.errstate(invalid='ignore'):
+            above = np.isfinite(target) & (target <= x)
+        if not np.any(above):
+            continue
+        dx = np.where(above, target - x, 0.0)
+        nsteps = int(np.ceil(np.max(np.abs(dx)) / step))
+        if nsteps > 0:
+            h = dx / nsteps
+            for i in range(nsteps):
+                k1 = moist_lapse_rate(x, t)
+                k2 = moist_lapse_rate(x + h / 2, t + h / 2 * k1)
+                k3 = moist_lapse_rate(x + h / 2, t + h / 2 * k2)
+                k4 = moist_lapse_rate(x + h, t + h * k3)
+                t = np.where(above, t + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4),
+                             t)
+                x = x + h
+        result[:, k] = np.where(above, t, np.nan)
+
+    return(result)
+
+
+def parcel_profile(pressure, temperature, dewpoint):
+    """
+    Temperature (K) of parcels lifted from the first level of each sounding:
+    dry adiabatically to the LCL, then moist adiabatically.
+
+    Returns the parcel temperatures and the LCL pressure and temperature.
+    """
+    p0 = pressure[:, 0]
+    p_lcl, t_lcl = lcl(p0, temperature[:, 0], dewpoint[:, 0])
+
+    dry = dry_lapse(pressure, temperature[:, 0:1], p0[:, np.newaxis])
+    moist = moist_lapse(pressure, t_lcl, p_lcl)
+    with np.errstate(invalid='ignore'):
+        profile = np.where(pressure >= p_lcl[:, np.newaxis], dry, moist)
+    return(profile, p_lcl, t_lcl)
+
+
+def crossings(lnp, y):
+    """
+    Find where y crosses zero between levels, interpolating linearly in ln(p).
+    As in MetPy, the segment between the first two levels is ignored.
+
+    Returns the crossing pressures (NaN where there is none, one per pair of
+    levels), and masks of where y increases through zero (going up) and where
+    it decreases through zero.
+    """
+    y0 = y[:, :-1]
+    y1 = y[:, 1:]
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        increasing = (y0 <= 0) & (y1 > 0)
+        decreasing = (y0 > 0) & (y1 <= 0)
+        frac = y0 / (y0 - y1)
+        pc = np.exp(lnp[:, :-1] + (lnp[:, 1:] - lnp[:, :-1]) * frac)
+    increasing[:, 0] = False
+    decreasing[:, 0] = False
+    pc = np.where(increasing | decreasing, pc, np.nan)
+    return(pc, increasing, decreasing)
+
+
+def integrate(lnp, y, bottom, top):
+    """
+    Integrate y (piecewise linear in ln(p)) over ln(p) between pressures
+    bottom and top (one per sounding). NaN levels are ignored.
+    """
+    x0 = lnp[:, :-1]
+    x1 = lnp[:, 1:]
+    hi = np.log(bottom)[:, np.newaxis]
+    lo = np.log(top)[:, np.newaxis]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Clip each segment to the layer
+        b = np.clip(x0, lo, hi)
+        a = np.clip(x1, lo, hi)
+        dx = x1 - x0
+        slope = np.where(dx != 0, (y[:, 1:] - y[:, :-1]) / dx, 0.0)
+        yb = y[:, :-1] + slope * (b - x0)
+        ya = y[:, :-1] + slope * (a - x0)
+        area = (b - a) * (ya + yb) / 2
+    return(np.nansum(np.where(np.isfinite(area), area, 0.0), axis=1))
+
+
+def cape_cin(pressure, temperature, dewpoint, profile, p_lcl):
+    """
+    Return CAPE and CIN (J/kg), LFC and EL pressure (hPa) of parcels
+    following profile (K). Uses the lowest LFC and the highest EL. Where
+    there is no EL (the parcel is still buoyant at the top of the sounding)
+    CAPE is integrated to the top and the EL is NaN.
+    """
+    nsnd = pressure.shape[0]
+    lnp = np.log(pressure)
+    valid = np.isfinite(pressure) & np.isfinite(temperature) & \
+        np.isfinite(dewpoint) & np.isfinite(profile)
+    top = np.nanmin(np.where(valid, pressure, np.nan), axis=1)
+    with np.errstate(invalid='ignore'):
+        below_lcl = pressure > p_lcl[:, np.newaxis]
+
+    # Virtual temperature of the parcel and environment. The parcel keeps
+    # its starting mixing ratio below the LCL, and is saturated above.
+    w_start = saturation_mixing_ratio(pressure[:, 0], dewpoint[:, 0])
+    w_parcel = np.where(below_lcl, w_start[:, np.newaxis],
+                        saturation_mixing_ratio(pressure, profile))
+    tv_parcel = virtual_temperature(profile, w_parcel)
+    tv_env = virtual_temperature(temperature,
+                                 saturation_mixing_ratio(pressure, dewpoint))
+    y = np.where(valid, tv_parcel - tv_env, np.nan)
+
+    # As in MetPy, the LFC and EL are found relative to the LCL of a parcel
+    # starting at the virtual temperature of the first level.
+    p_lcl, _ = lcl(pressure[:, 0], tv_parcel[:, 0], dewpoint[:, 0])
+    pc, increasing, decreasing = crossings(lnp, y)
+    with np.errstate(invalid='ignore'):
+        above = pc < p_lcl[:, np.newaxis]
+        positive_above_lcl = np.any((y > 0) &
+                                    (pressure < p_lcl[:, np.newaxis]), axis=1)
+
+    # LFC: lowest crossing into positive buoyancy above the LCL. With no such
+    # crossing, the LFC is the LCL if the parcel is buoyant above the LCL.
+    lfc_above = np.max(np.where(increasing & above, pc, -np.inf), axis=1)
+    any_increasing = np.any(increasing, axis=1)
+    el_lowest = np.min(np.where(decreasing, pc, np.inf), axis=1)
+    lfc = np.where(np.isfinite(lfc_above), lfc_above,
+                   np.where(~any_increasing,
+                            np.where(positive_above_lcl, p_lcl, np.nan),
+                            np.where(np.isfinite(el_lowest) &
+                                     (el_lowest > p_lcl), np.nan, p_lcl)))
+
+    # EL: highest crossing out of positive buoyancy, if above the LCL and the
+    # parcel isn't buoyant at the top of the sounding.
+    last = np.sum(valid, axis=1) - 1
+    buoyant_top = y[np.arange(nsnd), np.maximum(last, 0)] > 0
+    el = np.where(buoyant_top | ~(el_lowest < p_lcl), np.nan, el_lowest)
+
+    # As in MetPy, CAPE and CIN are integrated between the levels and zero
+    # crossings within their layers. So if the LFC is the LCL, CAPE starts at
+    # the first point above the LCL and CIN at the first point below.
+    points = np.concatenate((np.where(valid, pressure, np.nan), pc), axis=1)
+    close = 1 + 1e-9
+    with np.errstate(invalid='ignore'):
+        cape_bottom = np.max(np.where(points <= lfc[:, np.newaxis] * close,
+                                      points, -np.inf), axis=1)
+        cin_top = np.min(np.where(points * close >= lfc[:, np.newaxis],
+                                  points, np.inf), axis=1)
+    has_lfc = np.isfinite(lfc) & np.isfinite(cape_bottom)
+    cape_top = np.where(np.isfinite(el), el, top)
+
+    ones = np.ones(nsnd)
+    cape = Rd * integrate(lnp, y, np.where(has_lfc, cape_bottom, ones),
+                          np.where(has_lfc, cape_top, ones))
+    cin = Rd * integrate(lnp, y, np.where(has_lfc, pressure[:, 0], ones),
+                         np.where(has_lfc & np.isfinite(cin_top), cin_top,
+                                  ones))
+    cape = np.where(has_lfc, cape, 0.0)
+    cin = np.where(has_lfc, np.minimum(cin, 0.0), 0.0)
+    return(cape, cin, lfc, el)
+
+
+def precipitable_water(pressure, dewpoint):
+    """ Precipitable water (mm) in each sounding. Dewpoint in K. """
+    w = mixing_ratio(saturation_vapor_pressure(dewpoint), pressure)
+    layer = (pressure[:, :-1] - pressure[:, 1:]) * (w[:, :-1] + w[:, 1:]) / 2
+    layer = np.where(np.isfinite(layer), layer, 0.0)
+    # hPa -> Pa, m -> mm
+    return(np.sum(layer, axis=1) * 100.0 / (g * rho_l) * 1000.0)
+
+
+def lifted_index(pressure, temperature, profile, level=500.0):
+    """
+    Lifted index (K): environment minus parcel temperature at level (hPa),
+    interpolated linearly in pressure. NaN if the sounding doesn't span level.
+    """
+    p0 = pressure[:, :-1]
+    p1 = pressure[:, 1:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        bracket = (p0 >= level) & (p1 <= level) & (p0 != p1)
+        frac = (level - p0) / (p1 - p0)
+    k = np.argmax(bracket, axis=1)
+    rows = np.arange(pressure.shape[0])
+    f = frac[rows, k]
+
+    def interp(values):
+        return(values[rows, k] + f * (values[rows, k + 1] - values[rows, k]))
+
+    li = interp(temperature) - interp(profile)
+    return(np.where(np.any(bracket, axis=1), li, np.nan))
+
+
+def diagnostics(pressure, temperature, dewpoint):
+    """
+    Compute stability diagnostics for a surface-based parcel in each
+    sounding.
+
+    Parameters:
+        pressure: (n_soundings x n_levels) pressure (hPa), decreasing with
+                  level, padded with NaN
+        temperature: temperature (C), same shape
+        dewpoint: dewpoint (C), same shape
+
+    Returns a dictionary of arrays, one value per sounding:
+        lcl_pressure (hPa), lcl_temperature (C), lfc_pressure (hPa),
+        el_pressure (hPa), cape (J/kg), cin (J/kg), pw (mm), li (K)
+    NaN where a level doesn't exist.
+    """
+    pressure = np.atleast_2d(np.asarray(pressure, dtype=float))
+    temperature = np.atleast_2d(np.asarray(temperature, dtype=float)) + ZERO_C
+    dewpoint = np.atleast_2d(np.asarray(dewpoint, dtype=float)) + ZERO_C
+
+    profile, p_lcl, t_lcl = parcel_profile(pressure, temperature, dewpoint)
+    cape, cin, lfc, el = cape_cin(pressure, temperature, dewpoint, profile,
+                                  p_lcl)
+
+    return({'lcl_pressure': p_lcl,
+            'lcl_temperature': t_lcl - ZERO_C,
+            'lfc_pressure': lfc,
+            'el_pressure': el,
+            'cape': cape,
+            'cin': cin,
+            'pw': precipitable_water(pressure, dewpoint),
+            'li': lifted_index(pressure, temperature, profile)})
@@ -0,0 +1,172 @@
+###############################################################################
+# Interpolate collections of soundings onto a common vertical grid, e.g. for
+# building MTP templates or comparing with model output.
+#
+# Mandatory and significant levels differ from sounding to sounding, so all
+# the soundings are stacked into NaN-padded (n_soundings x n_levels) arrays
+# (see raobtype.sounding.stack) and interpolated together: one searchsorted
+# of every level against the grid, and a count per sounding, finds the levels
+# bracketing every grid point of every sounding without looping in Python.
+#
+# Interpolation onto a pressure grid is linear in log(pressure); onto a
+# height grid it is linear in height. Grid points outside the levels of a
+# sounding are masked.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import numpy as np
+from raobtype.sounding import stack
+
+
+def interpolate(x, y, grid):
+    """
+    Interpolate each row of y, given at coordinates x, to the points in grid.
+
+    Parameters:
+        x: (n x L) coordinates, NaN where missing
+        y: (n x L) values at x
+        grid: (m) coordinates to interpolate to, in increasing order
+
+    Returns an (n x m) array. NaN where a grid point is outside the
+    coordinates of a row, or where the bracketing values are missing.
+    """
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    grid = np.asarray(grid, dtype=float)
+    n, nlev = x.shape
+    m = len(grid)
+    rows = np.arange(n)[:, np.newaxis]
+    if nlev == 0:
+        return(np.full((n, m), np.nan))
+
+    # Move missing coordinates to the end of each row (as inf), sorting rows
+    # only if they aren't already in order
+    valid = np.isfinite(x)
+    nvalid = np.sum(valid, axis=1)
+    x = np.where(valid, x, np.inf)
+    with np.errstate(invalid='ignore'):
+        unsorted = np.any(np.diff(x, axis=1) < 0)
+    if unsorted:
+        order = np.argsort(x, axis=1, kind='stable')
+        x = np.take_along_axis(x, order, axis=1)
+        y = np.take_along_axis(y, order, axis=1)
+
+    # Find the first level above each grid point, for all rows at once: bin
+    # every level by the grid points below it, then count the levels in the
+    # bins up to each grid point.
+    bins = np.searchsorted(grid, x, side='right')
+    counts = np.bincount((rows * (m + 1) + bins).ravel(),
+                         minlength=n * (m + 1)).reshape(n, m + 1)
+    idx = np.cumsum(counts[:, 0:m], axis=1)
+    idx = np.clip(idx, 1, np.maximum(nvalid - 1, 1)[:, np.newaxis])
+
+    # Interpolate between the levels either side of each grid point
+    above = rows * nlev + idx
+    below = above - 1
+    x = x.ravel()
+    y = y.ravel()
+    x0 = x[below]
+    x1 = x[above]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(x1 != x0, (grid - x0) / (x1 - x0), 0.0)
+        result = y[below] + weight * (y[above] - y[below])
+        top = x[rows[:, 0] * nlev + np.maximum(nvalid - 1, 0)]
+        inside = (grid >= x[rows * nlev]) & (grid <= top[:, np.newaxis]) & \
+            (nvalid >= 2)[:, np.newaxis]
+    return(np.where(inside, result, np.nan))
+
+
+def interpolate_soundings(soundings, grid, names=None, coord='PRES'):
+    """
+    Interpolate columns of many soundings onto a pressure or height grid.
+
+    Parameters:
+        soundings: list of Sounding instances
+        grid: pressures (hPa) or heights (m) to interpolate to
+        names: columns to interpolate. Defaults to all except coord.
+        coord: 'PRES' to interpolate in log(pressure), or 'HGHT' to
+               interpolate in height
+
+    Returns a dictionary of (n_soundings x n_grid) arrays, keyed by column
+    name. NaN where a grid point is outside a sounding.
+    """
+    grid = np.asarray(grid, dtype=float)
+    if names is None:
+        names = []
+        for sounding in soundings:
+            names += [c for c in sounding.columns
+                      if c != coord and c not in names]
+
+    # Work in a coordinate that increases up the sounding
+    if coord == 'PRES':
+        def transform(values):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return(-np.log(values))
+    else:
+        def transform(values):
+            return(values)
+    target = transform(grid)
+    order = np.argsort(target)
+
+    result = {}
+    for name in names:
+        # Stack each column with its own levels, so missing values in one
+        # column (e.g. wind) don't remove levels from the others.
+        s = stack(soundings, (coord, name))
+        values = np.full((len(soundings), len(grid)), np.nan)
+        values[:, order] = interpolate(transform(s[coord]), s[name],
+                                       target[order])
+        result[name] = values
+    return(result)
+
+
+class SoundingCube():
+
+    def __init__(self, soundings, grid, names=None, coord='PRES'):
+        """
+        Interpolate soundings onto a grid and arrange them into dense
+        (station x time x level) masked arrays, e.g.
+
+            cube = SoundingCube(soundings, [850, 700, 500, 300, 250])
+            cube.get('TEMP')[cube.stations.index('72672')]
+
+        Grid points outside a sounding, and station/times with no sounding,
+        are masked. Soundings without a station number or observation time
+        are left out.
+
+        Parameters:
+            soundings: list of Sounding instances
+            grid: pressures (hPa) or heights (m) to interpolate to
+            names: columns to interpolate. Defaults to all except coord.
+            coord: 'PRES' or 'HGHT'
+        """
+        soundings = [s for s in soundings
+                     if s.get_station() != '' and s.get_time() is not None]
+        self.grid = np.asarray(grid, dtype=float)
+        self.coord = coord
+        self.stations = sorted(set(s.get_station() for s in soundings))
+        self.times = sorted(set(s.get_time() for s in soundings))
+
+        station_index = {stn: i for i, stn in enumerate(self.stations)}
+        time_index = {time: i for i, time in enumerate(self.times)}
+        i = np.array([station_index[s.get_station()] for s in soundings],
+                     dtype=int)
+        j = np.array([time_index[s.get_time()] for s in soundings],
+                     dtype=int)
+
+        self.data = {}
+        values = interpolate_soundings(soundings, self.grid, names, coord)
+        for name, value in values.items():
+            cube = np.full((len(self.stations), len(self.times),
+                            len(self.grid)), np.nan)
+            cube[i, j] = value
+            self.data[name] = np.ma.masked_invalid(cube)
+
+    def get(self, name):
+        """ Return the (station x time x level) masked array of a column """
+        return(self.data[name])
+
+    def get_names(self):
+        return(list(self.data.keys()))
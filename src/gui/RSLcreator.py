@@ -6,16 +6,17 @@
 #
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
-import re
 import os
 import logging
 from PyQt5.QtCore import pyqtSignal, Qt
 from PyQt5.QtWidgets import QMainWindow, QFileDialog, QWidget, QGridLayout, \
-                            QListWidget, QPushButton, QAction, QLabel
+                            QListWidget, QPushButton, QAction, QLabel, \
+                            QListView, QLineEdit, QAbstractItemView
 from lib.raobroot import getrootdir
-from lib.stationlist import RAOBstation_list
+from lib.stationlist import get_station_list
 from lib.rsl import RSL
 from gui.fileselector import FileSelector
+from gui.stationmodel import StationListModel
 
 
 class RSLWidget(QWidget):
@@ -23,32 +24,39 @@ class RSLWidget(QWidget):
     # it to close the parent window.
     signal = pyqtSignal()
 
-    def __init__(self, station_list):
+    def __init__(self, stationList):
         """ Initialize the RSLCreator widget inside the creator main window """
         super().__init__()
 
         layout = QGridLayout(self)
 
-        # Create a QListWidget to hold the source station list
-        self.textbox = QListWidget(self)
-        self.textbox.show()
+        # Create a search box to filter the source station list by id,
+        # number, name, state or country as the user types
+        self.search = QLineEdit(self)
+        self.search.setPlaceholderText("Search stations")
+        self.search.setClearButtonEnabled(True)
+        self.search.textChanged.connect(self.filter_station)
+        layout.addWidget(self.search, 1, 0)
+
+        # Create a QListView to hold the source station list. The view only
+        # asks the model for the rows that are visible. If the user cancelled
+        # out of selecting a source station list, or requested a non-existent
+        # one, the model shows the error instead.
+        self.model = StationListModel()
+        self.textbox = QListView(self)
+        self.textbox.setModel(self.model)
+        self.textbox.setUniformItemSizes(True)
+        self.textbox.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.textbox.setDragEnabled(True)
-        layout.addWidget(self.textbox, 1, 0, 12, 1)
+        self.textbox.show()
+        layout.addWidget(self.textbox, 2, 0, 11, 1)
+        self.display_station(stationList)
 
         # Add a title above the source station list
         lbl = QLabel("Master Station List")
         lbl.setAlignment(Qt.AlignCenter | Qt.AlignCenter)
         layout.addWidget(lbl, 0, 0)
 
-        # If the user cancelled out of selecting a source station list, or
-        # requested a non-existent one, capture the error here and warn them.
-        # Otherwise, display stations in textbox
-        error = re.compile("^ERROR:")
-        if isinstance(station_list, str) and error.match(station_list):
-            self.textbox.addItem(station_list)
-        else:
-            self.display_station(station_list)
-
         # Create a QListWidget to hold the selected stations to be saved to
         # the RSL file.
         self.rslbox = QListWidget(self)
@@ -74,18 +82,21 @@ class RSLWidget(QWidget):
         layout.addWidget(save, 11, 1)
         save.clicked.connect(self.saveRSL)
 
-    def display_station(self, station_list):
-        """ Load stations from station_list into textbox """
-        for stn in station_list:
-            self.textbox.addItem(stn['id'] + "\t" + stn['number'] + " " +
-                                 stn['description'] + "\t" + stn['state'] +
-                                 " " + stn['country'] + " " + stn['lat'] +
-                                 " " + stn['lon'] + " " + stn['elev'])
+    def display_station(self, stationList):
+        """ Load stations from stationList (a RAOBstation_list) into textbox
+        """
+        self.model.set_station_list(stationList)
+
+    def filter_station(self, text):
+        """ Show only the stations matching the search text """
+        self.model.set_filter(text)
 
     def select_station(self):
         """ Transfer a station from the master list to the RSL list """
-        for line in self.textbox.selectedItems():
-            self.rslbox.addItem(line.text())
+        rows = sorted(index.row() for index in
+                      self.textbox.selectionModel().selectedRows())
+        for row in rows:
+            self.rslbox.addItem(self.model.data(self.model.index(row)))
 
     def remove_station(self):
         """ Remove station from RSL list """
@@ -140,14 +151,13 @@ class RSLCreator(QMainWindow):
         # Get the filename from the request station_list_file so it will
         # be the default unless user changes it via menu option 'load master
         # station list'
-        self.stationList = RAOBstation_list()
-        self.station_list = \
-            self.stationList.read(getrootdir() + "/" +
-                                  self.request.get_stnlist_file())
+        self.stationList = get_station_list(getrootdir() + "/" +
+                                            self.request.get_stnlist_file(),
+                                            self.log)
 
         # Create the GUI that will allow selecting stations from the source
         # list to be included in the RSL file.
-        self.win = RSLWidget(self.station_list)
+        self.win = RSLWidget(self.stationList)
         self.setCentralWidget(self.win)
         self.win.signal.connect(self.close_win)
         self.win.show()
@@ -196,12 +206,10 @@ class RSLCreator(QMainWindow):
 
         self.request.set_stnlist_file(self.initDialog(rootdir, filefilter))
         if self.request.get_stnlist_file() != "":
-            self.station_list = \
-                self.stationList.read(os.path.join(
-                                      rootdir,
-                                      self.request.get_stnlist_file()))
-            self.win.textbox.clear()
-            self.win.display_station(self.station_list)
+            self.stationList = get_station_list(os.path.join(
+                                  rootdir, self.request.get_stnlist_file()),
+                                  self.log)
+            self.win.display_station(self.stationList)
 
     def loadRSLFile(self):
         """
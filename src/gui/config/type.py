@@ -7,6 +7,8 @@
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
 import logging
+import raobtype.types  # noqa: F401 - registers the built-in RAOB types
+from raobtype.raobtype import get_types
 from PyQt5.QtWidgets import QLabel, QComboBox
 
 
@@ -26,12 +28,13 @@ class Type():
         lbl = QLabel("Data Format")
         box.addWidget(lbl, row, 0)
         self.comboBox.addItem("")
-        self.comboBox.addItem("TEXT:LIST")
-        self.comboBox.addItem("GIF:SKEWT")
+        for name in get_types():
+            self.comboBox.addItem(name)
         self.comboBox.activated[str].connect(self.set)
-        self.comboBox.setToolTip('Choose to either download data in text ' +
-                                 'format, or download SkewT plots as gif ' +
-                                 'images.')
+        self.comboBox.setToolTip('Choose to download data in text ' +
+                                 'format (TEXT:LIST, or TEXT:CSV without ' +
+                                 'the HTML), or download SkewT plots as ' +
+                                 'gif images.')
         box.addWidget(self.comboBox, row, 1)
 
     def set(self, text):
@@ -0,0 +1,304 @@
+###############################################################################
+# Code to display a gallery of thumbnails of every sounding retrieved (or
+# loaded from an archive directory) during a GUI session. Clicking on a
+# thumbnail shows the full-size sounding.
+#
+# Thumbnails and full-size images are only rendered when needed - when a
+# thumbnail scrolls into view or a sounding is selected - and are rendered in
+# a pool of background threads so the GUI stays responsive. TEXT:LIST data is
+# plotted as a skewt; GIF:SKEWT images are decoded and scaled. Rendered
+# pixmaps are kept in least-recently-used caches bounded by memory use, so
+# browsing hundreds of soundings doesn't hold them all in memory.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import glob
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, QSize, \
+    QAbstractListModel, QModelIndex, QVariant, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap, QColor
+from PyQt5.QtWidgets import QWidget, QGridLayout, QListView, QLabel, \
+    QScrollArea, QPushButton
+from gui.fileselector import FileSelector
+from lib.lrucache import LRUcache
+from lib.messageHandler import printmsg
+from lib.storage import SUFFIX
+from raobtype.skewt import SkewtPool
+
+# Skewts reused to render TEXT:LIST soundings
+skewts = SkewtPool()
+
+
+def pixmap_size(pixmap):
+    """ Return the memory used by a pixmap, in bytes """
+    return(pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8)
+
+
+def render_image(path, raobtype, mtp, size=0):
+    """
+    Render a sounding as a QImage. QImages (unlike QPixmaps) can be created
+    outside the GUI thread.
+
+    Parameters:
+        path: the retrieved TEXT:LIST or GIF:SKEWT file
+        raobtype: 'TEXT:LIST' or 'GIF:SKEWT'
+        mtp: True if TEXT:LIST files were stripped for the MTP
+        size: width and height to fit the image in, or 0 for full-size
+    """
+    if raobtype == 'TEXT:LIST':
+        # The skewt is 9 inches square, so pick a resolution giving size
+        # pixels rather than plotting full size and scaling down.
+        dpi = size / 9.0 if size else 100
+        with skewts.get() as skewt:
+            rdat = skewt.read_data(path, mtp)
+            pixels, width, height = skewt.render(rdat, dpi)
+        # Copy so the image owns its data
+        image = QImage(pixels, width, height, QImage.Format_RGBA8888).copy()
+    else:
+        image = QImage(path)
+
+    if size and not image.isNull():
+        image = image.scaled(size, size, Qt.KeepAspectRatio,
+                             Qt.SmoothTransformation)
+    return(image)
+
+
+class RenderSignals(QObject):
+    # QRunnables can't emit signals, so they share this QObject, which lives
+    # in the GUI thread. Signals are queued to the GUI thread.
+    rendered = pyqtSignal(str, str, QImage)  # kind, path, image
+
+
+class RenderTask(QRunnable):
+
+    def __init__(self, signals, kind, path, raobtype, mtp, size):
+        super().__init__()
+        self.signals = signals
+        self.kind = kind    # 'thumb' or 'full'
+        self.path = path
+        self.raobtype = raobtype
+        self.mtp = mtp
+        self.size = size
+
+    def run(self):
+        try:
+            image = render_image(self.path, self.raobtype, self.mtp,
+                                 self.size)
+        except Exception:
+            image = QImage()  # Unreadable file. Shown as a blank thumbnail.
+        self.signals.rendered.emit(self.kind, self.path, image)
+
+
+class GalleryModel(QAbstractListModel):
+
+    # Emitted when a full-size pixmap requested by get_full is ready
+    fullReady = pyqtSignal(str, QPixmap)  # path, pixmap
+
+    def __init__(self, log="", size=160, thumb_cache=64, full_cache=256,
+                 threads=2, parent=None):
+        """
+        Parameters:
+            log: pointer to the GUI log window
+            size: width and height of the thumbnails, in pixels
+            thumb_cache: memory to use for thumbnails, in MB
+            full_cache: memory to use for full-size images, in MB
+            threads: number of threads rendering images
+        """
+        super().__init__(parent)
+        self.log = log
+        self.size = size
+        self.entries = []   # (path, raobtype, mtp) of each sounding
+        self.rows = {}      # path -> row in entries
+        self.thumbs = LRUcache(thumb_cache * 1024 * 1024, pixmap_size)
+        self.full = LRUcache(full_cache * 1024 * 1024, pixmap_size)
+        self.pending = set()  # (kind, path) of images being rendered
+        self.priority = 0     # Render the latest requests first
+
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(threads)
+        self.signals = RenderSignals()
+        self.signals.rendered.connect(self.rendered)
+
+        # Shown until a thumbnail has been rendered
+        self.placeholder = QPixmap(size, size)
+        self.placeholder.fill(QColor('lightgray'))
+
+    def add(self, raobtype, path, mtp=False):
+        """ Add a retrieved sounding to the gallery """
+        path = os.path.abspath(path)
+        if path in self.rows:
+            # Sounding was retrieved again, so re-render it
+            row = self.rows[path]
+            self.entries[row] = (path, raobtype, mtp)
+            self.thumbs.remove(path)
+            self.full.remove(path)
+            self.dataChanged.emit(self.index(row), self.index(row))
+            return
+
+        row = len(self.entries)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.entries.append((path, raobtype, mtp))
+        self.rows[path] = row
+        self.endInsertRows()
+
+    def get_path(self, row):
+        return(self.entries[row][0])
+
+    def request(self, kind, row):
+        """ Render a thumbnail or full-size image in the background """
+        path, raobtype, mtp = self.entries[row]
+        if (kind, path) in self.pending:
+            return
+        self.pending.add((kind, path))
+        self.priority += 1
+        size = self.size if kind == 'thumb' else 0
+        self.pool.start(RenderTask(self.signals, kind, path, raobtype, mtp,
+                                   size), self.priority)
+
+    def rendered(self, kind, path, image):
+        """ Cache a rendered image and tell the view. Runs in GUI thread. """
+        self.pending.discard((kind, path))
+        if path not in self.rows:
+            return
+        if image.isNull():
+            pixmap = QPixmap(self.placeholder)
+            if kind == 'full':
+                printmsg(self.log, "WARNING: Unable to display " + path)
+        else:
+            pixmap = QPixmap.fromImage(image)
+
+        if kind == 'thumb':
+            self.thumbs.put(path, pixmap)
+            row = self.rows[path]
+            self.dataChanged.emit(self.index(row), self.index(row),
+                                  [Qt.DecorationRole])
+        else:
+            self.full.put(path, pixmap)
+            self.fullReady.emit(path, pixmap)
+
+    def get_full(self, row):
+        """
+        Return the full-size pixmap of a sounding if cached. Otherwise return
+        None, and emit fullReady once it has been rendered.
+        """
+        pixmap = self.full.get(self.get_path(row))
+        if pixmap is None:
+            self.request('full', row)
+        return(pixmap)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return(0)
+        return(len(self.entries))
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return(QVariant())
+        path = self.get_path(index.row())
+        if role == Qt.DisplayRole:
+            return(os.path.basename(path))
+        elif role == Qt.ToolTipRole:
+            return(path)
+        elif role == Qt.DecorationRole:
+            # The view only asks for the thumbnails it is displaying, so this
+            # is where thumbnails are rendered on demand.
+            pixmap = self.thumbs.get(path)
+            if pixmap is None:
+                self.request('thumb', index.row())
+                pixmap = self.placeholder
+            return(pixmap)
+        return(QVariant())
+
+
+class Gallery(QWidget):
+
+    def __init__(self, request, log="", size=160):
+        """
+        Create a gallery of thumbnails above a full-size image viewer
+
+        Parameters:
+            request: the RAOBdata request, used to tell if archived TEXT:LIST
+                     files are in MTP format
+            log: pointer to the GUI log window
+            size: width and height of the thumbnails, in pixels
+        """
+        super().__init__()
+        self.request = request
+        self.log = log
+        self.shown = None  # Path of sounding being displayed full-size
+
+        layout = QGridLayout(self)
+
+        self.model = GalleryModel(log, size)
+        self.model.fullReady.connect(self.showFull)
+
+        # Icon mode view. Only the visible rows are asked for their
+        # thumbnails, and laying out in batches keeps long lists responsive.
+        self.view = QListView(self)
+        self.view.setViewMode(QListView.IconMode)
+        self.view.setIconSize(QSize(size, size))
+        self.view.setGridSize(QSize(size + 16, size + 32))
+        self.view.setResizeMode(QListView.Adjust)
+        self.view.setMovement(QListView.Static)
+        self.view.setUniformItemSizes(True)
+        self.view.setLayoutMode(QListView.Batched)
+        self.view.setModel(self.model)
+        self.view.selectionModel().currentChanged.connect(self.select)
+        layout.addWidget(self.view, 0, 0, 1, 2)
+
+        # Full-size image of the selected sounding
+        self.image = QLabel("Click on a sounding to display it")
+        self.image.setAlignment(Qt.AlignCenter)
+        scroll = QScrollArea(self)
+        scroll.setWidget(self.image)
+        scroll.setWidgetResizable(True)
+        layout.addWidget(scroll, 1, 0, 1, 2)
+
+        # Add soundings retrieved in earlier sessions
+        archive = QPushButton("Add archived soundings")
+        archive.setToolTip('Add the soundings in a directory to the gallery')
+        archive.clicked.connect(self.clickArchive)
+        layout.addWidget(archive, 2, 0)
+
+    def add(self, raobtype, outfile, mtp=False):
+        """ Add a retrieved sounding to the gallery """
+        self.model.add(raobtype, outfile, mtp)
+
+    def add_dir(self, dir):
+        """ Add the TEXT:LIST (.txt, compressed or not) and GIF:SKEWT (.gif)
+        files in dir """
+        count = 0
+        for suffix in [''] + list(SUFFIX.values()):
+            for path in sorted(glob.glob(os.path.join(dir, '*.txt' + suffix))):
+                self.add('TEXT:LIST', path, self.request.get_mtp())
+                count += 1
+        for path in sorted(glob.glob(os.path.join(dir, '*.gif'))):
+            self.add('GIF:SKEWT', path)
+            count += 1
+        printmsg(self.log, "Added " + str(count) + " soundings from " + dir +
+                 " to gallery")
+
+    def clickArchive(self):
+        """ Ask the user for a directory of soundings to add """
+        getdir = FileSelector("dir")
+        dir = getdir.get_file()
+        if dir:
+            self.add_dir(dir)
+
+    def select(self, current, previous):
+        """ Display the selected sounding full-size """
+        if not current.isValid():
+            return
+        self.shown = self.model.get_path(current.row())
+        pixmap = self.model.get_full(current.row())
+        if pixmap is None:
+            self.image.setText("Loading " + os.path.basename(self.shown))
+        else:
+            self.image.setPixmap(pixmap)
+
+    def showFull(self, path, pixmap):
+        """ Display a full-size image once rendered, if still selected """
+        if path == self.shown:
+            self.image.setPixmap(pixmap)
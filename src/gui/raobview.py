@@ -6,7 +6,8 @@
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
 import sys
-from PyQt5.QtWidgets import QMainWindow, QAction
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QMainWindow, QAction, QDockWidget
 from gui.raobwidget import Widget
 from gui.fileselector import FileSelector
 from lib.config import config
@@ -50,6 +51,12 @@ class RAOBview(QMainWindow):
         # Get a pointer to the log message window
         self.log = self.widget.get_log()
 
+        # Put the gallery of retrieved soundings in a dock widget, so the user
+        # can move, float or close it.
+        self.gallery = QDockWidget("Gallery", self)
+        self.gallery.setWidget(self.widget.get_gallery())
+        self.addDockWidget(Qt.RightDockWidgetArea, self.gallery)
+
         # Configure the menu bar
         self.createMenuBar()
 
@@ -80,6 +87,10 @@ class RAOBview(QMainWindow):
         saveConfig.triggered.connect(self.saveConfig)
         fileMenu.addAction(saveConfig)
 
+        # Add a menu option to show or hide the gallery
+        viewMenu = menubar.addMenu("View")
+        viewMenu.addAction(self.gallery.toggleViewAction())
+
         # Add a menu/submenu? option to quit
         quitButton = QAction('Quit', self)
         quitButton.setShortcut('Ctrl+Q')
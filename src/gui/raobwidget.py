@@ -5,12 +5,15 @@
 #
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
+import time
 import logging
 from PyQt5.QtWidgets import QLabel, QPushButton, QGridLayout, QWidget, \
-     QFrame, QPlainTextEdit
+     QFrame, QPlainTextEdit, QProgressBar
 from PyQt5.QtGui import QPixmap
 from gui.configedit import GUIconfig
-from lib.messageHandler import printmsg
+from gui.raobworker import RAOBworker
+from gui.gallery import Gallery
+from lib.messageHandler import printmsg, eventbus, GUIsink
 from raobtype.skewt import Skewt
 from lib.raobroot import getrootdir
 import userlib.mtp
@@ -22,6 +25,8 @@ class Widget(QWidget):
         super().__init__()
 
         self.app = app
+        self.worker = None  # Background retrieval, when running
+        self.skewt = None   # Skewt plot, reused for each sounding
         self.initWidget(raob)
 
     def initWidget(self, raob):
@@ -48,9 +53,17 @@ class Widget(QWidget):
         # Add an image window to hold the skewt
         self.createImageWindow()
 
+        # Create a gallery of the soundings retrieved this session. The main
+        # window decides where to put it.
+        self.gallery = Gallery(raob.request, self.log)
+
         # Add a button to begin retrieving RAOBs
         self.createRetrieveButton()
 
+    def get_gallery(self):
+        """ Return a pointer to the gallery of retrieved soundings """
+        return(self.gallery)
+
     def configGUI(self):
         """ Return a pointer to the configuration editor """
         return(self.config)
@@ -60,12 +73,27 @@ class Widget(QWidget):
         return(self.log)
 
     def createRetrieveButton(self):
-        """ Create button which when clicked starts RAOB retrieval """
-        retrieve = QPushButton("Retrieve RAOBs")
-        self.layout.addWidget(retrieve, 2, 0)
-        retrieve.clicked.connect(self.clickRetrieve)
-        retrieve.setToolTip('Click to start downloading RAOBs')
-        retrieve.show()
+        """
+        Create button which when clicked starts RAOB retrieval, a button to
+        cancel a running retrieval, and a progress bar
+        """
+        self.retrieve = QPushButton("Retrieve RAOBs")
+        self.layout.addWidget(self.retrieve, 2, 0)
+        self.retrieve.clicked.connect(self.clickRetrieve)
+        self.retrieve.setToolTip('Click to start downloading RAOBs')
+        self.retrieve.show()
+
+        self.cancel = QPushButton("Cancel")
+        self.layout.addWidget(self.cancel, 2, 1)
+        self.cancel.clicked.connect(self.clickCancel)
+        self.cancel.setToolTip('Click to stop downloading RAOBs after the ' +
+                               'current RAOB')
+        self.cancel.setEnabled(False)
+
+        self.progress = QProgressBar()
+        self.progress.setFormat("%v/%m")
+        self.progress.setValue(0)
+        self.layout.addWidget(self.progress, 2, 2)
 
     def createImageWindow(self):
         """ Add an image window to hold the Skewt image """
@@ -92,14 +120,15 @@ class Widget(QWidget):
         """
         Change the image window from hosting a QLabel widget, which can hold a
         gif image, to a matplotlib FigureCanvas which can hold a metpy skewt
-        plot.
+        plot. The canvas is created once and reused.
         """
         self.layout.removeWidget(self.image)
-        self.skewt = Skewt(self.app)
-        self.skewt.set_fig()
-        self.skewt.set_canvas()
-        self.canvas = self.skewt.get_canvas()
-        self.layout.addWidget(self.canvas, 0, 1, 1, 2)
+        if self.skewt is None:
+            self.skewt = Skewt(self.app)
+            self.skewt.new_fig()
+            self.skewt.set_canvas()
+            self.canvas = self.skewt.get_canvas()
+            self.layout.addWidget(self.canvas, 0, 1, 1, 2)
 
     def createLogMessageWindow(self):
         """ Add a log message window """
@@ -107,6 +136,9 @@ class Widget(QWidget):
         log.setReadOnly(True)
         self.layout.addWidget(log, 1, 0, 1, 3)
         log.setFrameStyle(QFrame.Panel | QFrame.Sunken)
+        # Messages for this window are batched in by a timer, so appending
+        # stays cheap as the log grows.
+        eventbus.add_sink(GUIsink(log))
         printmsg(log, "Status and error messages will appear here")
         log.show()
         return(log)
@@ -117,22 +149,59 @@ class Widget(QWidget):
         logging.info(str(self.raob.request.get_request()))
         # Ask user where to save RAOB files
         userlib.mtp.set_dir(self.log, self.raob.request)
-        self.raob.get(self, self.app, self.log)
+
+        # If TEXT:LIST, change the image to a canvas
+        if self.raob.request.get_type() == 'TEXT:LIST':
+            self.resetImageWindow()
+
+        # Retrieve in the background so the GUI stays responsive
+        self.worker = RAOBworker(self.raob, self.log)
+        self.worker.progress.connect(self.updateProgress)
+        self.worker.retrieved.connect(self.display)
+        self.worker.thread.finished.connect(self.retrievalDone)
+        self.retrieve.setEnabled(False)
+        self.cancel.setEnabled(True)
+        self.progress.setValue(0)
+        self.worker.begin()
+
+    def clickCancel(self):
+        """ Actions to take when the 'Cancel' button is selected """
+        if self.worker is not None and self.worker.thread.isRunning():
+            printmsg(self.log, "Cancelling retrieval after current RAOB")
+            self.cancel.setEnabled(False)
+            self.worker.cancel()
+
+    def updateProgress(self, done, total, stn, eta):
+        """ Show retrieval progress: done/total, current station, ETA """
+        self.progress.setMaximum(max(total, 1))
+        self.progress.setValue(done)
+        self.progress.setFormat("%v/%m " + stn + "  ETA " +
+                                time.strftime('%H:%M:%S', time.gmtime(eta)))
+
+    def display(self, raobtype, outfile):
+        """ Display a RAOB retrieved by the background worker """
+        self.gallery.add(raobtype, outfile, self.raob.request.get_mtp())
+        if raobtype == 'TEXT:LIST':
+            self.createSkewt(outfile)
+        else:
+            self.setImage(outfile)
+
+    def retrievalDone(self):
+        """ Reset the buttons when the background retrieval finishes """
+        self.retrieve.setEnabled(True)
+        self.cancel.setEnabled(False)
+        self.progress.setFormat("%v/%m")
 
     def createSkewt(self, outfile):
         """
         Create a skewt image from a downloaded TEXT:LIST data file and display
         it.
         """
-        # Clear previous plot
-        self.skewt.clear()
-
         # read_data currently is specific to the format changes made for MTP
         # data backward compatibility. If Mode is set to CATALOG or Default, it
         # will crash, so check for that here.
         rdat = self.skewt.read_data(outfile, self.raob.request.get_mtp())
-        self.skewt.create_skewt(rdat)
-        self.canvas = self.skewt.get_canvas()
+        # Replace the previous sounding in the plot
+        self.skewt.update(rdat)
         self.canvas.draw()
-        self.skewt.close()
         self.app.processEvents()
@@ -0,0 +1,68 @@
+###############################################################################
+# Run RAOB retrievals in a background thread so the GUI stays responsive.
+# The worker reports progress (done/total, current station, ETA) and hands
+# each retrieved RAOB back to the GUI thread for display via Qt signals.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import time
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+
+class RAOBworker(QObject):
+    # Signals are delivered to slots in the GUI thread (queued connections)
+    progress = pyqtSignal(int, int, str, float)  # done, total, stn, ETA (s)
+    retrieved = pyqtSignal(str, str)             # raobtype, outfile
+    finished = pyqtSignal()
+
+    def __init__(self, raob, log=""):
+        """
+        Parameters:
+            raob: the RAOBget instance holding the request
+            log: pointer to the GUI log window
+        """
+        super().__init__()
+        self.raob = raob
+        self.log = log
+        self.start = 0
+
+        # Create a thread to run in. Keep a reference so it isn't garbage
+        # collected while running.
+        self.thread = QThread()
+        self.moveToThread(self.thread)
+        self.thread.started.connect(self.run)
+        self.finished.connect(self.thread.quit)
+
+    def begin(self):
+        """ Start retrieving in the background thread """
+        self.raob.cancel_event.clear()
+        self.thread.start()
+
+    def cancel(self):
+        """ Stop after the RAOB currently being retrieved """
+        self.raob.cancel()
+
+    def run(self):
+        """ Retrieve the requested RAOBs. Runs in the background thread. """
+        self.start = time.time()
+        self.raob.progress = self.report_progress
+        self.raob.display = self.retrieved.emit
+        try:
+            # Pass no widget or app so nothing touches the GUI from this
+            # thread. Retrieved RAOBs are displayed via the retrieved signal.
+            self.raob.get(None, None, self.log)
+        finally:
+            self.raob.progress = None
+            self.raob.display = None
+            self.finished.emit()
+
+    def report_progress(self, done, total, stn):
+        """ Estimate time remaining from the average time per RAOB so far """
+        elapsed = time.time() - self.start
+        if done > 0 and total > done:
+            eta = elapsed / done * (total - done)
+        else:
+            eta = 0.0
+        self.progress.emit(done, total, stn, eta)
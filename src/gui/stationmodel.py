@@ -0,0 +1,76 @@
+###############################################################################
+# Qt model presenting a master station list to a QListView. Rows are only
+# formatted when the view asks for them (i.e. when they are visible), so
+# large station tables load instantly. The model can be filtered to the
+# stations matching a search string (see RAOBstation_index in
+# lib/stationlist.py).
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QVariant
+
+
+class StationListModel(QAbstractListModel):
+
+    def __init__(self, stationList=None, parent=None):
+        """
+        Parameters:
+            stationList: a RAOBstation_list, e.g. from get_station_list()
+        """
+        super().__init__(parent)
+        self.stationList = None
+        self.stations = []  # station_list of stationList
+        self.rows = []      # positions in stations of the rows shown
+        self.error = ""     # message to show instead of stations, if any
+        self.text = ""      # current search text
+        if stationList is not None:
+            self.set_station_list(stationList)
+
+    def set_station_list(self, stationList):
+        """ Show the stations in stationList, filtered by the search text """
+        self.beginResetModel()
+        self.stationList = stationList
+        self.stations = stationList.station_list
+        self.error = stationList.error
+        self.rows = stationList.search(self.text)
+        self.endResetModel()
+
+    def set_filter(self, text):
+        """ Show only stations matching text """
+        self.text = text
+        if self.stationList is None:
+            return
+        self.beginResetModel()
+        self.rows = self.stationList.search(text)
+        self.endResetModel()
+
+    def get_station(self, row):
+        """ Return the station dictionary shown in row """
+        return(self.stations[self.rows[row]])
+
+    def get_line(self, stn):
+        """ Format a station for display """
+        return(stn['id'] + "\t" + stn['number'] + " " + stn['description'] +
+               "\t" + stn['state'] + " " + stn['country'] + " " + stn['lat'] +
+               " " + stn['lon'] + " " + stn['elev'])
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return(0)
+        if self.error != "":
+            return(1)
+        return(len(self.rows))
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return(QVariant())
+        if self.error != "":
+            return(self.error)
+        return(self.get_line(self.get_station(index.row())))
+
+    def flags(self, index):
+        if not index.isValid() or self.error != "":
+            return(Qt.NoItemFlags)
+        return(Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsDragEnabled)
@@ -0,0 +1,134 @@
+###############################################################################
+# Retrieve RAOBs from a Python program without writing any files. The
+# soundings are parsed straight from the pages received, e.g.
+#
+#   from datetime import datetime
+#   from lib.api import fetch
+#
+#   for sounding in fetch(['72672', 'GJT'], datetime(2019, 5, 28, 0),
+#                         datetime(2019, 5, 29, 12)):
+#       print(sounding.get_station(), sounding.get_time(),
+#             sounding.get('TEMP'))
+#
+# Add raobtype='TEXT:CSV' to retrieve the smaller, quicker to parse CSV
+# format. Requests are built and checked just as RAOBget does (see
+# lib/rwget.py). Each call uses its own request, so fetch and fetch_one can
+# be called from any number of threads at once.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+from datetime import datetime, timedelta
+
+from lib.raobdata import RAOBdata, UWYO
+from lib.rwget import RAOBwget
+from lib.plan import plan_stations
+from lib.metrics import runmetrics
+from lib.messageHandler import printmsg
+from raobtype import types  # noqa: F401 - registers the built-in RAOB types
+from raobtype.raobtype import get_retriever
+
+
+def get_time(value):
+    """ Return a time given as a datetime or a 'yyyymmddhh' string as a
+    datetime """
+    if isinstance(value, datetime):
+        return(value)
+    return(datetime.strptime(str(value), '%Y%m%d%H'))
+
+
+def get_times(start, end, freq=12):
+    """ Return the times from start to end (inclusive), every freq hours """
+    times = []
+    valid = get_time(start)
+    while valid <= get_time(end):
+        times.append(valid)
+        valid += timedelta(hours=int(freq))
+    return(times)
+
+
+def fetch_one(stn, valid, region='North America', server=UWYO, log="",
+              raobtype='TEXT:LIST'):
+    """
+    Retrieve one RAOB.
+
+    Parameters:
+        stn: station number or identifier
+        valid: time of the RAOB, as a datetime or 'yyyymmddhh'
+        region: archive region the station is in, e.g. 'North America'
+        server: base URL of the archive
+        raobtype: a data type, i.e. 'TEXT:LIST' or 'TEXT:CSV'
+
+    Returns:
+        a list of Sounding instances (see raobtype/sounding.py) - usually
+        one, or none if the archive has no such RAOB or can't be reached
+    """
+    retriever = get_retriever(raobtype)
+    if retriever is None or retriever.parse is None:
+        raise ValueError("Can't fetch RAOB type '" + raobtype + "' as data")
+
+    valid = get_time(valid)
+    request = RAOBdata()
+    request.set_server(server)
+    request.set_region(region)
+    request.set_type(raobtype)
+    request.set_year(valid.strftime('%Y'))
+    request.set_month(valid.strftime('%m'))
+    request.set_begin(valid.strftime('%d'), valid.strftime('%H'))
+    request.set_end(valid.strftime('%d'), valid.strftime('%H'))
+    request.set_stnm(stn)
+
+    rwget = RAOBwget(log)
+    text = rwget.fetch(rwget.get_url(request, log))
+    if text is None:
+        return([])
+
+    with runmetrics.span('parse'):
+        try:
+            soundings = retriever.parse(text)
+        except (ValueError, IndexError) as e:
+            printmsg(log, "WARNING: Can't parse " + raobtype + " RAOB " +
+                     stn + " at " + valid.strftime('%Y%m%d%HZ') + ": " +
+                     str(e))
+            return([])
+    for sounding in soundings:
+        if sounding.skipped > 0:
+            printmsg(log, "WARNING: Skipped " + str(sounding.skipped) +
+                     " rows of " + raobtype + " RAOB " + stn + " at " +
+                     valid.strftime('%Y%m%d%HZ') + " that can't be parsed")
+    # Some formats (e.g. TEXT:CSV) only hold data, so fill in what was asked
+    for sounding in soundings:
+        sounding.info.setdefault('Station number', stn)
+        sounding.info.setdefault('Observation time',
+                                 valid.strftime('%y%m%d/%H%M'))
+    return(soundings)
+
+
+def fetch(stations, start, end, freq=12, region='North America',
+          server=UWYO, log="", raobtype='TEXT:LIST'):
+    """
+    Retrieve the RAOBs from a list of stations between two times.
+
+    Parameters:
+        stations: a station number or identifier, or a list of them.
+                  Stations listed more than once are only retrieved once.
+        start, end: first and last times, as datetimes or 'yyyymmddhh'
+        freq: hours between RAOBs
+        region: archive region the stations are in, e.g. 'North America'
+        server: base URL of the archive
+        raobtype: a data type, i.e. 'TEXT:LIST' or 'TEXT:CSV'
+
+    Yields:
+        Sounding instances, by time and then in the order of stations.
+        RAOBs the archive doesn't have are skipped.
+    """
+    if isinstance(stations, str):
+        stations = [stations]
+    stations = plan_stations(stations, RAOBdata().stationList, log)
+
+    for valid in get_times(start, end, freq):
+        for stn in stations:
+            for sounding in fetch_one(stn, valid, region, server, log,
+                                      raobtype):
+                yield(sounding)
@@ -0,0 +1,234 @@
+###############################################################################
+# A persistent record, per station and launch hour, of whether past requests
+# found a RAOB, used to skip requests that are almost certain to get a
+# "Can't get ..." page back. Most stations only launch at 00Z and 12Z, so
+# with --freq 3 or 6 most requests would otherwise be wasted.
+#
+# A request is skipped if
+#   - a launch schedule is configured for the station (or for all stations)
+#     and doesn't include the hour, or
+#   - history shows the station rarely launches at that hour: the estimated
+#     chance of a RAOB, (found + 1) / (attempts + 2), is below THRESHOLD.
+#     Skipped hours are still requested once every RECHECK days, so a station
+#     that starts launching at a new hour is noticed.
+#
+# The record is kept in <cachedir>/availability.json. Each run adds its own
+# counts to what is on disk when it saves, so several processes can share it.
+#
+# Also here is a negative cache of the individual RAOBs the archive has said
+# don't exist ("Can't get ..." or "Sorry, unable to generate ..."), kept in
+# <cachedir>/missing.json, so a repeated run doesn't request them again.
+# Recent RAOBs may still arrive, so they are only remembered as missing for a
+# short time; old ones for much longer (see TTL).
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import json
+import time
+import calendar
+import threading
+from datetime import datetime
+from lib.messageHandler import printmsg
+
+THRESHOLD = 0.15  # Skip hours with less than this chance of a RAOB
+RECHECK = 7       # Request skipped hours again after this many days
+
+# How long to remember that a RAOB is missing, by the age of the RAOB:
+# (age less than, in hours; remember for, in hours)
+TTL = [(6, 0.25),    # Data often arrives within a few hours of launch
+       (48, 2),
+       (24 * 30, 24),
+       (None, 24 * 365)]
+
+
+def read_json(path, log=""):
+    """ Read a table saved by write_json, or return {} if there isn't one """
+    try:
+        with open(path) as f:
+            return(json.load(f))
+    except FileNotFoundError:
+        return({})
+    except ValueError:
+        printmsg(log, "WARNING: Ignoring corrupt table " + path)
+        return({})
+
+
+def write_json(path, table):
+    """ Write a table, replacing the file at once so readers never see part
+    of it """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmpfile = path + '.' + str(os.getpid()) + '.temp'
+    with open(tmpfile, 'w') as f:
+        json.dump(table, f, indent=1, sort_keys=True)
+    os.replace(tmpfile, path)
+
+
+def parse_launch_hours(value):
+    """
+    Parse launch schedules, e.g.
+        "00,12"                        - all stations launch at 00Z and 12Z
+        "72672=00,12 72476=00,06,12,18" - per station
+    Entries are separated by spaces or semicolons.
+
+    Returns a dictionary of station -> set of 'hh' hours. Station '' holds the
+    schedule of stations not listed.
+    """
+    schedules = {}
+    for entry in str(value).replace(';', ' ').split():
+        if '=' in entry:
+            stn, hours = entry.split('=', 1)
+        else:
+            stn, hours = '', entry
+        schedules[stn.strip()] = set('{:02d}'.format(int(hr))
+                                     for hr in hours.split(',') if hr != '')
+    return(schedules)
+
+
+class Availability():
+
+    def __init__(self, cachedir, launch_hours="", log=""):
+        """
+        Parameters:
+            cachedir: directory to keep availability.json in. Created if
+                      needed.
+            launch_hours: launch schedules. See parse_launch_hours.
+        """
+        self.log = log
+        self.path = os.path.join(cachedir, 'availability.json')
+        self.schedules = parse_launch_hours(launch_hours)
+        self.lock = threading.Lock()
+        self.table = self.load()  # stn -> hour -> counts, as on disk
+        self.added = {}           # counts added during this run
+
+    def load(self):
+        """ Read the table saved by earlier runs """
+        return(read_json(self.path, self.log))
+
+    def get(self, stn, hour):
+        """ Return the counts of a station and hour: attempts, found and
+        checked (time of the last attempt) """
+        counts = {'attempts': 0, 'found': 0, 'checked': 0}
+        for table in [self.table, self.added]:
+            entry = table.get(stn, {}).get(hour, {})
+            counts['attempts'] += entry.get('attempts', 0)
+            counts['found'] += entry.get('found', 0)
+            counts['checked'] = max(counts['checked'],
+                                    entry.get('checked', 0))
+        return(counts)
+
+    def likely(self, stn, hour):
+        """
+        Return False if a RAOB from station stn at hour 'hh' almost
+        certainly doesn't exist, so shouldn't be requested.
+        """
+        schedule = self.schedules.get(stn, self.schedules.get(''))
+        if schedule is not None and hour not in schedule:
+            return(False)
+
+        with self.lock:
+            counts = self.get(stn, hour)
+        chance = (counts['found'] + 1) / (counts['attempts'] + 2)
+        if chance >= THRESHOLD:
+            return(True)
+        return(time.time() - counts['checked'] > RECHECK * 86400)
+
+    def record(self, stn, hour, found):
+        """ Record whether a request for a RAOB found one """
+        with self.lock:
+            entry = self.added.setdefault(stn, {}).setdefault(
+                hour, {'attempts': 0, 'found': 0, 'checked': 0})
+            entry['attempts'] += 1
+            entry['found'] += 1 if found else 0
+            entry['checked'] = time.time()
+
+    def save(self):
+        """ Add this run's counts to the table on disk """
+        with self.lock:
+            if not self.added:
+                return
+            table = self.load()  # Pick up other processes' counts
+            for stn, hours in self.added.items():
+                for hour, entry in hours.items():
+                    saved = table.setdefault(stn, {}).setdefault(
+                        hour, {'attempts': 0, 'found': 0, 'checked': 0})
+                    saved['attempts'] += entry['attempts']
+                    saved['found'] += entry['found']
+                    saved['checked'] = max(saved['checked'], entry['checked'])
+
+            write_json(self.path, table)
+            self.table = table
+            self.added = {}
+
+
+def get_ttl(valid, found):
+    """ Return how long (seconds) to remember that a RAOB valid at datetime
+    valid (UTC) is missing, when found missing at time found (seconds since
+    the epoch) """
+    age = (found - calendar.timegm(valid.timetuple())) / 3600
+    for (limit, ttl) in TTL:
+        if limit is None or age < limit:
+            return(ttl * 3600)
+
+
+class MissingCache():
+
+    def __init__(self, cachedir, log=""):
+        """
+        Remember the RAOBs the archive has said don't exist
+
+        Parameters:
+            cachedir: directory to keep missing.json in. Created if needed.
+        """
+        self.log = log
+        self.path = os.path.join(cachedir, 'missing.json')
+        self.lock = threading.Lock()
+        self.table = read_json(self.path, log)  # key -> time found missing
+        self.changes = {}  # key -> new entry, or None if now retrieved
+
+    def get_key(self, stn, raobtype, valid):
+        return(stn + ' ' + raobtype + ' ' + valid.strftime('%Y%m%d%H'))
+
+    def is_missing(self, stn, raobtype, valid):
+        """ Return True if a RAOB is known not to exist """
+        key = self.get_key(stn, raobtype, valid)
+        with self.lock:
+            entry = self.changes.get(key, self.table.get(key))
+        if entry is None:
+            return(False)
+        return(time.time() - entry < get_ttl(valid, entry))
+
+    def add(self, stn, raobtype, valid):
+        """ Remember that a RAOB doesn't exist """
+        with self.lock:
+            self.changes[self.get_key(stn, raobtype, valid)] = time.time()
+
+    def remove(self, stn, raobtype, valid):
+        """ Forget that a RAOB was missing, e.g. once it has been retrieved """
+        key = self.get_key(stn, raobtype, valid)
+        with self.lock:
+            if key in self.table or key in self.changes:
+                self.changes[key] = None
+
+    def save(self):
+        """ Apply this run's changes to the table on disk, dropping entries
+        that have expired """
+        with self.lock:
+            if not self.changes:
+                return
+            table = read_json(self.path, self.log)
+            for key, entry in self.changes.items():
+                if entry is None:
+                    table.pop(key, None)
+                else:
+                    table[key] = entry
+            now = time.time()
+            for key in list(table):
+                valid = datetime.strptime(key.rsplit(' ', 1)[1], '%Y%m%d%H')
+                if now - table[key] >= get_ttl(valid, table[key]):
+                    del table[key]
+            write_json(self.path, table)
+            self.table = table
+            self.changes = {}
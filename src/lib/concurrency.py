@@ -0,0 +1,132 @@
+###############################################################################
+# Adaptive limit on the number of requests to the archive in flight at once,
+# so that retrieval runs fast when weather.uwyo.edu is quiet and backs off
+# when it is under load. The limit is adjusted by additive increase,
+# multiplicative decrease (AIMD), as TCP does:
+#   - after as many prompt answers as the current limit (about one round of
+#     requests), the limit grows by one
+#   - an error (including a throttled request, e.g. HTTP 503) or a slow
+#     answer halves the limit. An answer is slow if it took more than SLOW
+#     times the fastest answer among the last BASE_WINDOW.
+# The limit stays between the configured bounds (--concurrency). Requests
+# that were already in flight when the limit was cut don't cut it again, so
+# one burst of trouble halves the limit once.
+#
+# Each change of the limit is recorded in the run report as the
+# 'concurrency' series (see lib/metrics.py).
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import time
+import threading
+from collections import deque
+
+from lib.metrics import runmetrics
+
+DECREASE = 0.5    # Fraction of the limit kept on congestion
+SLOW = 3.0        # Answers slower than this many times the baseline are slow
+BASE_WINDOW = 50  # Number of recent answers to take the baseline from
+POLL = 0.5        # Seconds between checks for cancellation while waiting
+
+# Outcomes (see lib/rwget.py) of requests that reached the archive. Others,
+# e.g. a RAOB already downloaded, say nothing about the server.
+ANSWERED = ['retrieved', 'unchanged', 'missing']
+
+
+def parse_concurrency(value):
+    """
+    Parse concurrency bounds, given as the maximum (e.g. "8") or as
+    "min:max" (e.g. "2:8").
+
+    Returns (low, high). Raises ValueError if they aren't valid.
+    """
+    value = str(value)
+    if ':' in value:
+        low, high = value.split(':', 1)
+    else:
+        low, high = 1, value
+    low, high = int(low), int(high)
+    if low < 1 or high < low:
+        raise ValueError("Concurrency must be at least 1, with min <= max. " +
+                         "Got '" + value + "'")
+    return((low, high))
+
+
+class AIMDLimiter():
+
+    def __init__(self, low=1, high=8):
+        """
+        Parameters:
+            low, high: bounds on the number of requests in flight. Starts
+                       at low.
+        """
+        self.low = low
+        self.high = high
+        self.limit = float(low)
+        self.inflight = 0
+        self.prompt = 0             # Prompt answers since the last increase
+        self.cut = 0.0              # Time of the last decrease
+        self.latencies = deque(maxlen=BASE_WINDOW)
+        self.cond = threading.Condition()
+        runmetrics.record('concurrency', self.get_limit())
+
+    def get_limit(self):
+        return(int(self.limit))
+
+    def acquire(self, cancel_event=None):
+        """
+        Wait until another request may be sent.
+
+        Returns:
+            the time the request was allowed, to pass to release, or None if
+            cancel_event was set while waiting
+        """
+        with self.cond:
+            while self.inflight >= self.get_limit():
+                if cancel_event is not None and cancel_event.is_set():
+                    return(None)
+                self.cond.wait(POLL)
+            self.inflight += 1
+            return(time.perf_counter())
+
+    def release(self, start, outcome):
+        """
+        Finish a request allowed at start, and adjust the limit by how it
+        went.
+
+        Parameters:
+            start: the time returned by acquire
+            outcome: the outcome of the request (see lib/rwget.py)
+        """
+        latency = time.perf_counter() - start
+        with self.cond:
+            self.inflight -= 1
+            if outcome == 'error':
+                self.congested(start)
+            elif outcome in ANSWERED:
+                baseline = min(self.latencies, default=latency)
+                self.latencies.append(latency)
+                if latency > SLOW * baseline:
+                    self.congested(start)
+                else:
+                    self.prompt += 1
+                    if self.prompt >= self.get_limit():
+                        self.set_limit(self.limit + 1)
+            self.cond.notify_all()
+
+    def congested(self, start):
+        """ Halve the limit, unless it was already cut since start """
+        runmetrics.count('congestion')
+        if start >= self.cut:
+            self.cut = time.perf_counter()
+            self.set_limit(self.limit * DECREASE)
+
+    def set_limit(self, limit):
+        """ Change the limit, within the bounds, and record it """
+        old = self.get_limit()
+        self.limit = float(min(max(limit, self.low), self.high))
+        self.prompt = 0
+        if self.get_limit() != old:
+            runmetrics.record('concurrency', self.get_limit())
@@ -107,7 +107,7 @@ class config():
                 else:
                     request.set_key(key, self.projConfig[key])
 
-                logging.info(key + " set to " + self.projConfig[key])
+                logging.info(key + " set to " + str(self.projConfig[key]))
             else:
                 printmsg(self.log, "ERROR: key " + key + " in config file is" +
                          " not a valid key - skipping.")
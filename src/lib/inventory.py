@@ -0,0 +1,379 @@
+###############################################################################
+# A local SQLite inventory of the RAOBs retrieved: station, valid time, type,
+# where the file is stored, its size and SHA-256 hash, the URL it came from
+# and when it was retrieved. Retrieval registers each new file here and checks
+# here (rather than for the file on disk) whether a RAOB has already been
+# downloaded, and the inventory can be queried without listing and parsing
+# file names, e.g. to find the stations missing a RAOB at a given time.
+#
+# The inventory is kept in <cachedir>/inventory.db by default (--inventory),
+# with paths stored absolute, so one inventory covers every directory RAOBs
+# are retrieved into: a RAOB retrieved to several dirs (e.g. also for the
+# MTP) has a record for each file. Files downloaded before there was an
+# inventory are added the first time a retrieval finds them on disk.
+#
+# To query it (from the src dir):
+#   python3 -m lib.inventory list [--stnm 72672] [--start 2019052800]
+#       [--end 2019053112] [--raobtype TEXT:LIST]
+#   python3 -m lib.inventory missing --valid 2019052812 (--rsl FILE |
+#       --stnm 72672,72476) [--raobtype TEXT:LIST]
+#   python3 -m lib.inventory verify [--stnm 72672] [--start 2019052800]
+#       [--end 2019053112] [--raobtype TEXT:LIST]
+#
+# verify re-checks the stored files: each must still exist, match the size
+# and hash it was registered with, and end as a complete file of its kind
+# does (see lib/storage.py). Bad files are removed, with their records, and
+# requeued in the journal (see lib/scheduler.py) of the dir they were
+# retrieved to, so the next run there retrieves them again.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+import lib.storage as storage
+from lib.messageHandler import printmsg
+from lib.raobroot import getrootdir
+from lib.stationlist import get_station_list
+from lib.rsl import RSL
+from lib.plan import plan_stations
+from lib.rwget import remove_meta
+from lib.scheduler import Journal, JOURNAL, get_key
+
+# Name of the inventory file in the cache dir
+INVENTORY = 'inventory.db'
+
+# Version of the schema. An inventory with an older one is emptied, and
+# refilled as retrievals find the files on disk.
+VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    station   TEXT NOT NULL,     -- canonical station (see lib/plan.py)
+    valid     TEXT NOT NULL,     -- yyyymmddhh (UTC)
+    raobtype  TEXT NOT NULL,     -- e.g. TEXT:LIST
+    path      TEXT NOT NULL,     -- absolute path of the stored file
+    size      INTEGER NOT NULL,  -- bytes
+    sha256    TEXT NOT NULL,
+    url       TEXT NOT NULL,     -- where it was retrieved from, if known
+    retrieved TEXT NOT NULL,     -- yyyy-mm-ddThh:mm:ssZ
+    stripped  INTEGER NOT NULL,  -- 1 if stripped for the MTP, else 0
+    PRIMARY KEY (station, valid, raobtype, path)
+);
+CREATE INDEX IF NOT EXISTS products_valid ON products (valid, raobtype);
+CREATE INDEX IF NOT EXISTS products_path ON products (path);
+"""
+
+
+def get_hash(path):
+    """ Return the SHA-256 hash of a file, as hex """
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            sha256.update(block)
+    return(sha256.hexdigest())
+
+
+class Inventory():
+
+    def __init__(self, path, log=""):
+        """
+        Parameters:
+            path: the SQLite file. Created, with its directory, if needed.
+        """
+        self.log = log
+        self.path = path
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        # One connection, shared by the retrieval threads (see
+        # RAOBget.run_concurrent). Other processes wait for a lock for up to
+        # timeout seconds.
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            version = self.db.execute('PRAGMA user_version').fetchone()[0]
+            if version < VERSION:
+                self.db.execute('DROP TABLE IF EXISTS products')
+            self.db.executescript(SCHEMA)
+            self.db.execute('PRAGMA user_version = ' + str(VERSION))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def add(self, station, valid, raobtype, path, url='', stripped=False):
+        """ Register a stored RAOB file, replacing any earlier record of the
+        same RAOB stored in the same file, or its plain or compressed
+        version (see lib/storage.py)
+
+        Parameters:
+            stripped: True if the file was stripped for the MTP (see
+                      userlib/mtp.py), so no longer ends as the page did
+        """
+        path = os.path.abspath(path)
+        record = (station, valid, raobtype, path, os.path.getsize(path),
+                  get_hash(path), url,
+                  time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                  1 if stripped else 0)
+        with self.lock, self.db:
+            for old in self.find(station, valid, raobtype, path):
+                self.db.execute('DELETE FROM products WHERE station = ? ' +
+                                'AND valid = ? AND raobtype = ? AND ' +
+                                'path = ?', (station, valid, raobtype, old))
+            self.db.execute('INSERT INTO products VALUES ' +
+                            '(?, ?, ?, ?, ?, ?, ?, ?, ?)', record)
+
+    def find(self, station, valid, raobtype, path):
+        """ Return the paths of the records of a RAOB stored in a file, or
+        in its plain or compressed version. Call with the lock held. """
+        plain = storage.get_plain(os.path.abspath(path))
+        rows = self.db.execute('SELECT path FROM products WHERE ' +
+                               'station = ? AND valid = ? AND raobtype = ?',
+                               (station, valid, raobtype)).fetchall()
+        return([row[0] for row in rows
+                if storage.get_plain(row[0]) == plain])
+
+    def remove(self, station, valid, raobtype, path=None):
+        """ Forget a RAOB, e.g. if its file turns out to be bad
+
+        Parameters:
+            path: if given, only forget the RAOB stored in this file (or its
+                  plain or compressed version)
+        """
+        with self.lock, self.db:
+            paths = [None]
+            if path is not None:
+                paths = self.find(station, valid, raobtype, path)
+            for old in paths:
+                self.db.execute('DELETE FROM products WHERE station = ? ' +
+                                'AND valid = ? AND raobtype = ? AND ' +
+                                '(? IS NULL OR path = ?)',
+                                (station, valid, raobtype, old, old))
+
+    def get(self, station, valid, raobtype, path=None):
+        """ Return the record of a RAOB as a dictionary, or None if it hasn't
+        been retrieved
+
+        Parameters:
+            path: if given, only the RAOB stored in this file (or its plain
+                  or compressed version). Otherwise the one retrieved last.
+        """
+        with self.lock:
+            if path is not None:
+                paths = self.find(station, valid, raobtype, path)
+                if len(paths) == 0:
+                    return(None)
+                path = paths[0]
+            row = self.db.execute('SELECT * FROM products WHERE station = ? ' +
+                                  'AND valid = ? AND raobtype = ? AND ' +
+                                  '(? IS NULL OR path = ?) ORDER BY ' +
+                                  'retrieved DESC, rowid DESC',
+                                  (station, valid, raobtype, path,
+                                   path)).fetchone()
+        return(None if row is None else dict(row))
+
+    def has(self, station, valid, raobtype, path=None):
+        """ Return True if a RAOB has been retrieved (to path, if given) """
+        return(self.get(station, valid, raobtype, path) is not None)
+
+    def get_keys(self, raobtype, path=None):
+        """
+        Return the (station, valid) of every RAOB of a type retrieved, as a
+        set, e.g. to check a large plan against (see lib/plan.py).
+
+        Parameters:
+            path: if given, only RAOBs stored under this dir whose files are
+                  still there
+        """
+        with self.lock:
+            rows = self.db.execute('SELECT station, valid, path FROM ' +
+                                   'products WHERE raobtype = ?',
+                                   (raobtype,)).fetchall()
+        if path is not None:
+            under = os.path.join(os.path.abspath(path), '')
+            rows = [row for row in rows if row[2].startswith(under) and
+                    os.path.isfile(row[2])]
+        return(set([(row[0], row[1]) for row in rows]))
+
+    def query(self, station=None, start=None, end=None, raobtype=None):
+        """
+        Return the records of the RAOBs retrieved, as dictionaries ordered
+        by valid time and station.
+
+        Parameters (each optional):
+            station: only this station
+            start, end: only RAOBs valid from start to end (yyyymmddhh),
+                        inclusive
+            raobtype: only this type
+        """
+        where = []
+        args = []
+        for (column, op, value) in [('station', '=', station),
+                                    ('valid', '>=', start),
+                                    ('valid', '<=', end),
+                                    ('raobtype', '=', raobtype)]:
+            if value is not None:
+                where.append(column + ' ' + op + ' ?')
+                args.append(value)
+        sql = 'SELECT * FROM products'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY valid, station, path'
+        with self.lock:
+            return([dict(row) for row in self.db.execute(sql, args)])
+
+    def missing(self, stations, valid, raobtype):
+        """ Return the stations, of a list, that don't have a RAOB of a type
+        valid at a time (yyyymmddhh) """
+        with self.lock:
+            found = set([row[0] for row in self.db.execute(
+                'SELECT station FROM products WHERE valid = ? AND ' +
+                'raobtype = ?', (valid, raobtype))])
+        return([stn for stn in stations if stn not in found])
+
+
+def check(record):
+    """ Return what is wrong with a stored RAOB file, or None if it is
+    intact """
+    path = record['path']
+    if not os.path.isfile(path):
+        return("is missing")
+    if os.path.getsize(path) != record['size'] or \
+            get_hash(path) != record['sha256']:
+        return("has changed since it was retrieved")
+    try:
+        data = storage.read_bytes(path)
+    except (OSError, EOFError):
+        return("can't be read")
+    # Files stripped for the MTP no longer end as the page did
+    if not record['stripped'] and not storage.is_complete(data, path):
+        return("is incomplete")
+    return(None)
+
+
+def get_task(record):
+    """ Return the task (see lib/scheduler.py) that retrieves the RAOB of
+    a record again """
+    valid = record['valid']
+    return({'stnm': record['station'], 'raobtype': record['raobtype'],
+            'region': '', 'year': valid[0:4], 'month': valid[4:6],
+            'day': valid[6:8], 'hour': valid[8:10]})
+
+
+def verify(inventory, records, log=""):
+    """
+    Re-check the stored RAOB files of records (see check). Bad files are
+    removed, along with their records, and requeued in the journal of the
+    dir they were retrieved to.
+
+    Returns:
+        the records of the bad files
+    """
+    bad = []
+    journals = {}  # Journal path -> tasks
+    for record in records:
+        problem = check(record)
+        if problem is None:
+            continue
+        printmsg(log, "WARNING: " + record['path'] + " " + problem +
+                 ". Requeued it.")
+        if os.path.isfile(record['path']):
+            os.remove(record['path'])
+        remove_meta(storage.get_plain(record['path']))
+        inventory.remove(record['station'], record['valid'],
+                         record['raobtype'], record['path'])
+        path = os.path.join(os.path.dirname(record['path']), JOURNAL)
+        journals.setdefault(path, []).append(get_task(record))
+        bad.append(record)
+
+    for path, tasks in journals.items():
+        journal = Journal(path, log)
+        queued = journal.load()
+        keys = set([get_key(task) for task in queued])
+        journal.save(queued + [task for task in tasks
+                               if get_key(task) not in keys])
+    return(bad)
+
+
+def add_filters(parser):
+    """ Add the options that select RAOBs from the inventory """
+    parser.add_argument('--stnm', type=str, default=None,
+                        help='Only this station')
+    parser.add_argument('--start', type=str, default=None,
+                        help='Only RAOBs valid from (yyyymmddhh)')
+    parser.add_argument('--end', type=str, default=None,
+                        help='Only RAOBs valid until (yyyymmddhh)')
+    parser.add_argument('--raobtype', type=str, default=None,
+                        help='Only RAOBs of this type')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Query the inventory of RAOBs retrieved")
+    parser.add_argument('--inventory', type=str,
+                        default=os.path.join('~', '.raobget', INVENTORY),
+                        help='Inventory file [~/.raobget/' + INVENTORY + ']')
+    commands = parser.add_subparsers(dest='command')
+    listing = commands.add_parser('list', help='List the RAOBs retrieved')
+    add_filters(listing)
+    checking = commands.add_parser('verify', help='Re-check the files of ' +
+                                   'the RAOBs retrieved, and requeue bad ones')
+    add_filters(checking)
+    missing = commands.add_parser('missing', help='List the stations that ' +
+                                  'have no RAOB at a time')
+    missing.add_argument('--valid', type=str, required=True,
+                         help='Time of the RAOBs (yyyymmddhh)')
+    missing.add_argument('--rsl', type=str, default='',
+                         help='RSL file listing the stations to check')
+    missing.add_argument('--stnm', type=str, default='',
+                         help='Comma separated stations to check')
+    missing.add_argument('--raobtype', type=str, default='TEXT:LIST',
+                         help='RAOB type [TEXT:LIST]')
+    args = parser.parse_args()
+
+    stationList = get_station_list(getrootdir() + "/config/snstns.tbl")
+    inventory = Inventory(os.path.expanduser(args.inventory))
+
+    if args.command in ['list', 'verify']:
+        station = None
+        if args.stnm is not None:
+            stations = plan_stations([args.stnm], stationList)
+            if len(stations) == 0:
+                printmsg("", "ERROR: No station given with --stnm")
+                inventory.close()
+                return()
+            station = stations[0]
+        records = inventory.query(station, args.start, args.end,
+                                  args.raobtype)
+    if args.command == 'list':
+        for record in records:
+            printmsg("", " ".join([record['station'], record['valid'],
+                                   record['raobtype'], str(record['size']),
+                                   record['path']]))
+    elif args.command == 'verify':
+        bad = verify(inventory, records)
+        printmsg("", "Checked " + str(len(records)) + " RAOBs. Requeued " +
+                 str(len(bad)) + ".")
+    elif args.command == 'missing':
+        stnlist = args.stnm.split(',')
+        if args.rsl != '':
+            stnlist = RSL().read_rsl(args.rsl)
+        stations = plan_stations(stnlist, stationList)
+        for stn in inventory.missing(stations, args.valid, args.raobtype):
+            printmsg("", stn)
+    else:
+        parser.print_help()
+    inventory.close()
+
+
+if __name__ == "__main__":
+
+    main()
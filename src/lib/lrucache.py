@@ -0,0 +1,78 @@
+###############################################################################
+# A thread-safe least-recently-used cache bounded by the total size of the
+# items it holds (e.g. bytes of image data), rather than by a count of items.
+#
+#    cache = LRUcache(64 * 1024 * 1024, sizeof=lambda image: image.nbytes)
+#    cache.put(key, image)
+#    image = cache.get(key)   # None if never cached or since evicted
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import threading
+from collections import OrderedDict
+
+
+class LRUcache():
+
+    def __init__(self, maxsize, sizeof=len):
+        """
+        Parameters:
+            maxsize: maximum total size of the cached items
+            sizeof: function returning the size of an item
+        """
+        self.maxsize = maxsize
+        self.sizeof = sizeof
+        self.items = OrderedDict()  # key -> (item, size), oldest first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the item cached under key, or None """
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return(None)
+            self.items.move_to_end(key)
+            self.hits += 1
+            return(self.items[key][0])
+
+    def put(self, key, item):
+        """
+        Cache item under key, evicting the least recently used items until
+        the cache fits in maxsize. An item larger than maxsize is not cached.
+        """
+        size = self.sizeof(item)
+        with self.lock:
+            if key in self.items:
+                self.size -= self.items.pop(key)[1]
+            if size > self.maxsize:
+                return
+            self.items[key] = (item, size)
+            self.size += size
+            while self.size > self.maxsize:
+                self.size -= self.items.popitem(last=False)[1][1]
+
+    def remove(self, key):
+        with self.lock:
+            if key in self.items:
+                self.size -= self.items.pop(key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+    def get_size(self):
+        """ Return the total size of the cached items """
+        return(self.size)
+
+    def __contains__(self, key):
+        with self.lock:
+            return(key in self.items)
+
+    def __len__(self):
+        return(len(self.items))
@@ -2,33 +2,249 @@
 # Method to handle printing messages. Either print to terminal, or if in gui
 # mode, print to status message window.
 #
+# Messages are published as structured events (level, station, phase, time,
+# message) onto a bounded queue. A dispatcher thread delivers them to
+# pluggable sinks:
+#    CLIsink   - print to the terminal (installed by default)
+#    GUIsink   - batch appends into a QPlainTextEdit on a timer, keeping at
+#                most a capped number of lines
+#    JSONLsink - append one JSON object per event to a file (--eventlog)
+# Publishing never blocks the caller; if the queue fills up, events are
+# dropped and counted. A sink that fails is reported once on stderr and
+# removed, so the other sinks keep receiving events.
+#
 # Written in Python 3
 #
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
 import re
-from PyQt5.QtGui import QTextCharFormat, QBrush, QColor
+import sys
+import json
+import time
+import queue
+import atexit
+import threading
+from collections import deque
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QTextCharFormat, QTextCursor, QBrush, QColor
+from lib.metrics import runmetrics
+
+# Compile once, rather than for every message
+error = re.compile(r'ERROR', re.IGNORECASE)
+warning = re.compile(r'WARNING', re.IGNORECASE)
+
+
+class RAOBevent():
+
+    __slots__ = ('level', 'msg', 'station', 'phase', 'time', 'log')
+
+    def __init__(self, level, msg, station='', phase='', log=""):
+        self.level = level      # 'error', 'warning' or 'info'
+        self.msg = msg          # message text
+        self.station = station  # station being retrieved, if any
+        self.phase = phase      # retrieval phase, if any
+        self.time = time.time()
+        self.log = log          # GUI log window to display in, if any
+
+    def get_dict(self):
+        """ Return the event as a JSON-serializable dictionary """
+        return({'time': time.strftime('%Y-%m-%dT%H:%M:%S',
+                                      time.gmtime(self.time)) +
+                '.%03dZ' % (int(self.time * 1000) % 1000),
+                'level': self.level, 'station': self.station,
+                'phase': self.phase, 'msg': self.msg})
+
+
+class CLIsink():
+
+    def accepts(self, event):
+        """ Print messages not destined for a GUI log window """
+        return(event.log == "")
+
+    def write(self, event):
+        print(event.msg)
+
+    def flush(self):
+        pass
+
+
+class JSONLsink():
+
+    def __init__(self, path):
+        self.path = path
+        self.outfile = open(path, 'a')
+
+    def accepts(self, event):
+        return(True)
+
+    def write(self, event):
+        self.outfile.write(json.dumps(event.get_dict()) + "\n")
+
+    def flush(self):
+        self.outfile.flush()
+
+    def close(self):
+        self.outfile.close()
+
+
+class GUIsink():
+
+    def __init__(self, log, interval=100, max_blocks=5000):
+        """
+        Display messages in a QPlainTextEdit. Must be created in the GUI
+        thread.
+
+        Parameters:
+            log: the QPlainTextEdit to display messages in
+            interval: milliseconds between batched updates of the window
+            max_blocks: maximum number of lines kept in the window. Older
+                        lines are discarded.
+        """
+        self.log = log
+        self.log.setMaximumBlockCount(max_blocks)
+        self.pending = deque()  # appended by dispatcher, drained by timer
+
+        # Build the text formats once
+        self.formats = {}
+        for level, color in [('error', 'red'), ('warning', 'orange'),
+                             ('info', 'black')]:
+            self.formats[level] = QTextCharFormat()
+            self.formats[level].setForeground(QBrush(QColor(color)))
 
+        self.timer = QTimer(log)
+        self.timer.timeout.connect(self.update)
+        self.timer.start(interval)
 
-def printmsg(log, msg):
+    def accepts(self, event):
+        return(event.log is self.log)
+
+    def write(self, event):
+        self.pending.append(event)
+
+    def flush(self):
+        pass
+
+    def update(self):
+        """ Append all pending messages to the window in one edit """
+        if len(self.pending) == 0:
+            return
+
+        cursor = QTextCursor(self.log.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        while len(self.pending) > 0:
+            event = self.pending.popleft()
+            if not self.log.document().isEmpty():
+                cursor.insertBlock()
+            cursor.insertText(event.msg, self.formats[event.level])
+        cursor.endEditBlock()
+
+        scrollbar = self.log.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
+
+
+class RAOBeventbus():
+
+    def __init__(self, maxsize=10000):
+        self.queue = queue.Queue(maxsize)
+        self.sinks = []
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def add_sink(self, sink):
+        with self.lock:
+            self.sinks = self.sinks + [sink]
+        return(sink)
+
+    def remove_sink(self, sink):
+        with self.lock:
+            self.sinks = [s for s in self.sinks if s is not sink]
+
+    def publish(self, event):
+        """ Queue an event for delivery. Never blocks. """
+        if self.thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.dispatch,
+                                               daemon=True)
+                self.thread.start()
+
+    def dispatch(self):
+        """ Deliver queued events to the sinks that accept them """
+        while True:
+            event = self.queue.get()
+            self.deliver(event)
+            with self.lock:
+                dropped = self.dropped
+                self.dropped = 0
+            if dropped > 0:
+                self.deliver(RAOBevent('warning', "WARNING: " +
+                                       str(dropped) + " messages dropped",
+                                       log=event.log))
+            self.queue.task_done()
+
+    def deliver(self, event):
+        for sink in self.sinks:
+            if sink.accepts(event):
+                try:
+                    sink.write(event)
+                except Exception as e:
+                    self.fail(sink, e)
+
+    def fail(self, sink, e):
+        """ Report a sink that failed and stop delivering to it """
+        self.remove_sink(sink)
+        sys.stderr.write("WARNING: Stopped logging to " +
+                         type(sink).__name__ + " after error: " + str(e) +
+                         "\n")
+
+    def flush(self):
+        """ Wait until all queued events have been delivered """
+        if self.thread is not None:
+            self.queue.join()
+        for sink in self.sinks:
+            try:
+                sink.flush()
+            except Exception as e:
+                self.fail(sink, e)
+
+
+# The event bus shared by all modules. Print to the terminal by default, and
+# deliver everything queued before exiting.
+eventbus = RAOBeventbus()
+eventbus.add_sink(CLIsink())
+atexit.register(eventbus.flush)
+
+
+def get_level(msg):
+    """ Classify a message by its ERROR/WARNING prefix """
+    if error.match(msg):
+        return('error')
+    elif warning.match(msg):
+        return('warning')
+    return('info')
+
+
+def printmsg(log, msg, station=None, phase=None):
     """ If a QPlainTextEdit instance is passed to this method, it will
     return the msg to that instance to be displayed in the text window
     in the GUI. For this to work, all print messages in the rest of the
-    code should use printmsg instead of directly calling print() """
-    if log == "":
-        print(msg)
-    else:
-        text_format = QTextCharFormat()
-        error = re.compile(r'ERROR', re.IGNORECASE)
-        warning = re.compile(r'WARNING', re.IGNORECASE)
-        if error.match(msg):
-            text_format.setForeground(QBrush(QColor('red')))
-            log.setCurrentCharFormat(text_format)
-        elif warning.match(msg):
-            text_format.setForeground(QBrush(QColor('orange')))
-            log.setCurrentCharFormat(text_format)
-        else:
-            text_format.setForeground(QBrush(QColor('black')))
-            log.setCurrentCharFormat(text_format)
-
-        log.appendPlainText(msg)
+    code should use printmsg instead of directly calling print().
+
+    The station and phase default to the station being retrieved and the
+    phase being timed in the calling thread (see lib/metrics.py). """
+    if station is None:
+        station = runmetrics.get_station()
+    if phase is None:
+        phase = runmetrics.get_phase()
+
+    eventbus.publish(RAOBevent(get_level(msg), msg, station, phase, log))
@@ -0,0 +1,174 @@
+###############################################################################
+# Timing instrumentation for RAOBget runs. Code wraps each phase of a
+# retrieval (building the URL, the connectivity probe, the download,
+# validation, HTML parsing, station table reloads, ftp, ...) in a timing span:
+#
+#    with runmetrics.span('download'):
+#        urllib.request.urlretrieve(url, outfile)
+#
+# Spans are aggregated per phase and per station and written at the end of a
+# run to a machine-readable JSON report (--report) and, optionally, to a
+# Prometheus text file (--prometheus) for pickup by the node exporter
+# textfile collector.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+def percentile(values, pct):
+    """ Return the pct percentile of a sorted list of values (nearest rank)
+    """
+    if len(values) == 0:
+        return(0.0)
+    rank = int(round(pct / 100.0 * (len(values) - 1)))
+    return(values[rank])
+
+
+def summarize(values):
+    """ Return count, total and percentiles of a list of durations """
+    values = sorted(values)
+    return({'count': len(values),
+            'total': sum(values),
+            'mean': sum(values) / len(values) if values else 0.0,
+            'p50': percentile(values, 50),
+            'p90': percentile(values, 90),
+            'p99': percentile(values, 99),
+            'max': values[-1] if values else 0.0})
+
+
+class RAOBmetrics():
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()  # current station, per thread
+        self.reset()
+
+    def reset(self):
+        """ Clear all spans and counters at the start of a run """
+        with self.lock:
+            self.start = time.time()
+            self.phases = {}    # phase -> [durations]
+            self.stations = {}  # station -> phase -> [durations]
+            self.counters = {}  # counter name -> value
+            self.series = {}    # series name -> [(seconds into run, value)]
+
+    def set_station(self, station):
+        """ Attribute subsequent spans in this thread to station """
+        self.local.station = station
+
+    def get_station(self):
+        return(getattr(self.local, 'station', ''))
+
+    def get_phase(self):
+        """ Return the innermost phase being timed in this thread """
+        phases = getattr(self.local, 'phases', [])
+        return(phases[-1] if phases else '')
+
+    @contextmanager
+    def span(self, phase, station=None):
+        """ Time the enclosed block and record it under phase """
+        if not hasattr(self.local, 'phases'):
+            self.local.phases = []
+        self.local.phases.append(phase)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - t0, station)
+            self.local.phases.pop()
+
+    def add(self, phase, seconds, station=None):
+        """ Record a duration for phase (and station) """
+        if station is None:
+            station = self.get_station()
+        with self.lock:
+            self.phases.setdefault(phase, []).append(seconds)
+            if station != '':
+                self.stations.setdefault(station, {}).setdefault(
+                    phase, []).append(seconds)
+
+    def count(self, name, n=1):
+        """ Increment counter name by n """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def get_count(self, name):
+        with self.lock:
+            return(self.counters.get(name, 0))
+
+    def record(self, name, value):
+        """ Append a value to a time series, e.g. a gauge sampled over time """
+        with self.lock:
+            self.series.setdefault(name, []).append(
+                (round(time.time() - self.start, 3), value))
+
+    def get_report(self):
+        """ Return the aggregated run report as a dictionary """
+        with self.lock:
+            report = {
+                'start': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                       time.gmtime(self.start)),
+                'elapsed': time.time() - self.start,
+                'phases': {phase: summarize(values)
+                           for phase, values in self.phases.items()},
+                'stations': {station: {phase: summarize(values)
+                                       for phase, values in phases.items()}
+                             for station, phases in self.stations.items()},
+                'counters': dict(self.counters),
+                'series': {name: list(values)
+                           for name, values in self.series.items()},
+            }
+        return(report)
+
+    def write_report(self, path):
+        """ Write the run report to path as JSON """
+        write_atomic(path, json.dumps(self.get_report(), indent=2) + "\n")
+
+    def get_prometheus(self):
+        """ Return the run report in Prometheus text exposition format """
+        report = self.get_report()
+        lines = ["# HELP raobget_phase_seconds Time spent in each " +
+                 "retrieval phase during the last run",
+                 "# TYPE raobget_phase_seconds summary"]
+        for phase, stats in sorted(report['phases'].items()):
+            for q in ['50', '90', '99']:
+                lines.append('raobget_phase_seconds{phase="%s",' % phase +
+                             'quantile="0.%s"} %g' % (q, stats['p' + q]))
+            lines.append('raobget_phase_seconds_sum{phase="%s"} %g' %
+                         (phase, stats['total']))
+            lines.append('raobget_phase_seconds_count{phase="%s"} %d' %
+                         (phase, stats['count']))
+        for name, value in sorted(report['counters'].items()):
+            lines.append("# TYPE raobget_%s_total counter" % name)
+            lines.append("raobget_%s_total %g" % (name, value))
+        for name, values in sorted(report['series'].items()):
+            if len(values) > 0:
+                lines.append("# TYPE raobget_%s gauge" % name)
+                lines.append("raobget_%s %g" % (name, values[-1][1]))
+        lines.append("# TYPE raobget_run_seconds gauge")
+        lines.append("raobget_run_seconds %g" % report['elapsed'])
+        return("\n".join(lines) + "\n")
+
+    def write_prometheus(self, path):
+        """ Write the run report to path in Prometheus text format """
+        write_atomic(path, self.get_prometheus())
+
+
+def write_atomic(path, text):
+    """ Write text to a temp file and rename it into place, so readers (e.g.
+    the node exporter) never see a partial file. """
+    tmpfile = path + '.tmp'
+    with open(tmpfile, 'w') as f:
+        f.write(text)
+    os.replace(tmpfile, path)
+
+
+# Metrics for the current run, shared by all modules
+runmetrics = RAOBmetrics()
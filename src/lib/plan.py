@@ -0,0 +1,203 @@
+###############################################################################
+# Plan the RAOBs to retrieve. Stations in an RSL file (or on the command line)
+# may be given by number (72672) or identifier (RIW), in any case, with
+# trailing description, or more than once. Each is looked up in the master
+# station list and reduced to one canonical key - the station number if the
+# station is known - so every station is only requested once.
+#
+# With --plan, the planned RAOBs are checked against the inventory and files
+# already downloaded and the availability caches (see lib/availability.py),
+# without contacting the server, and the requests, bytes and time the
+# retrieval would take are estimated (see Plan).
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+from datetime import datetime, timedelta
+
+import lib.storage as storage
+from lib.messageHandler import printmsg
+
+LATENCY = 1.0  # Typical seconds to answer a request to the archive
+# Seconds paused after every 10 RAOBs when retrieving more than 30 one at a
+# time (see RAOBget.stn_loop)
+PAUSE = 30
+
+# What a dry run finds for each planned RAOB
+STATES = ['downloaded', 'unavailable', 'missing', 'retrieve']
+
+
+def canonical_station(stn, stationList):
+    """
+    Return the canonical key of a station reference: the station number if
+    the reference matches exactly one station number, else the reference
+    itself (e.g. an identifier shared by several stations, or a station not
+    in the master list). Returns '' for a blank reference.
+
+    Parameters:
+        stn: a station number or identifier, optionally followed by other
+             text (e.g. a line from the station list)
+        stationList: a RAOBstation_list
+    """
+    fields = stn.split()
+    if len(fields) == 0:
+        return('')
+    ref = fields[0]
+
+    if ref.isdigit():
+        if len(stationList.get_by_stnm(ref)) > 0:
+            return(ref)
+        # Leading zeros may have been dropped, e.g. 1001 for 01001
+        if len(stationList.get_by_stnm(ref.zfill(5))) > 0:
+            return(ref.zfill(5))
+        return(ref)
+
+    stations = stationList.get_by_id(ref.upper())
+    numbers = set(s['number'] for s in stations if s['number'].strip())
+    if len(numbers) == 1:
+        return(numbers.pop())
+    return(ref.upper())
+
+
+def plan_stations(stnlist, stationList, log=""):
+    """
+    Reduce a list of station references to a list of unique canonical
+    stations, in the order first requested. Blank entries are dropped.
+    """
+    stations = []
+    seen = {}  # canonical key -> first reference to it
+    for stn in stnlist:
+        key = canonical_station(stn, stationList)
+        if key == '':
+            continue
+        if key in seen:
+            if stn.strip() == seen[key].strip():
+                printmsg(log, "WARNING: Station " + stn.strip() + " is " +
+                         "listed more than once. Requesting it once.")
+            else:
+                printmsg(log, "WARNING: Station " + stn.strip() + " is the " +
+                         "same as " + seen[key].strip() + ". Requesting it " +
+                         "once.")
+            continue
+        seen[key] = stn
+        stations.append(key)
+    return(stations)
+
+
+def list_files(path='.'):
+    """ Return the names of the files in a directory as a set, with any
+    compression suffix removed (see lib/storage.py) """
+    files = set()
+    for name in os.listdir(path):
+        method = storage.get_method(name)
+        if method != '':
+            name = name[:-len(storage.SUFFIX[method])]
+        files.add(name)
+    return(files)
+
+
+class Plan():
+
+    def __init__(self, retriever, availability=None, missing=None,
+                 path='.', inventory=None):
+        """
+        A dry run of a retrieval: what would be retrieved, and what is
+        already downloaded or would be skipped.
+
+        Parameters:
+            retriever: the class that retrieves the requested RAOB type
+            availability, missing: the Availability and MissingCache to
+                                   check, or None not to
+            path: directory the RAOBs are downloaded to
+            inventory: the Inventory of RAOBs retrieved, or None
+        """
+        self.retriever = retriever
+        self.availability = availability
+        self.missing = missing
+        self.path = path
+        self.files = list_files(path)  # Listed once, not checked per RAOB
+        self.retrieved = set()         # (stn, yyyymmddhh) in the inventory
+        if inventory is not None:
+            self.retrieved = inventory.get_keys(retriever.name, path)
+        self.likely = {}               # (stn, hour) -> availability
+        self.stations = {}             # stn -> state -> count
+
+    def add(self, stn, year, month, day, hour):
+        """ Check a planned RAOB and count it. Returns its state. """
+        state = self.check(stn, year, month, day, hour)
+        counts = self.stations.get(stn)
+        if counts is None:
+            counts = self.stations[stn] = dict.fromkeys(STATES, 0)
+        counts[state] += 1
+        return(state)
+
+    def check(self, stn, year, month, day, hour):
+        """ Return what retrieving a RAOB would do (one of STATES), in the
+        order RAOBget.retrieve checks """
+        ddhh = day + hour
+        if (stn, year + month + ddhh) in self.retrieved or \
+                stn + year + month + ddhh + ddhh + self.retriever.suffix in \
+                self.files:
+            return('downloaded')
+        if self.availability is not None:
+            likely = self.likely.get((stn, hour))
+            if likely is None:
+                likely = self.availability.likely(stn, hour)
+                self.likely[(stn, hour)] = likely
+            if not likely:
+                return('unavailable')
+        if self.missing is not None:
+            valid = datetime(int(year), int(month), int(day), int(hour))
+            if self.missing.is_missing(stn, self.retriever.name, valid):
+                return('missing')
+        return('retrieve')
+
+    def get_count(self, state):
+        """ Return the number of RAOBs planned in a state """
+        return(sum([counts[state] for counts in self.stations.values()]))
+
+    def get_seconds(self, rate=None, concurrency=None):
+        """
+        Estimate how long the retrieval would take.
+
+        Parameters:
+            rate: requests/sec across queue workers, if using a queue
+            concurrency: max RAOBs retrieved at once, if more than one
+        """
+        count = self.get_count('retrieve')
+        if rate is not None:
+            return(count * self.retriever.requests / rate if rate > 0 else
+                   count * self.retriever.requests * LATENCY)
+        seconds = count * self.retriever.requests * LATENCY
+        if concurrency is not None:
+            return(seconds / concurrency)
+        if sum([sum(c.values()) for c in self.stations.values()]) > 30:
+            seconds += (count // 10) * PAUSE
+        return(seconds)
+
+    def get_summary(self, rate=None, concurrency=None):
+        """ Return a summary of the plan, and a breakdown by station, as a
+        list of lines """
+        total = sum([self.get_count(state) for state in STATES])
+        count = self.get_count('retrieve')
+        lines = [
+            "Plan: " + str(total) + " " + self.retriever.name + " RAOBs " +
+            "from " + str(len(self.stations)) + " stations",
+            "  Already downloaded: " + str(self.get_count('downloaded')),
+            "  Skipped, station rarely launches then: " +
+            str(self.get_count('unavailable')),
+            "  Skipped, archive reported missing: " +
+            str(self.get_count('missing')),
+            "  To retrieve: " + str(count) + " (" +
+            str(count * self.retriever.requests) + " requests, about " +
+            '{:.1f}'.format(count * self.retriever.size / 1e6) + " MB)",
+            "  Estimated time: " +
+            str(timedelta(seconds=int(self.get_seconds(rate, concurrency)))),
+            "By station (retrieve/downloaded/unavailable/missing):"]
+        for stn, counts in self.stations.items():
+            lines.append("  " + stn + ": " + "/".join(
+                [str(counts[state]) for state in
+                 ['retrieve', 'downloaded', 'unavailable', 'missing']]))
+        return(lines)
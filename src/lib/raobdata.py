@@ -6,9 +6,15 @@
 #
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
+import os
+import copy
 from datetime import datetime
 from lib.raobroot import getrootdir
-from lib.stationlist import RAOBstation_list
+from lib.stationlist import get_station_list
+from lib.inventory import INVENTORY
+
+# Base URL of the University of Wyoming Radiosonde Archive
+UWYO = "http://weather.uwyo.edu"
 
 
 class RAOBdata():
@@ -41,17 +47,52 @@ class RAOBdata():
             'ftp_server': "",  # If ftp is True, need ftp_server and ftp_dir
             'ftp_dir': "",
             'cp_dir': "",    # If ftp is False, need dir to cp files to
+            'catalog_names': "",  # Catalog product names that differ from
+                             # those built from the station list, e.g.
+                             # "72672=Riverton_WY". See userlib/catalog.py
             'station_list_file': "",  # List of RAOB station locations,
                              # description, etc. Used to assign metadata to
                              # retrieved RAOB. Give path relative to RAOBget
                              # dir.
+            'server': UWYO,  # Base URL of the sounding archive. Change to
+                             # point at a local stand-in server for testing.
+            'report': "",    # JSON file to write run timing report to
+            'prometheus': "",  # File to write run metrics to in Prometheus
+                             # text format, e.g. for the node exporter
+            'eventlog': "",  # JSONL file to append structured log events to
+            'queue': "",     # Shared queue dir to enqueue to or work from
+            'enqueue': False,  # Write the planned RAOBs to the queue and exit
+            'rate': "",      # Max requests/sec to server across queue workers
+            'compress': "",  # Compress retrieved TEXT:LIST files (gzip/zstd)
+            'cachedir': "",  # Dir to keep RAOB availability history in.
+                             # Defaults to ~/.raobget
+            'launch_hours': "",  # Launch schedules, e.g. "00,12" or
+                             # "72672=00,12 72476=00,06,12,18"
+            'refresh': False,  # Request RAOBs already downloaded again, if
+                             # they have changed
+            'priority': "",  # Retrieve RAOBs in order of priority: any of
+                             # recent, weight, near. See lib/scheduler.py
+            'station_weights': "",  # Station weights for priority weight,
+                             # e.g. "72672=4 72476=0.5"
+            'near': "",      # lat,lon for priority near
+            'deadline': "",  # Stop at this time (seconds from start, or UTC
+                             # HH:MM) and defer the rest to the next run
+            'concurrency': "",  # Max RAOBs to retrieve at once, or min:max.
+                             # See lib/concurrency.py
+            'plan': False,   # Report what would be retrieved, and estimate
+                             # requests, bytes and time, without retrieving
+            'inventory': "",  # SQLite inventory of RAOBs retrieved.
+                             # Defaults to <cachedir>/inventory.db
+            'timeout': "",   # Network timeouts, CONNECT[,READ] seconds.
+                             # See lib/timeouts.py
         }
 
         self.request = RAOBrequest  # dictionary to hold all URL components
 
-        # Load a station list so we can validate stnm requests
-        self.stationList = RAOBstation_list()
-        self.stationList.read(getrootdir() + "/config/snstns.tbl")
+        # Load a station list so we can validate stnm requests. The list is
+        # shared, so it is only read once.
+        self.stationList = get_station_list(getrootdir() +
+                                            "/config/snstns.tbl")
 
     def set_key(self, key, value):
         self.request[key] = value
@@ -166,6 +207,148 @@ class RAOBdata():
     def get_stnlist_file(self):
         return(self.request['station_list_file'])
 
+    def set_server(self, server):
+        self.request['server'] = server
+
+    def get_server(self):
+        """ Return the base URL of the archive. If the request has been
+        cleared (e.g. before loading a new config), use the UWyo archive. """
+        if self.request['server'] == "":
+            return(UWYO)
+        return(self.request['server'].rstrip('/'))
+
+    def set_report(self, report):
+        self.request['report'] = report
+
+    def get_report(self):
+        return(self.request['report'])
+
+    def set_prometheus(self, prometheus):
+        self.request['prometheus'] = prometheus
+
+    def get_prometheus(self):
+        return(self.request['prometheus'])
+
+    def set_eventlog(self, eventlog):
+        self.request['eventlog'] = eventlog
+
+    def get_eventlog(self):
+        return(self.request['eventlog'])
+
+    def set_queue(self, queue):
+        self.request['queue'] = queue
+
+    def get_queue(self):
+        return(self.request['queue'])
+
+    def set_enqueue(self, enqueue):
+        self.request['enqueue'] = enqueue
+
+    def get_enqueue(self):
+        return(self.request['enqueue'])
+
+    def set_rate(self, rate):
+        self.request['rate'] = rate
+
+    def get_rate(self):
+        """ Return the rate limit as a float, or None to use the default.
+        Raises ValueError if it isn't a number of at least 0. """
+        if self.request['rate'] == "":
+            return(None)
+        try:
+            rate = float(self.request['rate'])
+        except ValueError:
+            rate = -1
+        if rate < 0:
+            raise ValueError("Rate must be requests per second, or 0 for " +
+                             "no limit. Got '" + str(self.request['rate']) +
+                             "'")
+        return(rate)
+
+    def set_compress(self, compress):
+        self.request['compress'] = compress
+
+    def get_compress(self):
+        return(self.request['compress'])
+
+    def set_cachedir(self, cachedir):
+        self.request['cachedir'] = cachedir
+
+    def get_cachedir(self):
+        """ Return the cache dir, defaulting to ~/.raobget """
+        if self.request['cachedir'] == "":
+            return(os.path.expanduser(os.path.join('~', '.raobget')))
+        return(os.path.expanduser(self.request['cachedir']))
+
+    def set_launch_hours(self, launch_hours):
+        self.request['launch_hours'] = launch_hours
+
+    def get_launch_hours(self):
+        return(self.request['launch_hours'])
+
+    def set_refresh(self, refresh):
+        self.request['refresh'] = refresh
+
+    def get_refresh(self):
+        return(self.request['refresh'])
+
+    def set_priority(self, priority):
+        self.request['priority'] = priority
+
+    def get_priority(self):
+        return(self.request['priority'])
+
+    def set_station_weights(self, station_weights):
+        self.request['station_weights'] = station_weights
+
+    def get_station_weights(self):
+        return(self.request['station_weights'])
+
+    def set_near(self, near):
+        self.request['near'] = near
+
+    def get_near(self):
+        return(self.request['near'])
+
+    def set_deadline(self, deadline):
+        self.request['deadline'] = deadline
+
+    def get_deadline(self):
+        return(self.request['deadline'])
+
+    def set_concurrency(self, concurrency):
+        self.request['concurrency'] = concurrency
+
+    def get_concurrency(self):
+        return(self.request['concurrency'])
+
+    def set_plan(self, plan):
+        self.request['plan'] = plan
+
+    def get_plan(self):
+        return(self.request['plan'])
+
+    def set_inventory(self, inventory):
+        self.request['inventory'] = inventory
+
+    def get_inventory(self):
+        """ Return the inventory file, defaulting to one in the cache dir """
+        if self.request['inventory'] == "":
+            return(os.path.join(self.get_cachedir(), INVENTORY))
+        return(os.path.expanduser(self.request['inventory']))
+
+    def set_catalog_names(self, catalog_names):
+        self.request['catalog_names'] = catalog_names
+
+    def get_catalog_names(self):
+        return(self.request['catalog_names'])
+
+    def set_timeout(self, timeout):
+        self.request['timeout'] = timeout
+
+    def get_timeout(self):
+        return(self.request['timeout'])
+
     def set_prov(self, args):  # Set provenance of RAOB to retrieve
         """
         Set request from all the metadata specificed on the command line.
@@ -192,6 +375,25 @@ class RAOBdata():
         self.set_config(args.config)
         self.set_stnlist_file(args.station_list_file)
         self.set_now(args.now)
+        self.set_server(args.server)
+        self.set_report(args.report)
+        self.set_prometheus(args.prometheus)
+        self.set_eventlog(args.eventlog)
+        self.set_queue(args.queue)
+        self.set_enqueue(args.enqueue)
+        self.set_rate(args.rate)
+        self.set_compress(args.compress)
+        self.set_cachedir(args.cachedir)
+        self.set_launch_hours(args.launch_hours)
+        self.set_refresh(args.refresh)
+        self.set_priority(args.priority)
+        self.set_station_weights(args.station_weights)
+        self.set_near(args.near)
+        self.set_deadline(args.deadline)
+        self.set_concurrency(args.concurrency)
+        self.set_plan(args.plan)
+        self.set_inventory(args.inventory)
+        self.set_timeout(args.timeout)
 
         return(True)
 
@@ -204,6 +406,13 @@ class RAOBdata():
         """ Return request dictionary contents """
         return(dict(self.request))
 
+    def copy(self):
+        """ Return a copy of the request, e.g. for another thread to change.
+        The station list is shared. """
+        request = copy.copy(self)
+        request.request = dict(self.request)
+        return(request)
+
     def set_time_now(self):
         """ Set request time to most recent 12 hour (UTC) RAOB unless freq is
         set higher. """
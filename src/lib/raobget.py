@@ -11,13 +11,35 @@
 import os
 import time
 import argparse
+import threading
+from datetime import datetime
 
-from raobtype.textlist import RAOBtextlist
-from raobtype.gifskewt import RAOBgifskewt
-from lib.raobdata import RAOBdata
+import raobtype.types  # noqa: F401 - registers the built-in RAOB types
+from raobtype.raobtype import get_retriever, get_types
+from lib.raobdata import RAOBdata, UWYO
 from lib.rsl import RSL
-from lib.messageHandler import printmsg
+from lib.plan import plan_stations, canonical_station, Plan
+from lib.availability import Availability, MissingCache
+from lib.inventory import Inventory
+import lib.storage as storage
+from lib.messageHandler import printmsg, eventbus, JSONLsink
 from lib.config import config
+from lib.metrics import runmetrics
+from lib.workqueue import WorkQueue, Heartbeat, RATE, POLL
+from lib.scheduler import Scheduler, Journal, PRIORITIES, JOURNAL
+from lib.scheduler import parse_priority, parse_weights, parse_point
+from lib.scheduler import parse_deadline, get_key
+from lib.concurrency import AIMDLimiter, parse_concurrency
+from lib.timeouts import timeouts, parse_timeout, CONNECT, READ
+from lib.rwget import pacing
+
+# Times to try a RAOB when retrieving several at once, if the server can't be
+# reached
+RETRIES = 3
+
+# Outcomes of a RAOB that didn't need retrieving. A queue task with one of
+# these is done, even though nothing was downloaded.
+SKIPPED = ['exists', 'coalesced', 'unchanged', 'skipped']
 
 
 class RAOBget():
@@ -29,6 +51,29 @@ class RAOBget():
 
         self.request = RAOBdata()  # dictionary to hold all URL components
 
+        # Hooks used when running in a background thread (see
+        # gui/raobworker.py): progress(done, total, stn) is called after each
+        # RAOB and display(raobtype, outfile) for each retrieved RAOB. Setting
+        # cancel_event stops the retrieval.
+        self.progress = None
+        self.display = None
+        self.cancel_event = threading.Event()
+        self.done = 0
+        self.total = 0
+
+        # History of which RAOBs exist, and which are known missing (see
+        # lib/availability.py). Set up at the start of each run.
+        self.availability = None
+        self.missing = None
+
+        # Inventory of the RAOBs retrieved (see lib/inventory.py), used to
+        # check whether a RAOB has already been downloaded
+        self.inventory = None
+
+        # Outcome of the last RAOB retrieved (see lib/rwget.py), or None if
+        # it wasn't requested
+        self.outcome = None
+
     def parse(self):
         """ Define command line arguments which can be provided"""
         parser = argparse.ArgumentParser(
@@ -49,7 +94,7 @@ class RAOBget():
                             ' not match station location. [''] ')
         parser.add_argument('--raobtype', type=str, default='',
                             help='Data/image type to request - ' +
-                            'TEXT:LIST or GIF:SKEWT. [TEXT:LIST]')
+                            ', '.join(get_types()) + '. [TEXT:LIST]')
         parser.add_argument('--year', type=str, default='',
                             help='Year to request data [2019]')
         parser.add_argument('--month', type=str, default='',
@@ -104,6 +149,95 @@ class RAOBget():
                             'containing station lat/lon, etc. ' +
                             '[config/snstns.tbl] (snstns.tbl was received' +
                             'from U Wyoming June 2019.')
+        parser.add_argument('--server', type=str, default=UWYO,
+                            help='Base URL of the sounding archive. Point ' +
+                            'at a local stand-in server (see ' +
+                            'test/uwyoserver.py) for offline testing and ' +
+                            'benchmarking [' + UWYO + ']')
+        parser.add_argument('--report', type=str, default='',
+                            help='Write a JSON report of time spent in each ' +
+                            'retrieval phase, per phase and per station, ' +
+                            'to this file at the end of the run ['']')
+        parser.add_argument('--prometheus', type=str, default='',
+                            help='Also write run metrics to this file in ' +
+                            'Prometheus text format, e.g. for the node ' +
+                            'exporter textfile collector ['']')
+        parser.add_argument('--eventlog', type=str, default='',
+                            help='Append every log message to this file as ' +
+                            'a JSON object per line, with level, station, ' +
+                            'phase and time ['']')
+        parser.add_argument('--queue', type=str, default='',
+                            help='Shared queue directory, e.g. on NFS. With ' +
+                            '--enqueue, write the requested RAOBs to the ' +
+                            'queue. Without, retrieve RAOBs from the queue ' +
+                            'until it is empty. Run any number of workers ' +
+                            'on any number of machines [\'\']')
+        parser.add_argument('--enqueue', action="store_true",
+                            help='Write the requested RAOBs to the --queue ' +
+                            'directory and exit [False]')
+        parser.add_argument('--rate', type=str, default='',
+                            help='Maximum requests per second to the server ' +
+                            'across all --queue workers [' + str(RATE) + ']')
+        parser.add_argument('--compress', type=str, default='',
+                            choices=['', 'gzip', 'zstd'],
+                            help='Store retrieved TEXT:LIST files ' +
+                            'compressed, as <file>.txt.gz or <file>.txt.zst.' +
+                            ' zstd requires the zstandard package [\'\']')
+        parser.add_argument('--cachedir', type=str, default='',
+                            help='Directory to keep a history of which ' +
+                            'RAOBs were found in, used to skip requests for ' +
+                            'RAOBs that almost certainly don\'t exist ' +
+                            '[~/.raobget]')
+        parser.add_argument('--launch_hours', type=str, default='',
+                            help='Hours (UTC) stations launch at. Requests ' +
+                            'for other hours are skipped. Either "00,12" ' +
+                            'for all stations or per station, e.g. ' +
+                            '"72672=00,12 72476=00,06,12,18" [\'\']')
+        parser.add_argument('--refresh', action="store_true",
+                            help='Request RAOBs that have already been ' +
+                            'downloaded again, and replace them if they ' +
+                            'have changed, e.g. as a recent RAOB fills in ' +
+                            '[False]')
+        parser.add_argument('--priority', type=str, default='',
+                            help='Retrieve RAOBs highest priority first, ' +
+                            'by any of ' + ', '.join(PRIORITIES) + ', e.g. ' +
+                            '"recent,near". Station weights are set with ' +
+                            'station_weights: in the config file. Default ' +
+                            'is RSL order, then time order [\'\']')
+        parser.add_argument('--station_weights', type=str, default='',
+                            help='Station weights for --priority weight, ' +
+                            'e.g. "72672=4 72476=0.5" [\'\']')
+        parser.add_argument('--near', type=str, default='',
+                            help='Point (lat,lon) for --priority near, e.g. ' +
+                            '"40.0,-105.2" [\'\']')
+        parser.add_argument('--deadline', type=str, default='',
+                            help='Stop retrieving at this time, given as ' +
+                            'seconds from start or UTC HH:MM, and leave the ' +
+                            'rest to the next run in this directory ' +
+                            '(kept in ' + JOURNAL + ') [\'\']')
+        parser.add_argument('--concurrency', type=str, default='',
+                            help='Retrieve up to this many RAOBs at once, ' +
+                            'e.g. "8", or "2:8" to keep at least 2 going. ' +
+                            'The number adapts to how quickly the server ' +
+                            'answers and backs off on errors. Default is ' +
+                            'one at a time [\'\']')
+        parser.add_argument('--plan', action="store_true",
+                            help='Don\'t retrieve anything. Report how ' +
+                            'many of the requested RAOBs are already ' +
+                            'downloaded or would be skipped, and estimate ' +
+                            'the requests, bytes and time needed to ' +
+                            'retrieve the rest, by station [False]')
+        parser.add_argument('--inventory', type=str, default='',
+                            help='SQLite inventory of the RAOBs retrieved, ' +
+                            'used to check whether a RAOB has already been ' +
+                            'downloaded. Query it with python3 -m ' +
+                            'lib.inventory [<cachedir>/inventory.db]')
+        parser.add_argument('--timeout', type=str, default='',
+                            help='Seconds to wait to connect to a server, ' +
+                            'and for each read of its answer, as ' +
+                            'CONNECT[,READ]. Cut to the time left before ' +
+                            'any --deadline [' + '%g,%g' % (CONNECT, READ) +
+                            ']')
         args = parser.parse_args()
 
         return(args)
@@ -148,7 +282,7 @@ class RAOBget():
         empty = True
         request = self.request.get_request()
         for key in request.keys():
-            if key != 'station_list_file' and key != 'mtpdir':
+            if key not in ['station_list_file', 'mtpdir', 'server']:
                 if str(request[key]).lower() == 'true':
                     empty = False
                 elif str(request[key]).lower() != 'false' and \
@@ -160,6 +294,37 @@ class RAOBget():
                           " load a config file and rerun.")
             return()
 
+        if not storage.available(self.request.get_compress()):
+            printmsg(log, "ERROR: Compression method '" +
+                     self.request.get_compress() + "' is not available. " +
+                     "zstd requires the zstandard package.")
+            return()
+
+        try:
+            connect, read = parse_timeout(self.request.get_timeout())
+            self.request.get_rate()  # Check it before using it
+        except ValueError as e:
+            printmsg(log, "ERROR: " + str(e))
+            return()
+        timeouts.set(connect, read)
+
+        # Start timing this run
+        runmetrics.reset()
+
+        self.availability = Availability(self.request.get_cachedir(),
+                                         self.request.get_launch_hours(),
+                                         log)
+        self.missing = MissingCache(self.request.get_cachedir(), log)
+        self.inventory = None
+        if self.request.get_test() is not True:
+            self.inventory = Inventory(self.request.get_inventory(), log)
+
+        # If requested, also log structured events to a file
+        self.eventlog = None
+        if self.request.get_eventlog() != '':
+            self.eventlog = eventbus.add_sink(
+                JSONLsink(self.request.get_eventlog()))
+
         # If option --now is set, set year, month, begin, and end to current
         # date/time
         if self.request.get_now() is True:
@@ -171,50 +336,461 @@ class RAOBget():
                  self.request.get_month() + self.request.get_begin() +
                  "' to '" + self.request.get_year() +
                  self.request.get_month() + self.request.get_end() + "'")
-        if self.request.get_begin() == self.request.get_end():
-            # printmsg(log, "Single Day:" + self.request.get_begin() +
-            #          ' - ' + self.request.get_end())
+        times = self.get_times()
+
+        # Count the RAOBs to retrieve so progress can be reported
+        self.done = 0
+        stnlist = self.get_stnlist()
+        self.stnlist = stnlist
+        self.total = len(times) * (len(stnlist) if stnlist else 1)
+
+        if self.request.get_plan() is True:
+            # Dry run. Don't contact the server.
+            self.plan(times, stnlist)
+            times = []
+        elif self.request.get_queue() != '':
+            # Share the retrieval with other processes via a queue directory
+            if self.request.get_enqueue() is True:
+                self.enqueue(times, stnlist)
+            else:
+                self.work_queue(app)
+            times = []
+        elif self.request.get_priority() != '' or \
+                self.request.get_deadline() != '' or \
+                self.request.get_concurrency() != '' or Journal().exists():
+            # Retrieve highest priority first, until the deadline, several
+            # at once if requested
+            self.run_schedule(app, times, stnlist)
+            times = []
+
+        for (day, hr) in times:
+            if self.cancelled():
+                printmsg(log, "WARNING: Retrieval cancelled")
+                break
+            # get RAOBs
+            self.request.set_begin(day, hr)
+            self.request.set_end(day, hr)
             self.stn_loop(app)
+
+        self.availability.save()
+        self.missing.save()
+        if self.inventory is not None:
+            self.inventory.close()
+            self.inventory = None
+        skipped = runmetrics.get_count('skipped_unavailable')
+        if skipped > 0:
+            printmsg(log, "Skipped " + str(skipped) + " requests for RAOBs " +
+                     "that almost certainly don't exist")
+        skipped = runmetrics.get_count('skipped_known_missing')
+        if skipped > 0:
+            printmsg(log, "Skipped " + str(skipped) + " requests for RAOBs " +
+                     "already found to be missing")
+
+        self.write_report()
+
+        if self.eventlog is not None:
+            eventbus.flush()
+            eventbus.remove_sink(self.eventlog)
+            self.eventlog.close()
+
+    def get_times(self):
+        """
+        Expand the requested begin and end times into the list of (day, hour)
+        times to retrieve RAOBs for, at the requested frequency.
+
+        Returns:
+            times: list of ('dd', 'hh') tuples, in time order
+        """
+        begin = self.request.get_begin()
+        end = self.request.get_end()
+        if begin == end:
+            return([(begin[0:2], begin[2:4])])
+
+        if end < begin:
+            printmsg(self.log, "ERROR: Requested end time must be >= " +
+                     "requested begin time")
+            return([])
+
+        freq = int(self.request.get_freq())
+        bday = begin[0:2]
+        bhr = begin[2:4]
+        eday = end[0:2]
+        ehr = end[2:4]
+
+        # Get RAOBs for first day requested
+        times = [(bday, '{:02d}'.format(hr))
+                 for hr in range(int(bhr), 24, freq)]
+        # Get RAOBs for second to second-to-last day
+        for day in range(int(bday) + 1, int(eday)):
+            times += [('{:02d}'.format(day), '{:02d}'.format(hr))
+                      for hr in range(0, 24, freq)]
+        # Get RAOBs for last day requested
+        times += [(eday, '{:02d}'.format(hr))
+                  for hr in range(0, int(ehr)+1, freq)]
+
+        return(times)
+
+    def get_stnlist(self):
+        """
+        Return the list of stations requested, either the single station
+        requested via --stnm or the stations in the RSL file, as canonical
+        station numbers without duplicates (see lib/plan.py). Returns None
+        if the RSL file does not exist.
+        """
+        if (self.request.get_rsl() == ''):
+            stnlist = [self.request.get_stnm()]
         else:
-            if self.request.get_end() < self.request.get_begin():
-                printmsg(log, "ERROR: Requested end time must be >= " +
-                         "requested begin time")
+            rslfile = os.path.join(os.getcwd(), self.request.get_rsl())
+            if not self.test_rsl(rslfile):
+                return(None)
+            rsl = RSL()
+            stnlist = rsl.read_rsl(rslfile)
+
+        # Request each station once, however it was listed
+        return(plan_stations(stnlist, self.request.stationList, self.log))
+
+    def plan_tasks(self, times, stnlist):
+        """ Return the requested RAOBs as a list of tasks, each a dictionary
+        of the request metadata needed to retrieve one RAOB """
+        return([{'stnm': stn, 'raobtype': self.request.get_type(),
+                 'region': self.request.get_region(),
+                 'year': self.request.get_year(),
+                 'month': self.request.get_month(), 'day': day, 'hour': hr}
+                for (day, hr) in times for stn in stnlist])
+
+    def set_task(self, task):
+        """ Set the request to retrieve the RAOB of a task """
+        self.request.set_type(task['raobtype'])
+        self.request.set_region(task['region'])
+        self.request.set_year(task['year'])
+        self.request.set_month(task['month'])
+        self.request.set_begin(task['day'], task['hour'])
+        self.request.set_end(task['day'], task['hour'])
+        self.request.set_stnm(task['stnm'])
+
+    def plan(self, times, stnlist):
+        """ Report what retrieving the requested RAOBs would do, and
+        estimate the requests, bytes and time it would take, without
+        retrieving anything (see lib/plan.py) """
+        if stnlist is None:
+            printmsg(self.log, 'ERROR: File ' + self.request.get_rsl() +
+                     ' does not exist. Check for typo and rerun.')
+            return()
+        retriever = get_retriever(self.request.get_type())
+        if retriever is None:
+            printmsg(self.log, "RAOB type '" + self.request.get_type() +
+                     "' not implemented yet")
+            return()
+        try:
+            concurrency = None
+            if self.request.get_concurrency() != '':
+                concurrency = parse_concurrency(
+                    self.request.get_concurrency())[1]
+        except ValueError as e:
+            printmsg(self.log, "ERROR: " + str(e))
+            return()
+        rate = None
+        if self.request.get_queue() != '':
+            rate = self.request.get_rate()
+            rate = RATE if rate is None else rate
+
+        if self.request.get_test() is True:
+            plan = Plan(retriever)  # Retrieval doesn't skip in test mode
+        else:
+            plan = Plan(retriever, self.availability, self.missing,
+                        inventory=self.inventory)
+        year = self.request.get_year()
+        month = self.request.get_month()
+        for (day, hr) in times:
+            for stn in stnlist:
+                plan.add(stn, year, month, day, hr)
+
+        # Add any RAOBs left by an earlier run that are not already planned
+        planned = (set(times), set(stnlist))
+        for task in Journal(log=self.log).load():
+            if task['raobtype'] == self.request.get_type() and \
+                    task['year'] == year and task['month'] == month and \
+                    (task['day'], task['hour']) in planned[0] and \
+                    task['stnm'] in planned[1]:
+                continue
+            plan.add(task['stnm'], task['year'], task['month'], task['day'],
+                     task['hour'])
+
+        for line in plan.get_summary(rate, concurrency):
+            printmsg(self.log, line)
+
+    def get_queue(self):
+        rate = self.request.get_rate()
+        return(WorkQueue(self.request.get_queue(), self.log,
+                         rate=RATE if rate is None else rate))
+
+    def enqueue(self, times, stnlist):
+        """ Write the requested RAOBs to the queue, for workers to retrieve """
+        if stnlist is None:
+            printmsg(self.log, 'ERROR: File ' + self.request.get_rsl() +
+                     ' does not exist. Check for typo and rerun.')
+            return()
+        tasks = self.plan_tasks(times, stnlist)
+        queue = self.get_queue()
+        added = queue.enqueue(tasks)
+        printmsg(self.log, "Added " + str(added) + " of " + str(len(tasks)) +
+                 " requested RAOBs to queue " + self.request.get_queue())
+
+    def work_queue(self, app):
+        """
+        Retrieve RAOBs from the queue until there are none left to do,
+        including those abandoned by workers that have died.
+        """
+        queue = self.get_queue()
+        printmsg(self.log, "Working on queue " + self.request.get_queue() +
+                 " as worker " + queue.worker)
+        self.total = 0
+        # Take a turn from the shared rate for every request to the server
+        pacing.wait_turn = lambda: queue.wait_turn(self.cancel_event)
+        try:
+            self.work_tasks(app, queue)
+        finally:
+            pacing.wait_turn = None
+
+        counts = queue.get_counts()
+        printmsg(self.log, "Queue " + self.request.get_queue() + ": " +
+                 ", ".join([str(counts[state]) + " " + state
+                            for state in counts]))
+
+    def work_tasks(self, app, queue):
+        """ Claim and retrieve tasks from the queue until none are left """
+        while not self.cancelled():
+            name, task = queue.claim()
+            if name is None:
+                queue.requeue_stale()
+                name, task = queue.claim()
+            if name is None:
+                if queue.get_counts()['claimed'] == 0:
+                    break
+                # Other workers are busy. Wait in case they die.
+                self.cancel_event.wait(POLL)
+                continue
+
+            self.set_task(task)
+            with Heartbeat(queue, name):
+                status = self.retrieve(app)
+            if status is None or self.cancelled():
+                # User asked to try again, or cancelled
+                queue.complete(name, 'todo')
+                continue
+            if status or self.outcome in SKIPPED:
+                queue.complete(name, 'done')
             else:
-                # Get RAOBs for first day requested
-                begin = self.request.get_begin()
-                bday = begin[0:2]
-                bhr = begin[2:4]
-                end = self.request.get_end()
-                eday = end[0:2]
-                ehr = end[2:4]
-                for hr in range(int(bhr), 24,
-                                int(self.request.get_freq())):
-                    # get RAOBs
-                    self.request.set_begin(bday, '{:02d}'.format(hr))
-                    self.request.set_end(bday, '{:02d}'.format(hr))
-                    # printmsg(log, "Day 1:" + self.request.get_begin() +
-                    #          ' - ' + self.request.get_end())
-                    self.stn_loop(app)
-                # Get RAOBs for second to second-to-last day
-                for day in range(int(bday) + 1, int(eday)):
-                    for hr in range(0, 24, int(self.request.get_freq())):
-                        # get RAOBs
-                        self.request.set_begin('{:02d}'.format(day),
-                                               '{:02d}'.format(hr))
-                        self.request.set_end('{:02d}'.format(day),
-                                             '{:02d}'.format(hr))
-                        # printmsg(log, self.request.get_begin() + ' - ' +
-                        #          self.request.get_end())
-                        self.stn_loop(app)
-                # Get RAOBs for last day requested
-                for hr in range(0, int(ehr)+1,
-                                int(self.request.get_freq())):
-                    # get RAOBs
-                    self.request.set_begin(eday, '{:02d}'.format(hr))
-                    self.request.set_end(eday, '{:02d}'.format(hr))
-                    # printmsg(log, "Last:" + self.request.get_begin() +
-                    #          ' - ' + self.request.get_end())
-                    self.stn_loop(app)
+                queue.complete(name, 'failed')
+            self.total += 1
+            self.tick(task['stnm'])
+
+    def get_scheduler(self):
+        """ Build the scheduler for the requested priorities. Raises
+        ValueError if they can't be parsed. """
+        priorities = parse_priority(self.request.get_priority())
+        weights = {}
+        for stn, weight in parse_weights(
+                self.request.get_station_weights()).items():
+            weights[canonical_station(stn, self.request.stationList)] = \
+                weight
+        point = None
+        if self.request.get_near() != '':
+            point = parse_point(self.request.get_near())
+        elif 'near' in priorities:
+            raise ValueError("--priority near needs a point, e.g. " +
+                             "--near 40.0,-105.2")
+        return(Scheduler(priorities, weights, point,
+                         self.request.stationList))
+
+    def run_schedule(self, app, times, stnlist):
+        """
+        Retrieve the requested RAOBs, and any deferred by an earlier run,
+        highest priority first (see lib/scheduler.py). If there is a deadline
+        and it is reached, leave the rest for the next run.
+        """
+        if stnlist is None:
+            printmsg(self.log, 'ERROR: File ' + self.request.get_rsl() +
+                     ' does not exist. Check for typo and rerun.')
+            return()
+        if not self.ready(app):
+            return()
+        try:
+            scheduler = self.get_scheduler()
+            deadline = None
+            if self.request.get_deadline() != '':
+                deadline = parse_deadline(self.request.get_deadline())
+            bounds = None
+            if self.request.get_concurrency() != '':
+                bounds = parse_concurrency(self.request.get_concurrency())
+        except ValueError as e:
+            printmsg(self.log, "ERROR: " + str(e))
+            return()
+        # Work in flight at the deadline times out by then
+        timeouts.set_deadline(deadline)
+
+        journal = Journal(log=self.log)
+        deferred = journal.load()
+        for task in self.plan_tasks(times, stnlist):
+            scheduler.push(task)
+        added = sum([scheduler.push(task) for task in deferred])
+        if added > 0:
+            printmsg(self.log, "Also retrieving " + str(added) + " RAOBs " +
+                     "left by an earlier run")
+        self.total = len(scheduler)
+
+        if bounds is not None and app is not None and self.display is None:
+            # The GUI can only be updated from the main thread
+            printmsg(self.log, "WARNING: --concurrency is ignored when " +
+                     "retrieving in the GUI thread")
+            bounds = None
+
+        if bounds is not None:
+            late = self.run_concurrent(scheduler, deadline, bounds)
+        else:
+            late = self.run_sequential(app, scheduler, deadline)
+
+        remaining = scheduler.drain()
+        if late:
+            printmsg(self.log, "WARNING: Reached deadline. Left " +
+                     str(len(remaining)) + " RAOBs for the next run (in " +
+                     journal.path + ")")
+            runmetrics.count('deferred', len(remaining))
+        else:
+            # Cancelled or done. Keep any left from an earlier run.
+            keys = set([get_key(task) for task in deferred])
+            remaining = [task for task in remaining if get_key(task) in keys]
+        journal.save(remaining)
+
+    def run_sequential(self, app, scheduler, deadline):
+        """ Retrieve the scheduled RAOBs one at a time, highest priority
+        first. Returns True if the deadline was reached """
+        count = 0
+        while len(scheduler) > 0:
+            if self.cancelled():
+                printmsg(self.log, "WARNING: Retrieval cancelled")
+                break
+            if deadline is not None and time.time() >= deadline:
+                return(True)
+            task = scheduler.pop()
+            self.set_task(task)
+            status = self.retrieve(app)
+            if self.outcome == 'error' and deadline is not None and \
+                    time.time() >= deadline:
+                # Cut short by the deadline. Leave it for the next run.
+                scheduler.push(task)
+                return(True)
+            if status is None:
+                # User clicked OK and wants to try to retrieve again
+                printmsg(self.log, "Try to retrieve " + task['stnm'] +
+                         " again")
+                scheduler.push(task)
+                continue
+            self.tick(task['stnm'])
+            if self.total > 30:
+                count += 1
+                if count % 10 == 0:
+                    printmsg(self.log, 'Sleeping for 30 seconds to ' +
+                             'avoid overwhelming UWyo server')
+                    wait = 30
+                    if deadline is not None:
+                        wait = max(min(wait, deadline - time.time()), 0)
+                    self.cancel_event.wait(wait)
+        return(False)
+
+    def spawn(self):
+        """ Return a RAOBget to retrieve RAOBs in another thread. It has its
+        own copy of the request, and shares the log, hooks, cancel event and
+        availability history with this one. """
+        raob = RAOBget()
+        raob.request = self.request.copy()
+        raob.log = self.log
+        raob.widget = None
+        raob.display = self.display
+        raob.cancel_event = self.cancel_event
+        raob.availability = self.availability
+        raob.missing = self.missing
+        raob.inventory = self.inventory
+        return(raob)
+
+    def run_concurrent(self, scheduler, deadline, bounds):
+        """
+        Retrieve the scheduled RAOBs several at once, highest priority first.
+        The number in flight adapts between bounds (low, high) to how the
+        server is coping (see lib/concurrency.py).
+
+        Returns:
+            True if the deadline was reached
+        """
+        limiter = AIMDLimiter(*bounds)
+        lock = threading.Lock()  # Guards the scheduler and progress
+        tries = {}               # task key -> times tried
+        late = []
+
+        def work():
+            raob = self.spawn()
+            while True:
+                start = limiter.acquire(self.cancel_event)
+                if start is None:
+                    return
+                with lock:
+                    task = None
+                    if deadline is not None and time.time() >= deadline:
+                        late.append(True)
+                    elif not self.cancelled():
+                        task = scheduler.pop()
+                if task is None:
+                    limiter.release(start, None)
+                    return
+                raob.set_task(task)
+                status = raob.retrieve(None)
+                limiter.release(start, raob.outcome)
+                with lock:
+                    if raob.outcome == 'error' and deadline is not None \
+                            and time.time() >= deadline:
+                        # Cut short by the deadline. Leave it for the next
+                        # run.
+                        scheduler.push(task)
+                        continue
+                    key = get_key(task)
+                    tries[key] = tries.get(key, 0) + 1
+                    if status is None and tries[key] < RETRIES:
+                        # Couldn't reach the server. Try again later.
+                        scheduler.push(task)
+                        continue
+                    self.tick(task['stnm'])
+
+        threads = [threading.Thread(target=work) for i in range(bounds[1])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self.cancelled():
+            printmsg(self.log, "WARNING: Retrieval cancelled")
+        return(len(late) > 0)
+
+    def cancel(self):
+        """ Ask a running retrieval to stop after the current RAOB """
+        self.cancel_event.set()
+
+    def cancelled(self):
+        return(self.cancel_event.is_set())
+
+    def tick(self, stn):
+        """ Count a RAOB as done and report progress, if anyone is listening
+        """
+        self.done += 1
+        if self.progress is not None:
+            self.progress(self.done, self.total, stn)
+
+    def write_report(self):
+        """ Write the run timing report, if requested """
+        if self.request.get_report() != '':
+            runmetrics.write_report(self.request.get_report())
+            printmsg(self.log, "Wrote run report to " +
+                     self.request.get_report())
+        if self.request.get_prometheus() != '':
+            runmetrics.write_prometheus(self.request.get_prometheus())
 
     def test_rsl(self, rslfile):
         if os.path.exists(rslfile):
@@ -222,16 +798,24 @@ class RAOBget():
         else:
             return(False)
 
-    def stn_loop(self, app):
+    def ready(self, app):
+        """ Check the request can be retrieved, and get the GUI ready to
+        display it """
         if self.request.get_mtp() is True and \
                 self.request.get_type() == "GIF:SKEWT":
             printmsg(self.log, 'ERROR: Requested GIF:SKEWT plots in ' +
                      'MTP mode. Check configuration.')
-            return()
+            return(False)
 
         # If TEXT:LIST, change the image to a canvas
-        if (app is not None) and (self.request.get_type() == 'TEXT:LIST'):
+        if (app is not None) and (self.request.get_type() == 'TEXT:LIST') \
+                and self.display is None:
             self.widget.resetImageWindow()
+        return(True)
+
+    def stn_loop(self, app):
+        if not self.ready(app):
+            return()
 
         # Did user request a single station via --stnm, or a list of stations
         # via an RSL file
@@ -239,17 +823,19 @@ class RAOBget():
             # Stnm already set
             # Retrieve requested data/imagery for a single stn
             self.retrieve(app)
+            self.tick(self.request.get_stnm())
         else:
             rslfile = os.path.join(os.getcwd(), self.request.get_rsl())
             if self.test_rsl(rslfile):
-                rsl = RSL()
-                stnlist = rsl.read_rsl(rslfile)
+                stnlist = self.stnlist
                 # If use requests more than 50 stns, break them up so don't
                 # overwhelm UWyo server.
                 if len(stnlist) > 30:
                     count = 0
                 i = 0
                 while i < len(stnlist):  # Loop through a list of stations
+                    if self.cancelled():
+                        return()
                     stn = stnlist[i]
                     status = self.request.set_stnm(stn)
                     if status is False:
@@ -257,6 +843,7 @@ class RAOBget():
                                  + stn + " not valid. Update RSL station" +
                                  " list. Skipping and continuing...")
                         i = i+1
+                        self.tick(stn)
                         continue
                     status = self.retrieve(app)
                     if status is False:
@@ -266,12 +853,15 @@ class RAOBget():
                         # clocked OK and wants to try to retrieve stn again.
                         printmsg(self.log, "Try to retrieve " + stn + " again")
                         i = i-1
+                    if status is not None:
+                        self.tick(stn)
                     if len(stnlist) > 30:
                         count = count+1
                         if count % 10 == 0:
                             printmsg(self.log, 'Sleeping for 30 seconds to ' +
                                      'avoid overwhelming UWyo server')
-                            time.sleep(30)
+                            # Wait, but wake up immediately if cancelled
+                            self.cancel_event.wait(30)
                     i = i+1
                 printmsg(self.log, "Done retrieving RAOBs from: '" +
                          self.request.get_year() + self.request.get_month() +
@@ -282,29 +872,133 @@ class RAOBget():
                 printmsg(self.log, 'ERROR: File ' + rslfile +
                          ' does not exist. Check for typo and rerun.')
 
+    def likely(self):
+        """
+        Return False if the requested RAOB almost certainly doesn't exist,
+        based on launch schedules and past requests, or the archive has
+        recently reported it missing
+        """
+        if self.availability is None or self.request.get_test() is True:
+            return(True)
+        stn = canonical_station(self.request.get_stnm(),
+                                self.request.stationList)
+        hour = self.request.get_begin()[2:4]
+        if not self.availability.likely(stn, hour):
+            printmsg(self.log, "Skipping " + self.request.get_stnm() + " at " +
+                     hour + "Z. Station rarely or never launches at that " +
+                     "hour.")
+            runmetrics.count('skipped_unavailable')
+            return(False)
+        valid = self.get_valid()
+        if self.missing.is_missing(stn, self.request.get_type(), valid):
+            printmsg(self.log, "Skipping " + self.request.get_stnm() + " at " +
+                     valid.strftime('%Y%m%d%HZ') + ". The archive has " +
+                     "reported it missing.")
+            runmetrics.count('skipped_known_missing')
+            return(False)
+        return(True)
+
+    def downloaded(self, raob):
+        """ Return True if the inventory shows the requested RAOB has
+        already been retrieved (and it isn't to be refreshed) to the file
+        raob would store it in, and the file is still there """
+        if self.inventory is None or self.request.get_refresh() is True:
+            return(False)
+        stn = canonical_station(self.request.get_stnm(),
+                                self.request.stationList)
+        valid = self.get_valid().strftime('%Y%m%d%H')
+        target = raob.get_target(self.request)
+        if not target:  # Problem with the path. Let retrieve report it.
+            return(False)
+        record = self.inventory.get(stn, valid, self.request.get_type(),
+                                    target)
+        if record is None:
+            # Not retrieved to this file, though maybe to another dir (or
+            # for the MTP). Check for the file on disk (see lib/rwget.py).
+            return(False)
+        if not os.path.isfile(record['path']):
+            # Removed since
+            self.inventory.remove(stn, valid, self.request.get_type(),
+                                  record['path'])
+            return(False)
+        printmsg(self.log, "Already downloaded file with name " +
+                 os.path.basename(record['path']))
+        return(True)
+
+    def register(self, outfile, url):
+        """ Add a stored RAOB file to the inventory """
+        if self.inventory is None or outfile is None:
+            return
+        stn = canonical_station(self.request.get_stnm(),
+                                self.request.stationList)
+        self.inventory.add(stn, self.get_valid().strftime('%Y%m%d%H'),
+                           self.request.get_type(), outfile, url or '',
+                           self.request.get_mtp() is True)
+
+    def get_valid(self):
+        """ Return the time of the requested RAOB as a datetime """
+        return(datetime.strptime(self.request.get_year() +
+                                 self.request.get_month() +
+                                 self.request.get_begin(), '%Y%m%d%H'))
+
+    def record(self, outcome):
+        """ Record whether the requested RAOB was found """
+        if self.availability is None or self.request.get_test() is True:
+            return
+        if outcome in ['retrieved', 'exists', 'unchanged', 'missing']:
+            stn = canonical_station(self.request.get_stnm(),
+                                    self.request.stationList)
+            self.availability.record(stn, self.request.get_begin()[2:4],
+                                     outcome != 'missing')
+            if outcome == 'missing':
+                self.missing.add(stn, self.request.get_type(),
+                                 self.get_valid())
+            else:
+                self.missing.remove(stn, self.request.get_type(),
+                                    self.get_valid())
+
     def retrieve(self, app):
         """ Retrieve data for requested RAOB type """
+        runmetrics.set_station(self.request.get_stnm())
+        self.outcome = None
 
-        if (self.request.get_type() == 'TEXT:LIST'):
-            textlist = RAOBtextlist(self.log)
-            (status, outfile) = textlist.retrieve(app, self.request, self.log)
-            # If in GUI mode and successfully downloaded a text file, create a
-            # skewT and display it in the GUI
-            if status and (app is not None):
-                self.widget.createSkewt(outfile)
-                app.processEvents()
-        elif (self.request.get_type() == 'GIF:SKEWT'):
-            gifskewt = RAOBgifskewt(self.log)
-            (status, outfile) = gifskewt.retrieve(app, self.request, self.log)
-            gifskewt.cleanup()
-            # If in GUI mode and successfully downloaded a gif image, display
-            # it in the GUI
-            if status and (app is not None):
-                self.widget.setImage(outfile)
-                app.processEvents()
-        else:
+        retriever = get_retriever(self.request.get_type())
+        if retriever is None:
             printmsg(self.log, "RAOB type '" + self.request.get_type() +
                      "' not implemented yet")
-            status = False
+            return(False)
+
+        raob = retriever(self.log)
+        if self.downloaded(raob):
+            self.outcome = 'exists'
+            self.record(self.outcome)
+            return(False)
+
+        if not self.likely():
+            self.outcome = 'skipped'
+            return(False)
+
+        with runmetrics.span('retrieve'):
+            (status, outfile) = raob.retrieve(app, self.request, self.log)
+            raob.cleanup()
+        self.outcome = raob.rwget.outcome
+        self.record(self.outcome)
+        if self.outcome == 'retrieved' and status:
+            self.register(outfile, raob.rwget.url)
+        elif self.outcome == 'exists' and outfile:
+            # Downloaded before there was an inventory
+            self.register(storage.find_file(outfile), raob.rwget.url)
+
+        # If in GUI mode and successfully downloaded a displayable RAOB,
+        # display it in the GUI: create a skewT from data, or show an image
+        if status and raob.display is not None:
+            if self.display is not None:
+                self.display(raob.name, outfile)
+            elif app is not None:
+                if raob.display == 'skewt':
+                    self.widget.createSkewt(outfile)
+                else:
+                    self.widget.setImage(outfile)
+                app.processEvents()
 
         return(status)
@@ -2,22 +2,229 @@
 # Code specific to configuring and executing retrieval of data/imagery from the
 # University of Wyoming Radiosonde Archive.
 #
+# Downloads ask for gzip compression, which the archive may or may not use.
+# If the archive sends an ETag or Last-Modified header with a file, they are
+# kept next to it in <file>.meta, so that with --refresh the file can be
+# requested again only if it has changed (the archive answers 304 Not
+# Modified if not). The bytes this saves are counted as bytes_avoided.
+#
+# Files are downloaded to <file>.part and renamed once complete: the length
+# received must match the Content-Length the archive sent, and the file must
+# end as a complete file of its kind does (see lib/storage.py). A download
+# that is cut short is resumed with an HTTP Range request, from where it
+# stopped, if the archive supports it (Accept-Ranges: bytes) and the part is
+# not compressed; otherwise the part is dropped and the file retrieved again.
+# A part left by an interrupted run is resumed by the next run.
+#
+# Every request is sent with the connect and read timeouts of the run (see
+# lib/timeouts.py).
+#
 # Written in Python 3
 #
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
 import os
 import sys
+import gzip
+import json
 import urllib.request
+import http.client
 import socket
+import threading
 
 from urllib.error import HTTPError, URLError
 from util.region import RAOBregion
 from raobtype.raobtype import RAOBtype
-from lib.messageHandler import printmsg
+from lib.messageHandler import printmsg, eventbus
+from lib.metrics import runmetrics
+from lib.timeouts import timeouts, is_timeout, timed_out
+import lib.storage as storage
 from PyQt5.QtWidgets import QMessageBox, QApplication
 
 
+class SingleFlight():
+
+    def __init__(self):
+        """
+        Make concurrent calls for the same key share one call: the first
+        thread to ask for a key runs the call, and any others asking for the
+        same key while it runs wait for it to finish.
+        """
+        self.lock = threading.Lock()
+        self.calls = {}  # key -> (Event set when done, [result])
+
+    def do(self, key, function, *args):
+        """
+        Returns:
+            (leader, result): leader is True if this thread ran the call
+        """
+        with self.lock:
+            leader = key not in self.calls
+            if leader:
+                self.calls[key] = (threading.Event(), [None])
+            done, result = self.calls[key]
+
+        if not leader:
+            done.wait()
+            return(False, result[0])
+
+        try:
+            result[0] = function(*args)
+        finally:
+            with self.lock:
+                del self.calls[key]
+            done.set()
+        return(True, result[0])
+
+
+# Downloads in progress in this process, by URL
+inflight = SingleFlight()
+
+
+class ReadTimeout():
+    """ Allow an HTTP connection the connect timeout to connect, then the
+    read timeout for each read """
+
+    def __init__(self, *args, read_timeout=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.read_timeout = read_timeout
+
+    def connect(self):
+        super().connect()
+        self.sock.settimeout(self.read_timeout)
+
+
+class HTTPConnection(ReadTimeout, http.client.HTTPConnection):
+    pass
+
+
+class HTTPSConnection(ReadTimeout, http.client.HTTPSConnection):
+    pass
+
+
+class HTTPHandler(urllib.request.HTTPHandler):
+
+    def http_open(self, req):
+        return(self.do_open(HTTPConnection, req,
+                            read_timeout=timeouts.get_read()))
+
+
+class HTTPSHandler(urllib.request.HTTPSHandler):
+
+    def https_open(self, req):
+        return(self.do_open(HTTPSConnection, req, context=self._context,
+                            read_timeout=timeouts.get_read()))
+
+
+opener = urllib.request.build_opener(HTTPHandler, HTTPSHandler)
+
+
+# Each thread may set pacing.wait_turn to a function called before every
+# request it sends, that waits for a turn to keep to a rate limit shared with
+# other workers (see RAOBget.work_queue). It returns False if cancelled.
+pacing = threading.local()
+
+
+def urlopen(request):
+    """ Open a URL with the timeouts of the run, once it is this thread's
+    turn to send a request """
+    wait_turn = getattr(pacing, 'wait_turn', None)
+    if wait_turn is not None and not wait_turn():
+        raise URLError("Cancelled while waiting to send request")
+    return(opener.open(request, timeout=timeouts.get_connect()))
+
+
+def read_block(response):
+    """
+    Read what has arrived of a response, up to a block. Each read waits at
+    most the read timeout, cut to the time left before the deadline, so a
+    server that sends a little at a time can't keep a download going past
+    it. Raises socket.timeout once the deadline is reached.
+    """
+    if timeouts.deadline is not None:
+        if timeouts.expired():
+            raise socket.timeout("Reached the deadline")
+        sock = getattr(getattr(response.fp, 'raw', None), '_sock', None)
+        if sock is not None:
+            sock.settimeout(timeouts.get_read())
+    return(response.read1(BLOCK))
+
+
+PART = '.part'   # Suffix of a file being downloaded
+BLOCK = 1 << 16  # Bytes read at a time
+RESUMES = 2      # Times to resume a download that is cut short
+
+
+class IncompleteDownload(Exception):
+
+    def __init__(self, message, resumable=False):
+        """
+        A download that could not be completed.
+
+        Parameters:
+            resumable: True if what was received is kept in the part file,
+                       to resume the download from
+        """
+        super().__init__(message)
+        self.resumable = resumable
+
+
+def get_part_file(outfile):
+    """ Return the name of the file outfile is downloaded to """
+    return(outfile + PART)
+
+
+def remove_part(outfile):
+    """ Remove a partly downloaded file, and its validators """
+    part = get_part_file(outfile)
+    if os.path.isfile(part):
+        os.remove(part)
+    remove_meta(part)
+
+
+def get_length(headers, offset):
+    """ Return the full length of a file from the headers of a response
+    starting at offset, or None if the server didn't say """
+    content_range = headers.get('Content-Range', '')
+    if '/' in content_range and not content_range.endswith('*'):
+        return(int(content_range.rsplit('/', 1)[1]))
+    if headers.get('Content-Length') is None:
+        return(None)
+    return(offset + int(headers['Content-Length']))
+
+
+def get_meta_file(outfile):
+    """ Return the name of the file holding the HTTP validators of outfile
+    """
+    return(outfile + '.meta')
+
+
+def read_meta(outfile):
+    """ Return the HTTP validators saved for outfile, or {} if none """
+    try:
+        with open(get_meta_file(outfile)) as f:
+            return(json.load(f))
+    except (OSError, ValueError):
+        return({})
+
+
+def write_meta(outfile, headers, size):
+    """ Save the validators the server sent with outfile, if any """
+    meta = {'etag': headers.get('ETag', ''),
+            'last_modified': headers.get('Last-Modified', ''),
+            'size': size}
+    if meta['etag'] == '' and meta['last_modified'] == '':
+        return
+    with open(get_meta_file(outfile), 'w') as f:
+        json.dump(meta, f)
+
+
+def remove_meta(outfile):
+    """ Remove the validators of a file that is being removed """
+    if os.path.isfile(get_meta_file(outfile)):
+        os.remove(get_meta_file(outfile))
+
+
 class RAOBwget:
 
     def __init__(self, log=""):
@@ -30,6 +237,12 @@ class RAOBwget:
         self.region = RAOBregion    # Instance of region dictionary
         self.type = RAOBtype    # Instance of data/imagery type dictionary
         self.log = log
+        # Outcome of the last get_data: 'retrieved', 'exists' (already
+        # downloaded), 'unchanged' (downloaded, and with refresh, the
+        # archive says it hasn't changed), 'coalesced' (downloaded by another
+        # thread), 'missing' (the archive has no such RAOB) or 'error'
+        self.outcome = None
+        self.url = None  # URL of the last get_data
 
     def get_url(self, request, log=""):
         """
@@ -43,20 +256,21 @@ class RAOBwget:
             url: the generated URL
         """
 
-        url = "http://weather.uwyo.edu/cgi-bin/sounding?"
-        if (request.get_region() != ''):
-            url += "region=" + self.region[request.get_region()]
-        url += "&TYPE=" + self.type[request.get_type()]
-        url += "&YEAR=" + request.get_year()
-        url += "&MONTH=" + request.get_month()
-        url += "&FROM=" + request.get_begin()
-        url += "&TO=" + request.get_end()
-        url += "&STNM=" + request.get_stnm()
+        with runmetrics.span('build_url'):
+            url = request.get_server() + "/cgi-bin/sounding?"
+            if (request.get_region() != ''):
+                url += "region=" + self.region[request.get_region()]
+            url += "&TYPE=" + self.type[request.get_type()]
+            url += "&YEAR=" + request.get_year()
+            url += "&MONTH=" + request.get_month()
+            url += "&FROM=" + request.get_begin()
+            url += "&TO=" + request.get_end()
+            url += "&STNM=" + request.get_stnm()
         # printmsg(log, url)
 
         return(url)
 
-    def get_data(self, url, outfile):
+    def get_data(self, url, outfile, validate=True, refresh=False):
         """
         Send the generated URL to the uwyo website and receive back a file
         containing the requested data or imagery.
@@ -65,86 +279,380 @@ class RAOBwget:
             url: the url containing the request
             outfile: the name of the file to which the received data should be
                      saved
+            validate: check the file for error messages from the website.
+                      Set to False for images.
+            refresh: if the file has already been downloaded, request it
+                     again if it has changed
 
         Returns:
             boolean: True/False success indicator
 
         """
 
-        # Check if filename already exists. wget will fail if it does.
-        if os.path.isfile(outfile):
+        self.url = url
+
+        # Check if filename already exists (possibly compressed, see
+        # lib/storage.py). wget will fail if it does.
+        if not refresh and storage.find_file(outfile) is not None:
             printmsg(self.log, "Already downloaded file with name " + outfile)
+            self.outcome = 'exists'
+
+            return(False)  # Did not download new data
 
+        # If another thread is already downloading this URL, wait for it
+        # rather than downloading it again
+        leader, status = inflight.do(url, self.download, url, outfile,
+                                     validate, refresh)
+        if not leader:
+            printmsg(self.log, "Already downloading file with name " +
+                     outfile)
+            runmetrics.count('coalesced')
+            self.outcome = 'coalesced'
             return(False)  # Did not download new data
+        return(status)
+
+    def download(self, url, outfile, validate=True, refresh=False):
+        """ Download url to outfile. See get_data. """
+        # Another thread may have finished downloading it since we checked
+        if not refresh and storage.find_file(outfile) is not None:
+            printmsg(self.log, "Already downloaded file with name " + outfile)
+            self.outcome = 'exists'
+            return(False)
+
+        # If refreshing a file downloaded before, only get it if it has
+        # changed.
+        meta = {}
+        if refresh and storage.find_file(outfile) is not None:
+            meta = read_meta(outfile)
+
+        # Check if online - if not, exit gracefully. The probe is sent like
+        # the download, so is as small.
+        try:
+            with runmetrics.span('probe'):
+                try:
+                    urlopen(self.get_request(url, meta)).close()
+                except HTTPError as e:
+                    if e.code != 304:  # Not Modified means online
+                        raise
+        except (HTTPError, URLError, socket.timeout) as e:
+            if is_timeout(e):
+                # Don't ask whether to try again; the deadline may be near
+                timed_out('probe')
+                printmsg(self.log, "ERROR: Timed out connecting to " +
+                         "weather.uwyo.edu. Unable to download " + outfile)
+                self.outcome = 'error'
+                return(False)
+
+            # Get reference to existing QApplication
+            app = QApplication.instance()
+
+            msg = "Can't connect to weather.uwyo.edu. Received error:" + \
+                  "\n" + str(e) + \
+                  "\n\nUnable to download " + outfile + "\n\n" + \
+                  " Confirm that you are online and click OK to try to" + \
+                  " retrieve same RAOB or click Quit to exit program. " + \
+                  " Restart with option --test for testing with" + \
+                  " offline sample data files"
+            if app is None:
+                printmsg(self.log, msg)
+            elif threading.current_thread() is not \
+                    threading.main_thread():
+                # Running in a background retrieval thread, which can't
+                # open dialogs. Log the error and skip this RAOB.
+                printmsg(self.log, "ERROR: Can't connect to " +
+                         "weather.uwyo.edu. Received error: " + str(e) +
+                         ". Unable to download " + outfile)
+                self.outcome = 'error'
+                return(False)
+            else:
+                # Show the messages logged so far before the dialog
+                eventbus.flush()
+                msgBox = QMessageBox()
+                msgBox.setText(msg)
+                msgBox.setIcon(QMessageBox.Information)
+                msgBox.addButton('OK', QMessageBox.AcceptRole)
+                msgBox.addButton('Quit', QMessageBox.RejectRole)
+                reply = msgBox.exec()
+                if reply == QMessageBox.RejectRole:
+                    sys.exit()
+            self.outcome = 'error'
+            return(None)
+        except Exception as e:
+            printmsg(self.log, "Unknown error connecting to UWyo: " + e)
+
+        # Get requested URL.
+        try:
+            with runmetrics.span('download'):
+                headers = self.download_file(url, outfile, meta)
+            if headers is None:
+                printmsg(self.log, "Already downloaded file with name " +
+                         outfile + ". It has not changed.")
+                self.outcome = 'unchanged'
+                return(False)  # Did not download new data
+            write_meta(outfile, headers, os.path.getsize(outfile))
+        except (HTTPError, URLError, socket.timeout) as e:
+            if is_timeout(e):
+                timed_out('download')
+            printmsg(self.log, "Error downloading file " + outfile +
+                     " Error: " + str(e))
+            self.outcome = 'error'
+            return(False)
+        except IncompleteDownload as e:
+            printmsg(self.log, "ERROR: " + str(e))
+            self.outcome = 'error'
+            return(False)
+
+        # Test if text/html file contains good data
+        if validate:
+            with runmetrics.span('validate'):
+                valid = self.validate(outfile)
+            if not valid:
+                remove_meta(outfile)
+                self.outcome = 'missing'
+                return(False)
+
+        printmsg(self.log, "Retrieved " + outfile)
+
+        self.outcome = 'retrieved'
+        return(True)  # Downloaded new data
+
+    def fetch(self, url):
+        """
+        Send the generated URL to the uwyo website and return the page, without
+        writing it to a file.
 
-        else:
-            # Check if online - if not, exit gracefully
+        Parameters:
+            url: the url containing the request
+
+        Returns:
+            text: the page received, or None if it could not be retrieved or
+                  contains an error message instead of data (see
+                  self.outcome for which)
+        """
+        try:
+            with runmetrics.span('download'):
+                data, headers = self.open_url(url)
+        except (HTTPError, URLError, socket.timeout) as e:
+            if is_timeout(e):
+                timed_out('download')
+            printmsg(self.log, "ERROR: Can't retrieve " + url +
+                     " Error: " + str(e))
+            self.outcome = 'error'
+            return(None)
+
+        text = data.decode('utf-8', errors='replace')
+        with runmetrics.span('validate'):
+            for line in text.splitlines():
+                if self.is_error(line):
+                    self.outcome = 'missing'
+                    return(None)
+
+        self.outcome = 'retrieved'
+        return(text)
+
+    def download_file(self, url, outfile, meta):
+        """
+        Download url to outfile by way of a part file, resuming the download
+        if it is cut short (see download_part).
+
+        Returns:
+            headers: the response headers, or None if the copy already
+                     downloaded is unchanged
+        """
+        for attempt in range(RESUMES + 1):
             try:
-                urllib.request.urlopen(url)
-            except (HTTPError, URLError) as e:
-                # Get reference to existing QApplication
-                app = QApplication.instance()
-
-                msg = "Can't connect to weather.uwyo.edu. Received error:" + \
-                      "\n" + str(e) + \
-                      "\n\nUnable to download " + outfile + "\n\n" + \
-                      " Confirm that you are online and click OK to try to" + \
-                      " retrieve same RAOB or click Quit to exit program. " + \
-                      " Restart with option --test for testing with" + \
-                      " offline sample data files"
-                if app is None:
-                    print(self.log, msg)
-                else:
-                    msgBox = QMessageBox()
-                    msgBox.setText(msg)
-                    msgBox.setIcon(QMessageBox.Information)
-                    msgBox.addButton('OK', QMessageBox.AcceptRole)
-                    msgBox.addButton('Quit', QMessageBox.RejectRole)
-                    reply = msgBox.exec()
-                    if reply == QMessageBox.RejectRole:
-                        sys.exit()
-                return(None)
-            except socket.timeout as e:
-                printmsg(self.log, "There was an error:")
-                printmsg(self.log, str(e))
-            except Exception as e:
-                printmsg(self.log, "Unknown error connecting to UWyo: " + e)
-
-            # Get requested URL.
+                return(self.download_part(url, outfile, meta))
+            except IncompleteDownload as e:
+                if not e.resumable or attempt == RESUMES or \
+                        timeouts.expired():
+                    raise  # Any part is resumed by the next run
+                printmsg(self.log, "WARNING: " + str(e) + ". Resuming.")
+
+    def download_part(self, url, outfile, meta):
+        """
+        Download url to the part file of outfile, continuing from what an
+        earlier attempt left in it, and if it is complete, rename it to
+        outfile.
+
+        Parameters:
+            url: the url to get
+            outfile: the name of the file to save
+            meta: validators of a copy already downloaded (see read_meta)
+
+        Returns:
+            headers: the response headers, or None if the copy already
+                     downloaded is unchanged
+
+        Raises IncompleteDownload if the file is not complete
+        """
+        part = get_part_file(outfile)
+        offset = os.path.getsize(part) if os.path.isfile(part) else 0
+        request = self.get_request(url, meta, offset, read_meta(part))
+        try:
+            response = urlopen(request)
+        except HTTPError as e:
+            if e.code == 416:  # Range Not Satisfiable. Start again.
+                remove_part(outfile)
+                raise IncompleteDownload("Can't resume download of " +
+                                         outfile, resumable=True)
+            if e.code != 304:
+                raise
+            remove_part(outfile)
+            runmetrics.count('not_modified')
+            runmetrics.count('bytes_avoided', meta.get('size', 0))
+            return(None)
+
+        with response:
+            headers = response.headers
+            gzipped = headers.get('Content-Encoding', '') == 'gzip'
+            if response.status == 206:  # Partial Content, from offset
+                printmsg(self.log, "Resuming download of " + outfile +
+                         " from byte " + str(offset))
+                runmetrics.count('resumed')
+                mode = 'ab'
+            else:
+                offset = 0
+                mode = 'wb'
+            length = get_length(headers, offset)
+            # Keep the validators of the part, to check that a resumed
+            # download continues the same file (If-Range)
+            write_meta(part, headers, 0)
+
+            received = 0
+            interrupted = False
+            with open(part, mode) as f:
+                try:
+                    for block in iter(lambda: read_block(response), b''):
+                        f.write(block)
+                        received += len(block)
+                except (http.client.IncompleteRead, ConnectionError,
+                        socket.timeout) as e:
+                    if is_timeout(e):
+                        timed_out('download')
+                    interrupted = True
+        runmetrics.count('bytes_downloaded', received)
+
+        size = offset + received
+        if interrupted or (length is not None and size < length):
+            runmetrics.count('incomplete')
+            resumable = not gzipped and received > 0 and \
+                headers.get('Accept-Ranges', '') == 'bytes'
+            if not resumable:
+                remove_part(outfile)
+            raise IncompleteDownload("Download of " + outfile + " stopped " +
+                                     "after " + str(size) + " of " +
+                                     str(length) + " bytes", resumable)
+
+        with open(part, 'rb') as f:
+            data = f.read()
+        if gzipped:
             try:
-                urllib.request.urlretrieve(url, outfile)
-            except (HTTPError, URLError) as e:
-                printmsg(self.log, "Error downloading file " + outfile +
-                         " Error: " + str(e))
-                return(False)
-            except socket.timeout as e:
-                printmsg(self.log, "There was an error:")
-                printmsg(self.log, str(e))
-
-            # Test if text/html file contains good data
-            if "gif" not in outfile:
-                out = open(outfile)
-                line = out.readline()
-                while line != '':
-                    if "Can't get" in line:
-                        printmsg(self.log, 'ERROR: Website says "' +
-                                 line.rstrip() + '"')
-                        out.close()
-                        if os.path.isfile(outfile):
-                            os.remove(outfile)
-                        return(False)
-                    elif 'Sorry, unable to generate' in line:
-                        printmsg(self.log, line.rstrip() + ". Retrieved file" +
-                                 " contains error message - gif was not " +
-                                 "generated")
-                        out.close()
-                        if os.path.isfile(outfile):
-                            os.remove(outfile)
-                        return(False)
-                    else:
-                        line = out.readline()
-                out.close()
-
-            printmsg(self.log, "Retrieved " + outfile)
-
-            return(True)  # Downloaded new data
+                data = gzip.decompress(data)
+            except (OSError, EOFError):
+                data = b''
+            runmetrics.count('bytes_avoided', len(data) - size)
+        if not storage.is_complete(data, outfile):
+            runmetrics.count('incomplete')
+            remove_part(outfile)
+            raise IncompleteDownload("Download of " + outfile + " is " +
+                                     "incomplete. It doesn't end as a " +
+                                     os.path.splitext(outfile)[1] +
+                                     " file should.")
+        if gzipped:
+            with open(part, 'wb') as f:
+                f.write(data)
+
+        runmetrics.count('downloads')
+        os.replace(part, outfile)
+        remove_meta(part)
+        return(headers)
+
+    def get_request(self, url, meta, offset=0, part_meta=None):
+        """
+        Build the request for a URL, asking for it gzip compressed and, if
+        meta holds validators of a copy already downloaded, only if it has
+        changed.
+
+        To resume a download (offset > 0), ask for the rest of the file from
+        offset, uncompressed, and if part_meta holds validators of what was
+        received, only if the file is still the same.
+        """
+        headers = {'Accept-Encoding': 'gzip'}
+        if offset > 0:
+            headers = {'Accept-Encoding': 'identity',
+                       'Range': 'bytes=' + str(offset) + '-'}
+            if part_meta is None:
+                part_meta = {}
+            if part_meta.get('etag', '') != '':
+                headers['If-Range'] = part_meta['etag']
+            elif part_meta.get('last_modified', '') != '':
+                headers['If-Range'] = part_meta['last_modified']
+        if meta.get('etag', '') != '':
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified', '') != '':
+            headers['If-Modified-Since'] = meta['last_modified']
+        return(urllib.request.Request(url, headers=headers))
+
+    def open_url(self, url, meta=None):
+        """
+        Get a URL, asking for it gzip compressed.
+
+        Parameters:
+            url: the url to get
+            meta: validators of a copy already downloaded (see read_meta).
+                  If given, the body is only sent if it has changed.
+
+        Returns:
+            (body, headers): the decompressed body and the response headers,
+            or (None, None) if the copy already downloaded is unchanged
+        """
+        if meta is None:
+            meta = {}
+        try:
+            with urlopen(self.get_request(url, meta)) as response:
+                body = response.read()
+                headers = response.headers
+        except HTTPError as e:
+            if e.code != 304:
+                raise
+            runmetrics.count('not_modified')
+            runmetrics.count('bytes_avoided', meta.get('size', 0))
+            return(None, None)
+
+        runmetrics.count('downloads')
+        runmetrics.count('bytes_downloaded', len(body))
+        if headers.get('Content-Encoding', '') == 'gzip':
+            size = len(body)
+            body = gzip.decompress(body)
+            runmetrics.count('bytes_avoided', len(body) - size)
+        return(body, headers)
+
+    def is_error(self, line):
+        """
+        Test if a line of a retrieved page is an error message from the
+        website rather than data, and if so log it.
+        """
+        if "Can't get" in line:
+            printmsg(self.log, 'ERROR: Website says "' + line.rstrip() + '"')
+            return(True)
+        elif 'Sorry, unable to generate' in line:
+            printmsg(self.log, line.rstrip() + ". Retrieved file" +
+                     " contains error message - gif was not " +
+                     "generated")
+            return(True)
+        return(False)
+
+    def validate(self, outfile):
+        """
+        Test if a retrieved text/html file contains good data. If the website
+        returned an error message instead, remove the file.
+
+        Returns:
+            boolean: True if the file contains data
+        """
+        with open(outfile) as out:
+            valid = not any(self.is_error(line) for line in out)
+        if not valid and os.path.isfile(outfile):
+            os.remove(outfile)
+
+        return(valid)
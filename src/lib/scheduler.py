@@ -0,0 +1,204 @@
+###############################################################################
+# Schedule the planned RAOB retrievals by priority, so that when time is
+# short (e.g. an operational morning window) the RAOBs that matter most are
+# retrieved first. Each task - a station and time, as in the work queue (see
+# lib/workqueue.py) - is scored by any of:
+#   recent  newer RAOBs first. The score halves for each day of age.
+#   weight  a per-station weight from the config file (station_weights:),
+#           e.g. "72672=4 72476=0.5". Unlisted stations have weight 1.
+#   near    stations near a point (--near lat,lon) first. The score halves
+#           every 500 km.
+# The scores of the chosen priorities are multiplied. Tasks with equal scores
+# keep their planned order (RSL order, then time order).
+#
+# If a deadline is given, retrieval stops at the deadline and the tasks not
+# yet retrieved are written to a journal. The next run in the same directory
+# adds them to its own plan.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import math
+import time
+import heapq
+import calendar
+from datetime import datetime, timedelta, timezone
+from lib.availability import read_json, write_json
+
+PRIORITIES = ['recent', 'weight', 'near']
+HALF_LIFE = 24    # hours for the recent score to halve
+HALF_DIST = 500   # km for the near score to halve
+EARTH = 6371.0    # Earth radius, km
+
+# File in the output dir that deferred tasks are kept in
+JOURNAL = 'raobget.journal.json'
+
+
+def parse_priority(value):
+    """ Parse a comma-separated list of priorities. Raises ValueError on an
+    unknown one """
+    priorities = [p.strip() for p in str(value).split(',') if p.strip()]
+    for priority in priorities:
+        if priority not in PRIORITIES:
+            raise ValueError("Unknown priority '" + priority + "'. Use " +
+                             ", ".join(PRIORITIES))
+    return(priorities)
+
+
+def parse_weights(value):
+    """ Parse station weights, e.g. "72672=4 72476=0.5", separated by spaces
+    or semicolons. Returns a dictionary of station -> weight """
+    weights = {}
+    for entry in str(value).replace(';', ' ').split():
+        stn, weight = entry.split('=', 1)
+        weights[stn.strip()] = float(weight)
+    return(weights)
+
+
+def parse_point(value):
+    """ Parse a point given as "lat,lon" (degrees). Returns (lat, lon) """
+    lat, lon = str(value).split(',')
+    return((float(lat), float(lon)))
+
+
+def parse_deadline(value, now=None):
+    """
+    Parse a deadline, given either as seconds from now (e.g. "1800") or as a
+    UTC clock time "HH:MM" (the next time it occurs).
+
+    Returns the deadline in seconds since the epoch
+    """
+    if now is None:
+        now = time.time()
+    value = str(value)
+    if ':' not in value:
+        return(now + float(value))
+    hour, minute = value.split(':')
+    start = datetime.fromtimestamp(int(now), timezone.utc)
+    deadline = start.replace(hour=int(hour), minute=int(minute), second=0)
+    if deadline <= start:
+        deadline += timedelta(days=1)
+    return(deadline.timestamp())
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """ Return the great circle distance between two points (km) """
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * \
+        math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return(2 * EARTH * math.asin(math.sqrt(a)))
+
+
+def get_key(task):
+    """ Return a key identifying the RAOB a task retrieves """
+    return((task['stnm'], task['raobtype'], task['year'], task['month'],
+            task['day'], task['hour']))
+
+
+class Scheduler():
+
+    def __init__(self, priorities=(), weights=None, point=None,
+                 stationList=None, now=None):
+        """
+        Parameters:
+            priorities: list of priorities to score tasks by (see PRIORITIES)
+            weights: dictionary of station -> weight, for 'weight'
+            point: (lat, lon), for 'near'
+            stationList: a RAOBstation_list to find stations in, for 'near'
+            now: time to measure the age of RAOBs from, for 'recent'.
+                 Defaults to now.
+        """
+        self.priorities = list(priorities)
+        self.weights = weights if weights is not None else {}
+        self.point = point
+        self.stationList = stationList
+        self.now = time.time() if now is None else now
+        self.heap = []
+        self.keys = set()
+        self.count = 0  # Number of tasks pushed, to keep planned order
+
+    def get_priority(self, task):
+        """ Return the score of a task. Higher scores are retrieved first """
+        score = 1.0
+        if 'recent' in self.priorities:
+            valid = calendar.timegm((int(task['year']), int(task['month']),
+                                     int(task['day']), int(task['hour']), 0,
+                                     0))
+            age = max(self.now - valid, 0) / 3600
+            score *= 0.5 ** (age / HALF_LIFE)
+        if 'weight' in self.priorities:
+            score *= self.weights.get(task['stnm'], 1.0)
+        if 'near' in self.priorities and self.point is not None:
+            score *= 0.5 ** (self.get_distance(task['stnm']) / HALF_DIST)
+        return(score)
+
+    def get_distance(self, stn):
+        """ Return the distance (km) of a station from the point. Stations
+        that can't be found are put half way round the world. """
+        stations = []
+        if self.stationList is not None:
+            if stn.isdigit():
+                stations = self.stationList.get_by_stnm(stn)
+            else:
+                stations = self.stationList.get_by_id(stn)
+        try:
+            lat = float(stations[0]['lat']) / 100.0
+            lon = float(stations[0]['lon']) / 100.0
+        except (IndexError, ValueError):
+            return(math.pi * EARTH)
+        return(distance(self.point[0], self.point[1], lat, lon))
+
+    def push(self, task):
+        """ Add a task. Returns False if it is already scheduled. """
+        key = get_key(task)
+        if key in self.keys:
+            return(False)
+        self.keys.add(key)
+        heapq.heappush(self.heap, (-self.get_priority(task), self.count,
+                                   task))
+        self.count += 1
+        return(True)
+
+    def pop(self):
+        """ Return the highest priority task, or None if there are none """
+        if not self.heap:
+            return(None)
+        task = heapq.heappop(self.heap)[2]
+        self.keys.discard(get_key(task))
+        return(task)
+
+    def drain(self):
+        """ Remove and return all the tasks left, highest priority first """
+        tasks = []
+        while self.heap:
+            tasks.append(self.pop())
+        return(tasks)
+
+    def __len__(self):
+        return(len(self.heap))
+
+
+class Journal():
+
+    def __init__(self, path=JOURNAL, log=""):
+        """ The tasks deferred by a run that reached its deadline """
+        self.path = os.path.abspath(path)
+        self.log = log
+
+    def exists(self):
+        return(os.path.isfile(self.path))
+
+    def load(self):
+        """ Return the deferred tasks """
+        return(read_json(self.path, self.log).get('tasks', []))
+
+    def save(self, tasks):
+        """ Replace the deferred tasks. Removes the journal if there are none.
+        """
+        if len(tasks) == 0:
+            if self.exists():
+                os.remove(self.path)
+            return
+        write_json(self.path, {'tasks': tasks})
@@ -10,6 +10,8 @@
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
 import os
+import bisect
+import threading
 from lib.messageHandler import printmsg
 
 RAOBstation = {
@@ -30,6 +32,10 @@ class RAOBstation_list:
         self.station = RAOBstation
         self.station_list = []
         self.log = log
+        self.error = ""     # Error message if the list could not be read
+        self.by_id = {}     # Index of station_list by id
+        self.by_number = {}  # Index of station_list by number
+        self.index = None   # Search index, built on first search
 
     def read(self, station_list_file):
         """
@@ -45,6 +51,7 @@ class RAOBstation_list:
                     "window and click\n" + \
                     "'Create station list' again"
             printmsg(self.log, error)
+            self.error = error
             return(error)
         else:
             # Make sure station_list_file exists
@@ -52,12 +59,17 @@ class RAOBstation_list:
                 error = "ERROR: station list file " + station_list_file + \
                         " doesn't exist"
                 printmsg(self.log, error)
+                self.error = error
                 return(error)
 
         # Make sure the RAOBstation dictionary and generated station_list
         # array are empty
         self.station.clear()
         self.station_list.clear()
+        self.by_id = {}
+        self.by_number = {}
+        self.index = None
+        self.error = ""
 
         # Open the station list file and read the contents into the
         # dictionary
@@ -80,6 +92,12 @@ class RAOBstation_list:
                 # Copy dictionary into array (so get a copy, not a pointer)
                 self.station_list.append(self.station.copy())
 
+                # Index by id and number for fast lookup
+                station = self.station_list[-1]
+                self.by_id.setdefault(station['id'], []).append(station)
+                self.by_number.setdefault(station['number'],
+                                          []).append(station)
+
                 # printmsg(self.log, line.rstrip().split())
 
         infile.close()
@@ -92,14 +110,124 @@ class RAOBstation_list:
         if (len(stnid) < 8):
             stnid = stnid.ljust(8)
 
-        return(list(filter(lambda station: station['id'] == stnid,
-               self.station_list)))
+        return(list(self.by_id.get(stnid, [])))
 
     # Select station by station number
     def get_by_stnm(self, number):
 
-        return(list(filter(lambda station: station['number'] == number,
-               self.station_list)))
+        return(list(self.by_number.get(number, [])))
+
+    def search(self, text):
+        """
+        Return the positions in station_list of stations matching text. See
+        RAOBstation_index.
+        """
+        if self.index is None:
+            self.index = RAOBstation_index(self.station_list)
+        return(self.index.search(text))
+
+
+class RAOBstation_index:
+
+    def __init__(self, station_list):
+        """
+        Build an index for incremental search of a station list by id,
+        number, name, state or country. Short search terms are matched
+        against the start of each field using a sorted list of fields. Longer
+        terms are matched anywhere in the station's text using an index of
+        three-character substrings (trigrams), so a search only looks at
+        stations that contain every trigram of the term.
+        """
+        self.text = []      # Searchable text of each station
+        self.prefix = []    # Sorted (field, position) pairs
+        self.trigrams = {}  # trigram -> set of positions
+
+        for pos, stn in enumerate(station_list):
+            name = stn['description'].strip().lower()
+            fields = [stn['id'].strip().lower(), stn['number'].strip(),
+                      name, stn['state'].strip().lower(),
+                      stn['country'].strip().lower()]
+            # Also index each word of multi-word names, e.g. GRAND_JUNCTION
+            for sep in ['_', '/', '-', ' ']:
+                name = name.replace(sep, ' ')
+            fields += name.split()
+
+            text = " ".join(fields)
+            self.text.append(text)
+            for field in set(fields):
+                if field != '':
+                    self.prefix.append((field, pos))
+            for i in range(len(text) - 2):
+                self.trigrams.setdefault(text[i:i+3], set()).add(pos)
+
+        self.prefix.sort()
+        self.all = list(range(len(station_list)))
+
+    def match(self, term):
+        """ Return the set of positions of stations matching one term """
+        if len(term) < 3:
+            found = set()
+            i = bisect.bisect_left(self.prefix, (term, -1))
+            while i < len(self.prefix) and \
+                    self.prefix[i][0].startswith(term):
+                found.add(self.prefix[i][1])
+                i += 1
+            return(found)
+
+        # Intersect the stations containing each trigram, starting with the
+        # rarest, then confirm the whole term is present.
+        sets = []
+        for i in range(len(term) - 2):
+            trigram = self.trigrams.get(term[i:i+3])
+            if trigram is None:
+                return(set())
+            sets.append(trigram)
+        sets.sort(key=len)
+        found = sets[0].intersection(*sets[1:])
+        return(set(pos for pos in found if term in self.text[pos]))
+
+    def search(self, text):
+        """
+        Return the positions (in order) of the stations matching every
+        whitespace-separated term in text. An empty text matches everything.
+        """
+        terms = text.lower().split()
+        if len(terms) == 0:
+            return(self.all)
+
+        found = None
+        for term in terms:
+            if found is None:
+                found = self.match(term)
+            else:
+                found &= self.match(term)
+            if len(found) == 0:
+                break
+        return(sorted(found))
+
+
+# Station lists shared by all modules, keyed by path, so each master station
+# list is read once (or again if the file changes).
+registry = {}
+registry_lock = threading.Lock()
+
+
+def get_station_list(station_list_file, log=""):
+    """ Return the shared RAOBstation_list read from station_list_file """
+    path = os.path.abspath(station_list_file)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+
+    with registry_lock:
+        if path not in registry or registry[path][0] != mtime:
+            stationList = RAOBstation_list(log)
+            stationList.read(path)
+            if stationList.error != "":
+                return(stationList)  # Don't keep failed reads
+            registry[path] = (mtime, stationList)
+        return(registry[path][1])
 
 
 if __name__ == "__main__":
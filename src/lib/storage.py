@@ -0,0 +1,185 @@
+###############################################################################
+# Optional compressed storage of retrieved TEXT:LIST files. The files are
+# repetitive ASCII wrapped in HTML, so compress to a fraction of their size.
+#
+# A compressed file is named by adding the usual suffix to the plain name:
+#   7267220190528122812.txt -> 7267220190528122812.txt.gz   (gzip)
+#                           -> 7267220190528122812.txt.zst  (zstd)
+# Readers open files with open_text, which finds and decompresses whichever
+# version exists, so they can keep using the plain name.
+#
+# gzip is in the Python standard library. zstd (faster, and smaller files)
+# needs the zstandard package: pip install zstandard
+#
+# is_complete checks that a file ends the way a complete file of its kind
+# does, to catch downloads that were cut short (see lib/rwget.py).
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import io
+import os
+import re
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compression methods and the suffix they add to file names
+SUFFIX = {'gzip': '.gz', 'zstd': '.zst'}
+
+# How a complete file of each kind ends, by the suffix of its plain name:
+# TEXT:LIST pages and the GIF:SKEWT HTML wrapper end with </HTML>, and GIF
+# images with the GIF trailer byte (0x3B, ';'). TEXT:CSV files have no end
+# marker, so must end with a whole row with as many fields as the header
+# (see is_whole_table). Other kinds aren't checked.
+TRAILERS = {'.txt': re.compile(rb'</HTML>\s*\Z', re.IGNORECASE),
+            '.html': re.compile(rb'</HTML>\s*\Z', re.IGNORECASE),
+            '.gif': re.compile(rb';\Z')}
+TABLES = {'.csv': b','}  # Separator of the fields in each kind of table
+TAIL = 64  # Bytes at the end of a file to look for the end marker in
+
+
+def available(method):
+    """ Return True if a compression method can be used here """
+    if method == 'zstd':
+        return(zstandard is not None)
+    return(method in SUFFIX or method == '')
+
+
+def find_file(path):
+    """
+    Return the stored version of a file: the file itself if it exists,
+    otherwise the compressed file with that name. Returns None if there is
+    neither.
+    """
+    if os.path.isfile(path):
+        return(path)
+    for suffix in SUFFIX.values():
+        if os.path.isfile(path + suffix):
+            return(path + suffix)
+    return(None)
+
+
+def get_plain(path):
+    """ Return the plain name of a stored file """
+    method = get_method(path)
+    if method == '':
+        return(path)
+    return(path[:-len(SUFFIX[method])])
+
+
+def get_method(path):
+    """ Return the compression method of a file, from its name """
+    for method, suffix in SUFFIX.items():
+        if path.endswith(suffix):
+            return(method)
+    return('')
+
+
+def open_text(path):
+    """
+    Open a stored text file for reading, decompressing it if needed. path
+    may be the plain name of a compressed file.
+    """
+    stored = find_file(path)
+    if stored is None:
+        raise FileNotFoundError("No such file: '" + path + "'")
+
+    method = get_method(stored)
+    if method == 'gzip':
+        return(gzip.open(stored, 'rt'))
+    elif method == 'zstd':
+        if zstandard is None:
+            raise OSError("Reading " + stored + " requires the zstandard " +
+                          "package")
+        return(io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(
+            open(stored, 'rb'), closefd=True)))
+    return(open(stored))
+
+
+def read_text(path):
+    """ Return the contents of a stored text file """
+    with open_text(path) as f:
+        return(f.read())
+
+
+def read_bytes(path):
+    """ Return the contents of a stored file, decompressed """
+    stored = find_file(path)
+    if stored is None:
+        raise FileNotFoundError("No such file: '" + path + "'")
+    with open(stored, 'rb') as f:
+        data = f.read()
+
+    method = get_method(stored)
+    if method == 'gzip':
+        return(gzip.decompress(data))
+    elif method == 'zstd':
+        if zstandard is None:
+            raise OSError("Reading " + stored + " requires the zstandard " +
+                          "package")
+        return(zstandard.ZstdDecompressor().decompressobj().decompress(data))
+    return(data)
+
+
+def is_complete(data, path):
+    """
+    Return True if data, the contents of a file, ends the way a complete
+    file of its kind does (see TRAILERS and TABLES).
+
+    Parameters:
+        data: the (decompressed) contents of the file
+        path: the name of the file, plain or stored
+    """
+    suffix = os.path.splitext(get_plain(path))[1]
+    if suffix in TABLES:
+        return(is_whole_table(data, TABLES[suffix]))
+    trailer = TRAILERS.get(suffix)
+    if trailer is None:
+        return(True)
+    return(trailer.search(data[-TAIL:]) is not None)
+
+
+def is_whole_table(data, separator):
+    """ Return True if a table has a header and at least one row, and ends
+    with a whole row: a line ending in a newline, with as many fields as
+    the header """
+    lines = data.strip(b'\r\n').splitlines()
+    if len(lines) < 2 or not data.endswith(b'\n'):
+        return(False)
+    return(lines[-1].count(separator) == lines[0].count(separator))
+
+
+def compress(path, method, level=None):
+    """
+    Compress a file in place, replacing it with the compressed file.
+
+    Parameters:
+        path: the plain file to compress
+        method: 'gzip' or 'zstd'
+        level: compression level, or None for the default
+
+    Returns:
+        the name of the compressed file
+    """
+    outfile = path + SUFFIX[method]
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if method == 'gzip':
+        data = gzip.compress(data, 9 if level is None else level)
+    else:
+        data = zstandard.ZstdCompressor(
+            level=19 if level is None else level).compress(data)
+
+    # Write to a temporary file and rename, so a reader never sees a partly
+    # written file
+    with open(outfile + '.temp', 'wb') as f:
+        f.write(data)
+    os.replace(outfile + '.temp', outfile)
+    os.remove(path)
+    return(outfile)
@@ -0,0 +1,105 @@
+###############################################################################
+# Timeouts on network operations, so that a hung connection to the archive or
+# to the catalog FTP server costs seconds rather than the rest of the run.
+# Each operation (the probe, a download, a catalog ftp) allows a connect
+# timeout to connect, and a read timeout for each read of the answer, set
+# with --timeout CONNECT[,READ] (or timeout: in the config file).
+#
+# If the run has a deadline (--deadline), the timeouts are cut to the time
+# left, so the work in flight ends by the deadline and is left in the journal
+# for the next run (see lib/scheduler.py).
+#
+# Each operation that times out is counted in the run report, as timeouts
+# and timeouts_<operation> (see lib/metrics.py).
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import time
+import socket
+from urllib.error import URLError
+
+from lib.metrics import runmetrics
+
+CONNECT = 10.0  # Default seconds to connect
+READ = 60.0     # Default seconds to wait for each read
+MINIMUM = 0.1   # Shortest timeout, once the deadline is near or past
+
+
+def parse_timeout(value):
+    """
+    Parse timeouts given as "CONNECT[,READ]" seconds, e.g. "10,60". A blank
+    value, or a missing read timeout, gets the default.
+
+    Returns (connect, read). Raises ValueError if they aren't valid.
+    """
+    value = str(value).strip()
+    if value == '':
+        return((CONNECT, READ))
+    fields = value.split(',')
+    if len(fields) > 2:
+        raise ValueError("Timeout must be CONNECT[,READ] seconds. Got '" +
+                         value + "'")
+    connect = float(fields[0])
+    read = float(fields[1]) if len(fields) > 1 else READ
+    if connect <= 0 or read <= 0:
+        raise ValueError("Timeouts must be more than 0 seconds. Got '" +
+                         value + "'")
+    return((connect, read))
+
+
+def is_timeout(e):
+    """ Return True if an exception is a timeout, or a URLError caused by
+    one """
+    if isinstance(e, URLError):
+        e = e.reason
+    return(isinstance(e, socket.timeout))
+
+
+def timed_out(operation):
+    """ Count an operation that timed out """
+    runmetrics.count('timeouts')
+    runmetrics.count('timeouts_' + operation)
+
+
+class Timeouts():
+
+    def __init__(self):
+        """ The timeouts of the current run """
+        self.set()
+
+    def set(self, connect=CONNECT, read=READ, deadline=None):
+        """
+        Parameters:
+            connect: seconds to connect
+            read: seconds to wait for each read
+            deadline: time (seconds since the epoch) the run stops at, or
+                      None
+        """
+        self.connect = connect
+        self.read = read
+        self.deadline = deadline
+
+    def set_deadline(self, deadline):
+        self.deadline = deadline
+
+    def get_connect(self):
+        return(self.cap(self.connect))
+
+    def get_read(self):
+        return(self.cap(self.read))
+
+    def expired(self):
+        """ Return True if the deadline has been reached """
+        return(self.deadline is not None and time.time() >= self.deadline)
+
+    def cap(self, timeout):
+        """ Cut a timeout to the time left before the deadline """
+        if self.deadline is None:
+            return(timeout)
+        return(max(min(timeout, self.deadline - time.time()), MINIMUM))
+
+
+# Timeouts of the current run, set by RAOBget.get
+timeouts = Timeouts()
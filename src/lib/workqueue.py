@@ -0,0 +1,238 @@
+###############################################################################
+# A work queue of (station, time) RAOB retrievals kept in a directory, so a
+# large retrieval can be shared between any number of RAOBget processes on
+# any number of machines that mount the same (e.g. NFS) directory.
+#
+# Each task is a small JSON file that moves between subdirectories:
+#   todo/     waiting to be retrieved
+#   claimed/  being retrieved. The file is renamed to <task>@<worker>, and
+#             its modification time is the worker's heartbeat.
+#   done/     retrieved
+#   failed/   could not be retrieved
+# Tasks are claimed and completed with rename, which is atomic, so each task
+# is claimed by exactly one worker. If a worker dies, its heartbeat stops and
+# after the lease time any other worker moves the task back to todo/.
+#
+# Requests to the server from all the workers are limited to a shared rate by
+# handing out time slots: a worker may send a request in a slot once it has
+# created the slot's file in slots/ with O_EXCL, which only one worker can do.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import re
+import json
+import time
+import socket
+import threading
+from lib.messageHandler import printmsg
+
+STATES = ['todo', 'claimed', 'done', 'failed']
+
+# Default requests per second to the server across all workers, i.e. one
+# every 3 seconds. Each RAOB takes 2 to 4 requests (see RAOBtype.requests).
+RATE = 0.33
+
+# Seconds between checks for abandoned tasks once there are none left to claim
+POLL = 1.0
+
+
+class WorkQueue():
+
+    def __init__(self, queuedir, log="", lease=300, rate=RATE, worker=None):
+        """
+        Parameters:
+            queuedir: the shared queue directory. Created if needed.
+            lease: seconds without a heartbeat after which a claimed task is
+                   assumed abandoned and requeued
+            rate: maximum requests per second across all workers, or 0 for
+                  no limit
+            worker: name of this worker. Defaults to <hostname>.<pid>
+        """
+        self.queuedir = queuedir
+        self.log = log
+        self.lease = lease
+        self.rate = rate
+        self.worker = worker
+        if worker is None:
+            self.worker = socket.gethostname() + '.' + str(os.getpid())
+        for state in STATES + ['slots']:
+            os.makedirs(os.path.join(queuedir, state), exist_ok=True)
+
+    def get_path(self, state, name=''):
+        return(os.path.join(self.queuedir, state, name))
+
+    def get_name(self, task):
+        """
+        Return the file name of a task, e.g. 2019052812_72672_TEXT-LIST.json.
+        The raobtype is included so the same station and time may be queued
+        as several types.
+        """
+        return(task['year'] + task['month'] + task['day'] + task['hour'] +
+               '_' + task['stnm'] + '_' +
+               re.sub(r'[^A-Za-z0-9]', '-', task['raobtype']) + '.json')
+
+    def find(self, name):
+        """ Return the state of a task, or None if it isn't in the queue """
+        for state in STATES:
+            if state == 'claimed':
+                prefix = name + '@'
+                if any(f.startswith(prefix) for f in
+                       os.listdir(self.get_path(state))):
+                    return(state)
+            elif os.path.exists(self.get_path(state, name)):
+                return(state)
+        return(None)
+
+    def enqueue(self, tasks):
+        """
+        Add tasks to the queue. Tasks already in the queue, in any state,
+        are not added again, so the same plan can be enqueued twice.
+
+        Parameters:
+            tasks: list of dictionaries with keys stnm, raobtype, region,
+                   year, month, day and hour
+
+        Returns:
+            number of tasks added
+        """
+        added = 0
+        for task in tasks:
+            name = self.get_name(task)
+            if self.find(name) is not None:
+                continue
+            # Write to a temporary file and rename, so workers never see a
+            # partly written task
+            tmpfile = self.get_path('', '.' + name + '.' + self.worker)
+            with open(tmpfile, 'w') as f:
+                json.dump(task, f)
+            os.rename(tmpfile, self.get_path('todo', name))
+            added += 1
+        return(added)
+
+    def claim(self):
+        """
+        Claim the next task to retrieve.
+
+        Returns:
+            (name, task), or (None, None) if there are no tasks to do
+        """
+        for name in sorted(os.listdir(self.get_path('todo'))):
+            claimed = self.get_path('claimed', name + '@' + self.worker)
+            try:
+                os.rename(self.get_path('todo', name), claimed)
+            except FileNotFoundError:
+                continue  # Another worker claimed it first
+            os.utime(claimed)  # Start the lease now
+            with open(claimed) as f:
+                return(name, json.load(f))
+        return(None, None)
+
+    def get_claimed(self, name):
+        return(self.get_path('claimed', name + '@' + self.worker))
+
+    def heartbeat(self, name):
+        """ Renew the lease on a claimed task """
+        try:
+            os.utime(self.get_claimed(name))
+        except FileNotFoundError:
+            # Lease expired and the task was requeued
+            printmsg(self.log, "WARNING: Lost lease on task " + name)
+
+    def complete(self, name, state):
+        """ Move a claimed task to done, failed or back to todo """
+        try:
+            os.rename(self.get_claimed(name), self.get_path(state, name))
+        except FileNotFoundError:
+            printmsg(self.log, "WARNING: Lost lease on task " + name)
+
+    def requeue_stale(self):
+        """
+        Move tasks whose workers have stopped sending heartbeats back to
+        todo/. Returns the number of tasks requeued.
+        """
+        requeued = 0
+        now = time.time()
+        for claimed in os.listdir(self.get_path('claimed')):
+            path = self.get_path('claimed', claimed)
+            try:
+                if now - os.path.getmtime(path) < self.lease:
+                    continue
+                name = claimed.rsplit('@', 1)[0]
+                os.rename(path, self.get_path('todo', name))
+            except FileNotFoundError:
+                continue  # Completed, or requeued by another worker
+            printmsg(self.log, "WARNING: Requeued task " + name +
+                     " abandoned by worker " + claimed.rsplit('@', 1)[1])
+            requeued += 1
+        return(requeued)
+
+    def get_counts(self):
+        """ Return the number of tasks in each state """
+        return({state: len(os.listdir(self.get_path(state)))
+                for state in STATES})
+
+    def wait_turn(self, cancel_event=None):
+        """
+        Wait until this worker may send a request to the server without
+        exceeding the shared rate. Returns False if cancelled while waiting.
+        """
+        if self.rate <= 0:
+            return(True)
+        interval = 1.0 / self.rate
+        slot = int(time.time() / interval)
+        while True:
+            try:
+                fd = os.open(self.get_path('slots', str(slot)),
+                             os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                break
+            except FileExistsError:
+                slot += 1
+        self.cleanup_slots(slot - 10)
+
+        delay = slot * interval - time.time()
+        if delay > 0:
+            if cancel_event is not None:
+                return(not cancel_event.wait(delay))
+            time.sleep(delay)
+        return(True)
+
+    def cleanup_slots(self, before):
+        """ Remove the files of slots that are long past """
+        for slot in os.listdir(self.get_path('slots')):
+            if int(slot) < before:
+                try:
+                    os.remove(self.get_path('slots', slot))
+                except FileNotFoundError:
+                    pass
+
+
+class Heartbeat():
+
+    def __init__(self, queue, name):
+        """
+        Renew the lease on a claimed task in a background thread while it is
+        being retrieved, e.g.
+
+            with Heartbeat(queue, name):
+                retrieve(task)
+        """
+        self.queue = queue
+        self.name = name
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stop.wait(self.queue.lease / 3.0):
+            self.queue.heartbeat(self.name)
+
+    def __enter__(self):
+        self.thread.start()
+        return(self)
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
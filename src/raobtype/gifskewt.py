@@ -7,18 +7,28 @@
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
 import os
-import re
 import shutil
 
 import userlib.catalog
-from lib.rwget import RAOBwget
-from lib.stationlist import RAOBstation_list
+import raobtype.postprocess as postprocess
+from raobtype.raobtype import register
+from lib.rwget import RAOBwget, remove_meta
 from lib.raobroot import getrootdir
 from lib.messageHandler import printmsg
+from lib.metrics import runmetrics
 
 
 class RAOBgifskewt():
 
+    name = 'GIF:SKEWT'
+    code = "GIF%3ASKEWT"
+    display = 'image'
+    parse = None  # An image, not data
+    postprocess = [postprocess.to_catalog]
+    suffix = '.html'
+    requests = 4     # Probe and download, of the page and then the image
+    size = 39000     # Typical page plus image size (bytes)
+
     def __init__(self, log=""):
 
         self.log = log
@@ -28,7 +38,7 @@ class RAOBgifskewt():
         """ Build output filename for GIF:SKEWT data file. """
         self.outfile_html = request.get_stnm() + request.get_year() + \
             request.get_month() + request.get_begin() + request.get_end() + \
-            ".html"
+            self.suffix
 
     def get_outfile_html(self):
         """
@@ -43,73 +53,21 @@ class RAOBgifskewt():
         """
         Generate the request URL for a GIF:SKEWT request
         """
-        request.set_type("GIF:SKEWT")
+        request.set_type(self.name)
         return(self.rwget.get_url(request, self.log))
 
-    def get_station_info(self, request):
-        """ Read in the station metadata for the given station id/number """
-        station_list_file = getrootdir() + "/" + request.get_stnlist_file()
-
-        stationList = RAOBstation_list(self.log)
-        stationList.read(station_list_file)
-        if request.get_stnm().isdigit():
-            station = stationList.get_by_stnm(request.get_stnm())
-        else:
-            station = stationList.get_by_id(request.get_stnm())
-
-        # Should only get back one, unique station. If not, warn user
-        if (len(station) != 1):
-            printmsg(self.log, "WARNING: Found more than one station " +
-                     "matching request['stnm']")
-            for i in range(len(station)):
-                printmsg(self.log, str(station[i]))
-            printmsg(self.log, "Returning first station found")
-
-        return(station[0])
-
     def get_prod(self, request):
-        """ Build the product name required by the field catalog """
-
-        # Open the HTML file and read in the <TITLE> line
-        out = open(self.get_outfile_html())
-        line = out.readline()
-        while '<TITLE>' not in line:
-            line = out.readline()
-        if '<TITLE>' in line:
-            m = re.search(request.get_stnm()+' (.*) [Sounding]',
-                          line)
-            if m:
-                prod = m.group(1).replace(" ", "_")
-
-                # Get station metadata for use in reformatting product name
-                station = self.get_station_info(request)
-
-                # If we found the station by the number, then the id will still
-                # be in the title. Remove it.
-                if station['id'].rstrip() in prod:
-                    prod = prod.replace(station['id'].rstrip()+"_", "")
-
-                # I have seen some products with protected shell characters.
-                # Remove them here.
-                prod = prod.replace("(", "")  # Remove open parenthesis
-                prod = prod.replace(")", "")  # Remove close parenthesis
-                # ... add more as needed here ...
-
-                # For international skewts, set the product name to
-                # "Station_Name_CC" where CC is the two letter country code.
-                # For US stations use "Station_Name_ST" where ST it the two
-                # letter state code.
-                if (station['country'] == 'US'):
-                    prod += "_" + station['state']
-                else:
-                    prod += "_" + station['country']
-
-            else:
-                printmsg(self.log, "WARNING: Couldn't find product name. " +
-                         "Setting to temp")
-                prod = "temp"
-
-        out.close()
+        """ Look up the product name required by the field catalog (see
+        userlib/catalog.py) """
+        prod = userlib.catalog.get_prod(
+            request.get_stnm(), getrootdir() + "/" +
+            request.get_stnlist_file(),
+            userlib.catalog.parse_names(request.get_catalog_names()),
+            self.log)
+        if prod is None:
+            printmsg(self.log, "WARNING: Couldn't find product name. " +
+                     "Setting to temp")
+            prod = "temp"
 
         return(prod)
 
@@ -122,9 +80,12 @@ class RAOBgifskewt():
         """
         platform = "SkewT"
 
+        with runmetrics.span('get_prod'):
+            prod = self.get_prod(request)
+
         self.outfile_gif = "upperair." + platform + '.' + request.get_year() \
-            + request.get_month() + request.get_begin() + "00." + \
-            self.get_prod(request) + ".gif"
+            + request.get_month() + request.get_begin() + "00." + prod + \
+            ".gif"
 
     def get_outfile_gif(self):
         """
@@ -135,9 +96,15 @@ class RAOBgifskewt():
 
         return(self.outfile_gif)
 
+    def get_target(self, request):
+        """ Return the name of the file a RAOB is stored in: the image, not
+        the HTML wrapper """
+        self.set_outfile_gif(request)
+        return(self.get_outfile_gif())
+
     def get_gif_url(self, request):
 
-        url = "http://weather.uwyo.edu/upperair/images/"
+        url = request.get_server() + "/upperair/images/"
         url += request.get_year()
         url += request.get_month()
         url += request.get_begin() + "."
@@ -194,8 +161,10 @@ class RAOBgifskewt():
             if app is not None:      # Force the GUI to redraw so log
                 app.processEvents()  # messages, etc are displayed
 
-            # Download gif image
-            gifstatus = self.rwget.get_data(url, outfile)
+            # Download gif image. It is an image, so is not checked for
+            # error messages.
+            gifstatus = self.rwget.get_data(url, outfile, validate=False,
+                                            refresh=request.get_refresh())
             if app is not None:      # Force the GUI to redraw so log
                 app.processEvents()  # messages, etc are displayed
 
@@ -215,9 +184,9 @@ class RAOBgifskewt():
             outfile = "upperair.SkewT.201905280000.Riverton_WY.gif"
 
         # If running in catalog mode, ftp files to catalog dir
-        if request.get_catalog() is True and gifstatus:
-            ftpstatus = userlib.catalog.to_ftp(outfile, request, self.log)
-            printmsg(self.log, ftpstatus)
+        if gifstatus:
+            gifstatus, outfile = postprocess.run(self.postprocess, request,
+                                                 outfile, self.log)
             if app is not None:      # Force the GUI to redraw so log
                 app.processEvents()  # messages, etc are displayed
 
@@ -228,3 +197,7 @@ class RAOBgifskewt():
         if os.path.isfile(self.get_outfile_html()):
             os.remove(self.get_outfile_html())
             printmsg(self.log, 'Removed ' + self.get_outfile_html())
+        remove_meta(self.get_outfile_html())
+
+
+register(RAOBgifskewt)
@@ -0,0 +1,50 @@
+###############################################################################
+# Steps run on each retrieved file, listed by each RAOB type in its
+# postprocess attribute (see raobtype.py). Each step is called as
+#   step(request, outfile, log)
+# and returns (status, outfile): status False to stop processing the file,
+# and the name of the file (which may have changed) for the next step.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import userlib.mtp
+import userlib.catalog
+import lib.storage as storage
+from lib.messageHandler import printmsg
+from lib.metrics import runmetrics
+
+
+def strip_mtp(request, outfile, log=""):
+    """ If --mtp is set, reduce a TEXT:LIST file to what the MTP needs """
+    if request.get_mtp() is not True:
+        return(True, outfile)
+    # status here returns true if RAOB file is not empty
+    return(userlib.mtp.strip_html(request, outfile, log), outfile)
+
+
+def compress(request, outfile, log=""):
+    """ Store the file compressed, if requested (see lib/storage.py) """
+    if request.get_compress() == '':
+        return(True, outfile)
+    with runmetrics.span('compress'):
+        return(True, storage.compress(outfile, request.get_compress()))
+
+
+def to_catalog(request, outfile, log=""):
+    """ If running in catalog mode, ftp the file to the catalog dir """
+    if request.get_catalog() is True:
+        ftpstatus = userlib.catalog.to_ftp(outfile, request, log)
+        printmsg(log, ftpstatus)
+    return(True, outfile)
+
+
+def run(steps, request, outfile, log=""):
+    """ Run each step on outfile in turn. Returns (status, outfile). """
+    status = True
+    for step in steps:
+        status, outfile = step(request, outfile, log)
+        if not status:
+            break
+    return(status, outfile)
@@ -1,10 +1,33 @@
 ###############################################################################
 #
-# This python dictionary stores the list of data/imagery types available for
-# retrieval via the University of Wyoming Radiosonde data archive. The type
-# identifier is used in the retrieval URL, e.g.
+# The registry of data/imagery types available for retrieval via the
+# University of Wyoming Radiosonde data archive. The type identifier is used
+# in the retrieval URL, e.g.
 #   http://weather.uwyo.edu/cgi-bin/sounding?type=TEXT%3ALIST&...
 #
+# Each type is retrieved by a class (e.g. RAOBtextlist in textlist.py) which
+# registers itself here when its module is imported. To add a type, write a
+# class with:
+#   name         type name, e.g. 'TEXT:LIST'
+#   code         URL type identifier, e.g. "TEXT%3ALIST"
+#   display      how the GUI shows a retrieved RAOB: 'skewt' (plot the data),
+#                'image', or None (not shown)
+#   parse        function returning a list of Soundings (see sounding.py)
+#                parsed from the text retrieved, or None if not data
+#   postprocess  list of functions run on each retrieved file, in order (see
+#                postprocess.py)
+#   suffix       suffix of the file a RAOB is downloaded to, named
+#                <stnm><yyyy><mm><begin ddhh><end ddhh><suffix>
+#   requests     number of requests sent to retrieve one RAOB
+#   size         typical number of bytes retrieved for one RAOB
+#   retrieve(app, request, log)  retrieve a RAOB. Returns (status, outfile).
+#                status is True if a new file was retrieved.
+#   get_target(request)  return the name of the file a RAOB is stored in
+#                (before any compression), without retrieving it
+#   cleanup()    remove any intermediate files
+#   rwget        the RAOBwget used to retrieve, so the outcome can be checked
+# then register it and add its module to types.py.
+#
 # Written in Python 3
 #
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
@@ -12,6 +35,24 @@
 
 RAOBtype = {
     # Type name: URL type identifier
-    'TEXT:LIST': "TEXT%3ALIST",
-    'GIF:SKEWT': "GIF%3ASKEWT",
 }
+
+# Type name: class that retrieves it
+retrievers = {}
+
+
+def register(retriever):
+    """ Add a RAOB type to the registry """
+    RAOBtype[retriever.name] = retriever.code
+    retrievers[retriever.name] = retriever
+
+
+def get_retriever(name):
+    """ Return the class that retrieves a RAOB type, or None if there isn't
+    one """
+    return(retrievers.get(name))
+
+
+def get_types():
+    """ Return the names of the registered RAOB types """
+    return(list(retrievers))
@@ -2,18 +2,34 @@
 # Use a pandas dataframe, matplotlib, and metpy to plot a skewt of the
 # downloaded TEXT:LIST formatted RAOB data.
 #
+# Drawing the axes and special lines of a skewt takes most of the time and
+# memory of a plot, and they are the same for every sounding. So a Skewt can
+# set up its figure once (setup) and then plot each sounding by updating the
+# temperature and dewpoint lines in place (update). SkewtPool keeps a few
+# set up for plotting off-screen, e.g. for the gallery.
+#
 # Written in Python 3
 #
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
+import io
 import re
+import threading
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.backends.backend_qt5agg import (
         FigureCanvasQTAgg as FigureCanvas)
 
 from metpy.plots import SkewT
 from metpy.units import units
+from lib.storage import read_text
+
+
+POOL_SIZE = 4  # Off-screen Skewts kept for reuse
 
 
 class Skewt():
@@ -21,6 +37,8 @@ class Skewt():
     def __init__(self, app):
         """ Import link to GUI """
         self.app = app
+        self.skew = None  # SkewT plot, once set up for updating in place
+        self.agg = None   # Off-screen canvas, once rendered
 
     def read_data(self, datafile, mtp):
         """ Read in data from the downloaded TEXT:LIST-formatted RAOB """
@@ -39,8 +57,13 @@ class Skewt():
             title_hdr_len = 1
             col_hdr_len = 4
 
+        # Read in contents of data file. It may be stored compressed (see
+        # lib/storage.py)
+        text = read_text(datafile)
+
         # Read in the title from the header.
-        title = pd.read_fwf(datafile, header=title_hdr_len, nrows=1).columns
+        title = pd.read_fwf(io.StringIO(text), header=title_hdr_len,
+                            nrows=1).columns
 
         # Remove the HTML
         self.title = title[0].replace('<H2>', '')
@@ -48,7 +71,8 @@ class Skewt():
 
         # Read in the column names from the header. For a description, see:
         # http://weather.uwyo.edu/upperair/columns.html
-        col_names = pd.read_fwf(datafile, header=col_hdr_len, nrows=1).columns
+        col_names = pd.read_fwf(io.StringIO(text), header=col_hdr_len,
+                                nrows=1).columns
         col_names = col_names[0].split()
 
         # Read the data from the data file into a pandas dataframe
@@ -62,23 +86,21 @@ class Skewt():
         #                    skiprows=lambda x: x not in header.match(x),
         #                    usecols=[0, 2, 3], names=col_names)
 
-        # Read in contents of data file
-        f = open(datafile, 'r')
-        data = f.readlines()
-        f.close()
-
-        # Create an empty data frame to hold data file
-        rdat = pd.DataFrame(columns=col_names)
+        data = text.splitlines()
 
         # Loop through data and remove lines that match header, i.e. remove
         # header/footer.
+        records = []
         for line in data:
             if not header.match(line):
                 # Skip lines with missing data
                 if (len(line.split())) == len(col_names):
-                    # Save good data lines to data frame
-                    rdat = rdat.append(pd.DataFrame.from_records([tuple(
-                                       line.split())], columns=col_names))
+                    # Save good data lines
+                    records.append(tuple(float(v) for v in line.split()))
+
+        # Build the data frame in one go (DataFrame.append copies the whole
+        # frame for every line, and no longer exists in pandas 2)
+        rdat = pd.DataFrame.from_records(records, columns=col_names)
 
         return(rdat)
 
@@ -86,33 +108,79 @@ class Skewt():
         """ Create a figure instance to hold the plot """
         self.fig = plt.figure(figsize=(9, 9))
 
-    def create_skewt(self, rdat):
-        """ Create the SkewT plot inside the figure instance """
-
-        # Extract pressure from data
-        P = rdat['PRES'].values * units.hPa
-
-        # Extract temperature from data
-        T = rdat['TEMP'].values * units.degC
-
-        # Extract dewpt from data
-        Td = rdat['DWPT'].values * units.degC
-
-        skew = SkewT(self.fig, rotation=45)
+    def new_fig(self, dpi=100):
+        """ Create a figure that isn't managed by pyplot, so is freed with
+        the Skewt rather than by close(), and set it up to plot soundings in
+        place """
+        self.fig = Figure(figsize=(9, 9), dpi=dpi)
+        self.setup()
+
+    def setup(self):
+        """ Draw the parts of the plot that are the same for every sounding,
+        and create the temperature and dewpoint lines for update to fill in
+        """
+        self.skew = SkewT(self.fig, rotation=45)
         # Change to read in min/max from data arrays??
-        skew.ax.set_ylim(1000, 100)
-        skew.ax.set_xlim(-40, 80)
-        skew.ax.set_title(self.title)
-        skew.plot(P, T, 'r', linewidth=2)
-        skew.plot(P, Td, 'g', linewidth=2)
+        self.skew.ax.set_ylim(1000, 100)
+        self.skew.ax.set_xlim(-40, 80)
+        self.skew.ax.set_xlabel(str(units.degC))
+        self.skew.ax.set_ylabel(str(units.hPa))
+        self.temp, = self.skew.plot(np.array([]), np.array([]), 'r',
+                                    linewidth=2)
+        self.dwpt, = self.skew.plot(np.array([]), np.array([]), 'g',
+                                    linewidth=2)
 
         # Plot a zero degree isotherm
-        skew.ax.axvline(0, color='c', linestyle='--', linewidth=2)
+        self.skew.ax.axvline(0, color='c', linestyle='--', linewidth=2)
 
         # Add the relevant special lines
-        skew.plot_dry_adiabats()
-        skew.plot_moist_adiabats()
-        skew.plot_mixing_lines()
+        self.skew.plot_dry_adiabats()
+        self.skew.plot_moist_adiabats()
+        self.skew.plot_mixing_lines()
+
+    def update(self, rdat):
+        """ Plot a sounding in place of the last one """
+        self.skew.ax.set_title(self.title)
+        self.temp.set_data(rdat['TEMP'].values, rdat['PRES'].values)
+        self.dwpt.set_data(rdat['DWPT'].values, rdat['PRES'].values)
+
+    def create_skewt(self, rdat):
+        """ Create the SkewT plot inside the figure instance """
+        self.setup()
+        self.update(rdat)
+
+    def render(self, rdat, dpi=100):
+        """
+        Draw the skewt into an off-screen figure. Doesn't use pyplot, so can
+        be called outside the GUI thread. Returns the RGBA pixels of the
+        plot, and its width and height. The figure is set up on the first
+        call and reused after.
+        """
+        if self.agg is None:
+            self.new_fig(dpi)
+            self.agg = FigureCanvasAgg(self.fig)
+            self.backgrounds = {}  # dpi -> the plot without a sounding
+        self.fig.set_dpi(dpi)
+        if dpi not in self.backgrounds:
+            self.backgrounds[dpi] = self.get_background()
+        self.update(rdat)
+
+        # Draw the sounding over a copy of the rest of the plot
+        self.agg.restore_region(self.backgrounds[dpi])
+        for artist in [self.skew.ax.title, self.temp, self.dwpt]:
+            self.fig.draw_artist(artist)
+        width, height = self.agg.get_width_height()
+        return(bytes(self.agg.buffer_rgba()), width, height)
+
+    def get_background(self):
+        """ Draw the plot without the sounding and return a copy of it """
+        artists = [self.skew.ax.title, self.temp, self.dwpt]
+        for artist in artists:
+            artist.set_visible(False)
+        self.agg.draw()
+        for artist in artists:
+            artist.set_visible(True)
+        return(self.agg.copy_from_bbox(self.fig.bbox))
 
     def set_canvas(self):
         """ Link the canvas to the calling GUI (if extant) """
@@ -133,6 +201,41 @@ class Skewt():
         plt.close()
 
 
+class SkewtPool():
+
+    def __init__(self, size=POOL_SIZE):
+        """
+        A few off-screen Skewts, each set up once and reused to render any
+        number of soundings. Each is used by one thread at a time; threads
+        wait if all size are in use.
+        """
+        self.size = size
+        self.cond = threading.Condition()
+        self.free = []   # Skewts not in use
+        self.count = 0   # Skewts created
+
+    @contextmanager
+    def get(self):
+        """ Use a Skewt from the pool, e.g.
+            with pool.get() as skewt:
+                pixels, width, height = skewt.render(rdat)
+        """
+        with self.cond:
+            while not self.free and self.count >= self.size:
+                self.cond.wait()
+            if self.free:
+                skewt = self.free.pop()
+            else:
+                skewt = Skewt(None)
+                self.count += 1
+        try:
+            yield(skewt)
+        finally:
+            with self.cond:
+                self.free.append(skewt)
+                self.cond.notify()
+
+
 if __name__ == "__main__":
     """
     This class can run independently on a TEXT:LIST file and create
@@ -0,0 +1,206 @@
+###############################################################################
+# Parse TEXT:LIST formatted RAOB data, as downloaded from the University of
+# Wyoming Radiosonde Archive (or stripped for the MTP), into numeric arrays
+# for analysis. A file may hold several soundings.
+#
+# The data columns are described at
+#   http://weather.uwyo.edu/upperair/columns.html
+# Each is 7 characters wide. Missing values are left blank, and are returned
+# as NaN.
+#
+# TEXT:CSV data has the same columns, without the HTML around them: a line of
+# column names, a line of units, then one comma-separated line per level.
+# This layout is assumed from the TEXT:LIST columns; it has not been checked
+# against a response captured from the archive (the fixture in test/data and
+# test/uwyoserver.py follow the same assumption). So the parser is lenient:
+# lines without commas (e.g. any HTML around the data) are ignored, the units
+# line is optional, and rows that don't match the header are skipped.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import re
+import datetime
+import numpy as np
+from lib.storage import read_text
+
+WIDTH = 7  # Width of each data column in characters
+
+# HTML tags to strip from the title
+tags = re.compile(r'<[^>]*>')
+
+
+class Sounding():
+
+    def __init__(self, title=""):
+        self.title = title  # e.g. 72672 RIW Riverton Observations at 12Z...
+        self.columns = []   # Column names, e.g. PRES, HGHT, TEMP, DWPT...
+        self.units = []     # Column units, e.g. hPa, m, C, C...
+        self.data = np.empty((0, 0))  # levels x columns, NaN if missing
+        self.info = {}      # Station information and sounding indices
+        self.skipped = 0    # Rows of data that couldn't be parsed
+
+    def get(self, name):
+        """ Return a column of data by name, or NaNs if not in sounding """
+        if name in self.columns:
+            return(self.data[:, self.columns.index(name)])
+        return(np.full(self.data.shape[0], np.nan))
+
+    def get_station(self):
+        """ Return the station number """
+        return(self.info.get('Station number', ''))
+
+    def get_stnid(self):
+        """ Return the station identifier """
+        return(self.info.get('Station identifier', ''))
+
+    def get_time(self):
+        """ Return the observation time as a datetime, or None """
+        obstime = self.info.get('Observation time', '')
+        try:
+            return(datetime.datetime.strptime(obstime, '%y%m%d/%H%M'))
+        except ValueError:
+            return(None)
+
+    def get_index(self, name):
+        """ Return a sounding index, e.g. 'Station latitude' as a float """
+        try:
+            return(float(self.info[name]))
+        except (KeyError, ValueError):
+            return(np.nan)
+
+
+def parse_row(line, ncol):
+    """ Parse one fixed-width row of data. Blank values are returned as NaN
+    """
+    row = []
+    for i in range(ncol):
+        value = line[i * WIDTH:(i + 1) * WIDTH].strip()
+        row.append(float(value) if value else np.nan)
+    return(row)
+
+
+def parse_textlist(text):
+    """
+    Parse the soundings in a TEXT:LIST formatted string.
+
+    Returns a list of Sounding instances.
+    """
+    soundings = []
+    sounding = None
+    dashes = 0    # Number of dashed lines seen in this sounding
+    rows = []
+    section = ''  # 'data' or 'info'
+
+    for line in text.splitlines():
+        if '<H2>' in line:
+            # Start of a new sounding
+            sounding = Sounding(tags.sub('', line).strip().strip('"'))
+            soundings.append(sounding)
+            dashes = 0
+            rows = []
+            section = ''
+        elif sounding is None:
+            continue
+        elif line.startswith('---'):
+            # Dashed lines above and below the column headers
+            dashes += 1
+            if dashes == 2:
+                section = 'data'
+        elif dashes == 1 and sounding.columns == []:
+            sounding.columns = line.split()
+        elif dashes == 1:
+            sounding.units = line.split()
+        elif line.startswith('</PRE>'):
+            # End of the data, start of the station info (if any)
+            if section == 'data':
+                sounding.data = np.array(rows, dtype=float).reshape(
+                    len(rows), len(sounding.columns))
+                section = 'info'
+            else:
+                section = ''
+        elif section == 'data':
+            rows.append(parse_row(line, len(sounding.columns)))
+        elif section == 'info' and ':' in line:
+            key, value = line.split(':', 1)
+            sounding.info[key.strip()] = value.strip()
+
+    return(soundings)
+
+
+def parse_csv(text):
+    """
+    Parse the sounding in a TEXT:CSV formatted string. The station and time
+    are not in the data, so are not set in the sounding's info.
+
+    Rows whose fields aren't numbers, or don't match the header, are
+    skipped and counted in the sounding's skipped.
+
+    Returns a list of Sounding instances: one, or none if there is no data.
+    """
+    lines = [tags.sub('', line).strip() for line in text.splitlines()]
+    lines = [line.split(',') for line in lines if ',' in line]
+    if len(lines) < 2:
+        return([])
+
+    sounding = Sounding()
+    sounding.columns = lines[0]
+    rows = []
+    for fields in lines[1:]:
+        try:
+            if len(fields) != len(sounding.columns):
+                raise ValueError
+            rows.append([float(value) if value else np.nan
+                         for value in fields])
+        except ValueError:
+            if len(rows) == 0 and len(sounding.units) == 0:
+                sounding.units = fields
+            else:
+                sounding.skipped += 1
+    if len(rows) == 0:
+        return([])
+    sounding.data = np.array(rows, dtype=float)
+    return([sounding])
+
+
+def read_textlist(datafile):
+    """ Read the soundings in a TEXT:LIST formatted file, which may be
+    compressed (see lib/storage.py) """
+    return(parse_textlist(read_text(datafile)))
+
+
+def stack(soundings, names=('PRES', 'TEMP', 'DWPT'), require=None):
+    """
+    Stack a column of each sounding into a (n_soundings x n_levels) array,
+    padding shorter soundings with NaN, for vectorized calculations across
+    soundings.
+
+    Parameters:
+        soundings: list of Sounding instances
+        names: columns to stack
+        require: columns that must be present at a level to keep it. Levels
+                 missing any of them are dropped (so each row is packed from
+                 the first level). Defaults to names.
+
+    Returns a dictionary of arrays, keyed by column name.
+    """
+    if require is None:
+        require = names
+
+    # Find the levels to keep in each sounding
+    keep = []
+    for sounding in soundings:
+        ok = np.ones(sounding.data.shape[0], dtype=bool)
+        for name in require:
+            ok &= np.isfinite(sounding.get(name))
+        keep.append(ok)
+    nlev = max([int(ok.sum()) for ok in keep] + [0])
+
+    stacked = {}
+    for name in names:
+        stacked[name] = np.full((len(soundings), nlev), np.nan)
+        for i, sounding in enumerate(soundings):
+            column = sounding.get(name)[keep[i]]
+            stacked[name][i, 0:len(column)] = column
+    return(stacked)
@@ -0,0 +1,105 @@
+###############################################################################
+# Code specific to retrieving TEXT:CSV formatted data from the University of
+# Wyoming Radiosonde Archive. The data are the TEXT:LIST columns as plain
+# comma-separated text, without the HTML header, station information and
+# footer, so files are smaller and quicker to parse (see sounding.py for the
+# layout assumed).
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import shutil
+
+import raobtype.postprocess as postprocess
+from raobtype.raobtype import register
+from raobtype.sounding import parse_csv
+from lib.rwget import RAOBwget
+from lib.raobroot import getrootdir
+
+
+class RAOBtextcsv():
+
+    name = 'TEXT:CSV'
+    code = "TEXT%3ACSV"
+    display = None  # Not plotted in the GUI
+    parse = staticmethod(parse_csv)
+    postprocess = [postprocess.compress]
+    suffix = '.csv'
+    requests = 2     # Probe and download
+    size = 7300      # Typical file size (bytes)
+
+    def __init__(self, log=""):
+
+        self.log = log
+        self.rwget = RAOBwget(log)
+
+    def get_url(self, request):
+        """
+        Generate the request URL for a TEXT:CSV request
+        """
+        request.set_type(self.name)
+        return(self.rwget.get_url(request, self.log))
+
+    def set_outfile(self, request):
+        """ Build output filename for TEXT:CSV file. """
+        self.outfile = request.get_stnm() + request.get_year() + \
+            request.get_month() + request.get_begin() + request.get_end() + \
+            self.suffix
+
+    def get_outfile(self):
+        """
+        Returns:
+            self.outfile: the name of the file to which the received data
+            should be saved
+        """
+        return(self.outfile)
+
+    def get_target(self, request):
+        """ Return the name of the file a RAOB is stored in """
+        self.set_outfile(request)
+        return(self.get_outfile())
+
+    def retrieve(self, app, request, log=""):
+        """
+        Retrieves the requested data from the U Wyoming archive
+
+        Parameters:
+            request: A dictionary containing the metadata for the
+                     request.
+
+        Returns:
+            (status, outfile): status is True if new data was retrieved.
+            outfile is the name of the retrieved file.
+        """
+        self.set_outfile(request)
+        outfile = self.get_outfile()
+
+        # If in test mode, copy file from data dir to simulate download...
+        if request.get_test() is True:
+            shutil.copyfile(getrootdir() +
+                            '/test/data/7267220190528122812.csv.ctrl',
+                            '7267220190528122812.csv')
+            return(False, '7267220190528122812.csv')
+
+        # ...else download data
+        url = self.get_url(request)
+        if app is not None:      # Force the GUI to redraw so log
+            app.processEvents()  # messages, etc are displayed
+
+        status = self.rwget.get_data(url, outfile,
+                                     refresh=request.get_refresh())
+
+        # Compress, ...
+        if status:
+            status, outfile = postprocess.run(self.postprocess, request,
+                                              outfile, self.log)
+
+        return(status, outfile)
+
+    def cleanup(self):
+        """ There are no intermediate files to remove """
+        pass
+
+
+register(RAOBtextcsv)
@@ -9,6 +9,9 @@
 import shutil
 
 import userlib.mtp
+import raobtype.postprocess as postprocess
+from raobtype.raobtype import register
+from raobtype.sounding import parse_textlist
 from lib.rwget import RAOBwget
 # from lib.messageHandler import printmsg
 # If want to print status messages, use printmsg(self.log, msg)
@@ -16,6 +19,15 @@ from lib.rwget import RAOBwget
 
 class RAOBtextlist():
 
+    name = 'TEXT:LIST'
+    code = "TEXT%3ALIST"
+    display = 'skewt'
+    parse = staticmethod(parse_textlist)
+    postprocess = [postprocess.strip_mtp, postprocess.compress]
+    suffix = '.txt'
+    requests = 2     # Probe and download
+    size = 12700     # Typical file size (bytes)
+
     def __init__(self, log=""):
 
         self.log = log
@@ -26,7 +38,7 @@ class RAOBtextlist():
         Generate the request URL for a TEXT:LIST request
         """
 
-        request.set_type("TEXT:LIST")
+        request.set_type(self.name)
         url = self.rwget.get_url(request, self.log)
 
         return(url)
@@ -46,7 +58,7 @@ class RAOBtextlist():
         else:
             self.outfile = request.get_stnm() + request.get_year() + \
                 request.get_month() + request.get_begin() + request.get_end() \
-                + ".txt"
+                + self.suffix
 
     def get_outfile(self):
         """
@@ -57,6 +69,11 @@ class RAOBtextlist():
 
         return(self.outfile)
 
+    def get_target(self, request):
+        """ Return the name of the file a RAOB is stored in """
+        self.set_outfile(request)
+        return(self.get_outfile())
+
     def retrieve(self, app, request, log=""):
         """
         Retrieves the requested data from the U Wyoming archive
@@ -92,10 +109,19 @@ class RAOBtextlist():
                 app.processEvents()  # messages, etc are displayed
 
             # status here returns true if successfully downloaded a RAOB
-            status = self.rwget.get_data(url, outfile)
+            status = self.rwget.get_data(url, outfile,
+                                         refresh=request.get_refresh())
 
-            if request.get_mtp() is True and status:
-                # status here returns true if RAOB file is not empty
-                status = userlib.mtp.strip_html(request, outfile, self.log)
+            # Strip for the MTP, compress, ...
+            if status:
+                status, outfile = postprocess.run(self.postprocess, request,
+                                                  outfile, self.log)
 
         return(status, outfile)
+
+    def cleanup(self):
+        """ There are no intermediate files to remove """
+        pass
+
+
+register(RAOBtextlist)
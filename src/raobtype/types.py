@@ -0,0 +1,11 @@
+###############################################################################
+# Import the built-in RAOB types so they are registered (see raobtype.py).
+# Import this module before listing the registered types.
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import raobtype.textlist  # noqa: F401
+import raobtype.gifskewt  # noqa: F401
+import raobtype.textcsv  # noqa: F401
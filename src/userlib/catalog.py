@@ -2,14 +2,133 @@
 # Code specific to downloading GIF:SKEWT images from the University of Wyoming
 # Radiosonde Archive for import into the EOL field catalog
 #
+# The catalog names each image by a product name for its station, e.g.
+# Riverton_WY: the station name as the archive titles its pages, with the
+# state for US stations or the country for others. The name is built from the
+# station description in the master station list: the part before any '/'
+# (GJT is GRAND_JUNCTION/WALKER, titled Grand Junction), in title case unless
+# it is already mixed case, keeping names like McGrath and Arhangel'sk
+# intact. The product names of every station in a master station list are
+# built once, when it is read, and looked up by station number or id. Names
+# that should differ are given in the config file, e.g.
+#   catalog_names: "72672=Riverton_WY 89009=Amundsen-Scott_AQ"
+# or as a YAML mapping of station number or id to name.
+#
 # Written in Python 3
 #
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
 import os
+import re
+import socket
 import shutil
+import threading
 from ftplib import FTP
 from lib.config import config
+from lib.metrics import runmetrics
+from lib.timeouts import timeouts, timed_out
+from lib.stationlist import get_station_list
+
+# Product names, by station list file: path -> (station list, names)
+prod_names = {}
+prod_lock = threading.Lock()
+
+# Words of a station name, e.g. ST, HUBERT and ARHANGEL'SK, and names that
+# begin with Mc, e.g. Mcgrath
+words = re.compile(r"[A-Za-z]+('[A-Za-z]+)?")
+mc = re.compile(r"\bMc([a-z])")
+
+
+def get_name(description):
+    """ Return a station's name as the archive titles its pages, from its
+    description in the master station list, e.g. GRAND_JUNCTION/WALKER ->
+    Grand Junction """
+    name = description.split('/')[0].replace("_", " ").strip()
+    if name.isupper():
+        name = words.sub(lambda m: m.group(0).capitalize(), name)
+        name = mc.sub(lambda m: "Mc" + m.group(1).upper(), name)
+    return(name)
+
+
+def get_prod_name(station):
+    """ Build the catalog product name of a station from its metadata """
+    prod = get_name(station['description']).replace(" ", "_")
+
+    # I have seen some products with protected shell characters.
+    # Remove them here.
+    prod = prod.replace("(", "")  # Remove open parenthesis
+    prod = prod.replace(")", "")  # Remove close parenthesis
+    # ... add more as needed here ...
+
+    # For international skewts, set the product name to
+    # "Station_Name_CC" where CC is the two letter country code.
+    # For US stations use "Station_Name_ST" where ST it the two
+    # letter state code.
+    if (station['country'] == 'US'):
+        prod += "_" + station['state']
+    else:
+        prod += "_" + station['country']
+    return(prod)
+
+
+def build_prod_names(stationList):
+    """ Return a dictionary of station number and id -> (number, id,
+    product name) for every station in a station list. If several stations
+    share a number or id, the first is used. """
+    names = {}
+    for station in stationList.station_list:
+        entry = (station['number'].strip(), station['id'].strip(),
+                 get_prod_name(station))
+        for key in entry[0:2]:
+            if key != '':
+                names.setdefault(key, entry)
+    return(names)
+
+
+def get_prod_names(station_list_file, log=""):
+    """ Return the product names of the stations in a master station list
+    (see build_prod_names), built when the list is first read """
+    path = os.path.abspath(station_list_file)
+    with runmetrics.span('station_table'):
+        stationList = get_station_list(path, log)
+    with prod_lock:
+        if path not in prod_names or prod_names[path][0] is not stationList:
+            prod_names[path] = (stationList, build_prod_names(stationList))
+        return(prod_names[path][1])
+
+
+def parse_names(value):
+    """ Parse product name overrides, given as a mapping or as e.g.
+    "72672=Riverton_WY 72476=Grand_Junction_CO", separated by spaces or
+    semicolons. Returns a dictionary of station -> product name """
+    if isinstance(value, dict):
+        return(dict([(str(stn).strip(), str(prod).strip())
+                     for (stn, prod) in value.items()]))
+    names = {}
+    for entry in str(value).replace(';', ' ').split():
+        stn, prod = entry.split('=', 1)
+        names[stn.strip()] = prod.strip()
+    return(names)
+
+
+def get_prod(stnm, station_list_file, overrides=None, log=""):
+    """
+    Return the catalog product name of a station, or None if it isn't in the
+    master station list or the overrides.
+
+    Parameters:
+        stnm: station number or id
+        station_list_file: the master station list
+        overrides: dictionary of station number or id -> product name
+    """
+    if overrides is None:
+        overrides = {}
+    entry = get_prod_names(station_list_file, log).get(stnm.strip())
+    keys = [stnm.strip()] + ([] if entry is None else list(entry[0:2]))
+    for key in keys:
+        if key in overrides:
+            return(overrides[key])
+    return(None if entry is None else entry[2])
 
 
 def to_ftp(outfile, request, log=""):
@@ -38,16 +157,26 @@ def to_ftp(outfile, request, log=""):
         if ftp_dir is None:
             return("Could not FTP files")
 
-        # Connect to server and put new file
+        # Connect to server and put new file, with the timeouts of the run
+        # (see lib/timeouts.py)
         # ftp = FTP(ftp_server,'USERNAME','PASSWORD')
         try:
-            ftp = FTP(ftp_server, 'anonymous', '')
-            ftp.cwd(ftp_dir)
-            f = open(outfile, 'rb')
-            ftp.storbinary(f'{"STOR "}' + outfile, f)
-            ftp.quit()
+            with runmetrics.span('ftp'):
+                ftp = FTP(ftp_server, 'anonymous', '',
+                          timeout=timeouts.get_connect())
+                ftp.sock.settimeout(timeouts.get_read())
+                ftp.timeout = timeouts.get_read()  # For the data connection
+                ftp.cwd(ftp_dir)
+                f = open(outfile, 'rb')
+                ftp.storbinary(f'{"STOR "}' + outfile, f)
+                ftp.quit()
             return("FTPd " + outfile + " to " + ftp_server + "/" + ftp_dir)
+        except socket.timeout:
+            timed_out('ftp')
+            runmetrics.count('ftp_failures')
+            return("ERROR: FTP transfer timed out for file " + outfile)
         except Exception:
+            runmetrics.count('ftp_failures')
             return("ERROR: FTP transfer failed for file " + outfile)
 
     elif ftp_status is False:
@@ -57,7 +186,8 @@ def to_ftp(outfile, request, log=""):
             return("Could not copy files")
 
         # Move downloaded image to dest file in ftp_dir
-        shutil.copyfile(outfile, cp_dir + "/" + outfile)
+        with runmetrics.span('cp'):
+            shutil.copyfile(outfile, cp_dir + "/" + outfile)
         return("copied " + outfile + " to " + cp_dir)
 
     else:  # ftp_status is None
@@ -10,8 +10,12 @@
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
 import os
+import threading
 from lib.messageHandler import printmsg
+from lib.metrics import runmetrics
+from lib.storage import open_text
 from gui.fileselector import FileSelector
+from PyQt5.QtWidgets import QApplication
 
 
 def set_dir(log, request):
@@ -38,6 +42,14 @@ def set_outfile(request, dir, log):
 
     # Make sure directory exists. If not, warn user.
     if not os.path.exists(dir):
+        if QApplication.instance() is None or \
+                threading.current_thread() is not threading.main_thread():
+            # No GUI, or running in a background retrieval thread, which
+            # can't open dialogs. Log the error and skip this RAOB.
+            printmsg(log, "ERROR: Directory to write MTP data does not " +
+                     "exist: " + dir + ". Unable to save RAOB " +
+                     request.get_stnm() + ".")
+            return(False)
         printmsg(log, "ERROR: Directory to write MTP data does not exist: " +
                  dir + ". Choose another dir.")
         set_dir(log, request)
@@ -51,12 +63,20 @@ def set_outfile(request, dir, log):
 
 def strip_html(request, outfile, log):
     """ Strip unneeded HTML from the retrieved data. """
+    with runmetrics.span('strip_html'):
+        status = _strip_html(request, outfile, log)
+
+    return(status)
+
+
+def _strip_html(request, outfile, log):
+    """ Strip unneeded HTML from the retrieved data (untimed). """
     # The VB6 MTP sofware strips part of the HTML from the downloaded RAOB
     # file. We are preserving this format here for backward compatibility
     # so RAOBman VB code will still work.
 
     status = False  # Keep track of if found any data in the file
-    out = open(outfile)
+    out = open_text(outfile)
     temp = open(outfile + '.temp', 'w')
 
     # Loop over RAOBS in file
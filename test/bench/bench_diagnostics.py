@@ -0,0 +1,118 @@
+###############################################################################
+# Benchmark of the batch thermodynamic diagnostics (analysis/diagnostics.py)
+# against looping MetPy over soundings. Soundings are synthesized by
+# perturbing the test/data fixtures, so no archive is needed.
+#
+# MetPy is slow, so by default it is only run on a sample of the soundings
+# and its time for all of them is extrapolated.
+#
+# To run (from the src dir):
+#   python3 ../test/bench/bench_diagnostics.py [--soundings 10000]
+#       [--metpy_sample 20] [--json out.json]
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import sys
+import json
+import time
+import argparse
+import warnings
+import numpy as np
+
+benchdir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchdir, '..', '..', 'src'))
+from lib.raobroot import getrootdir  # noqa: E402
+from raobtype.sounding import read_textlist, stack  # noqa: E402
+from analysis.diagnostics import diagnostics  # noqa: E402
+
+FIXTURES = ['7267220190528122812.ctrl', '7267220190528002800.ctrl']
+
+
+def synthesize(count, seed=0):
+    """
+    Return pressure, temperature and dewpoint stacks of count soundings,
+    made by warming/cooling and moistening/drying the lower troposphere of
+    the fixtures by random amounts.
+    """
+    soundings = []
+    for fixture in FIXTURES:
+        soundings += read_textlist(os.path.join(getrootdir(), 'test', 'data',
+                                                fixture))
+    s = stack(soundings)
+
+    rng = np.random.default_rng(seed)
+    pick = rng.integers(0, len(soundings), count)
+    pres = s['PRES'][pick]
+    weight = np.clip((pres - 300) / 500, 0, 1)  # Perturb lower levels most
+    dt = rng.normal(0, 3, (count, 1)) * weight
+    temp = s['TEMP'][pick] + dt
+    dwpt = np.minimum(s['DWPT'][pick] + dt +
+                      rng.normal(0, 2, (count, 1)) * weight, temp)
+    return(pres, temp, dwpt)
+
+
+def run_metpy(pres, temp, dwpt):
+    """ Compute the same diagnostics by looping MetPy over soundings """
+    import metpy.calc as mpcalc
+    from metpy.units import units
+
+    warnings.simplefilter('ignore')
+    for i in range(pres.shape[0]):
+        ok = np.isfinite(pres[i])
+        p = pres[i][ok] * units.hPa
+        t = temp[i][ok] * units.degC
+        td = dwpt[i][ok] * units.degC
+        profile = mpcalc.parcel_profile(p, t[0], td[0])
+        mpcalc.lcl(p[0], t[0], td[0])
+        mpcalc.cape_cin(p, t, td, profile)
+        mpcalc.precipitable_water(p, td)
+        mpcalc.lifted_index(p, t, profile)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark batch thermodynamic diagnostics")
+    parser.add_argument('--soundings', type=int, default=10000,
+                        help='Number of soundings [10000]')
+    parser.add_argument('--metpy_sample', type=int, default=20,
+                        help='Number of soundings to run MetPy on, 0 to ' +
+                        'skip [20]')
+    parser.add_argument('--json', type=str, default='',
+                        help='Also write results to this JSON file')
+    args = parser.parse_args()
+
+    pres, temp, dwpt = synthesize(args.soundings)
+
+    start = time.perf_counter()
+    result = diagnostics(pres, temp, dwpt)
+    elapsed = time.perf_counter() - start
+
+    results = {'soundings': args.soundings,
+               'levels': pres.shape[1],
+               'batch_s': elapsed,
+               'batch_soundings_per_s': args.soundings / elapsed,
+               'mean_cape': float(np.mean(result['cape']))}
+
+    if args.metpy_sample > 0:
+        sample = min(args.metpy_sample, args.soundings)
+        start = time.perf_counter()
+        run_metpy(pres[0:sample], temp[0:sample], dwpt[0:sample])
+        per_sounding = (time.perf_counter() - start) / sample
+        results['metpy_soundings_per_s'] = 1 / per_sounding
+        results['metpy_s_extrapolated'] = per_sounding * args.soundings
+        results['speedup'] = per_sounding * args.soundings / elapsed
+
+    for key, value in results.items():
+        print('%-24s %s' % (key, value))
+
+    if args.json != '':
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,87 @@
+###############################################################################
+# Benchmark of the --plan dry run (lib/plan.py) on a large backfill: every
+# station in the master station list, every 3 hours for a number of days,
+# with some RAOBs already downloaded and availability history for all
+# stations. Nothing is retrieved.
+#
+# To run (from the src dir):
+#   python3 ../test/bench/bench_plan.py [--days 365] [--json out.json]
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+benchdir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchdir, '..', '..', 'src'))
+from lib.raobroot import getrootdir  # noqa: E402
+from lib.stationlist import get_station_list  # noqa: E402
+from lib.availability import Availability, MissingCache  # noqa: E402
+from lib.plan import Plan  # noqa: E402
+from raobtype.textlist import RAOBtextlist  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the --plan dry run")
+    parser.add_argument('--days', type=int, default=365,
+                        help='Number of days in the backfill [365]')
+    parser.add_argument('--json', type=str, default='',
+                        help='Also write results to this JSON file')
+    args = parser.parse_args()
+
+    stationList = get_station_list(getrootdir() + "/config/snstns.tbl")
+    stations = sorted(set([s['number'] for s in stationList.station_list
+                           if s['number'].strip()]))
+    start = datetime(2019, 1, 1)
+    times = [start + timedelta(hours=hr) for hr in range(0, 24 * args.days,
+                                                         3)]
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        # Some of the backfill is already downloaded
+        for valid in times[:len(times) // 10]:
+            ddhh = valid.strftime('%d%H')
+            for stn in stations[:100]:
+                open(os.path.join(tmpdir, stn + valid.strftime('%Y%m') +
+                                  ddhh + ddhh + '.txt'), 'w').close()
+        availability = Availability(tmpdir, '00,12')
+        missing = MissingCache(tmpdir)
+
+        t0 = time.perf_counter()
+        plan = Plan(RAOBtextlist, availability, missing, tmpdir)
+        for valid in times:
+            year = valid.strftime('%Y')
+            month = valid.strftime('%m')
+            day = valid.strftime('%d')
+            hour = valid.strftime('%H')
+            for stn in stations:
+                plan.add(stn, year, month, day, hour)
+        summary = plan.get_summary()
+        seconds = time.perf_counter() - t0
+    finally:
+        shutil.rmtree(tmpdir)
+
+    tasks = len(times) * len(stations)
+    results = {'tasks': tasks, 'seconds': seconds,
+               'tasks_per_s': tasks / seconds}
+    print("\n".join(summary[:6]))
+    print('%d tasks in %.2f s (%.0f tasks/s)' % (tasks, seconds,
+                                                 tasks / seconds))
+
+    if args.json != '':
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+
+    main()
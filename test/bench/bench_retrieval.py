@@ -0,0 +1,185 @@
+###############################################################################
+# End-to-end throughput benchmark of the RAOBget retrieval path. Runs the
+# CLI (TEXT:LIST), MTP and catalog (GIF:SKEWT) modes against the local UWyo
+# stand-in server and reports soundings/sec, p50/p99 latency per sounding and
+# bytes transferred, so changes to the retrieval path can be compared with
+# numbers.
+#
+# To run (from the src dir):
+#   python3 ../test/bench/bench_retrieval.py [--mode all] [--stations 20]
+#       [--times 2] [--latency 0.05] [--error_rate 0.1] [--json out.json]
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# The RAOBget code lives in ../../src and the stand-in server in ..
+benchdir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchdir, '..', '..', 'src'))
+sys.path.insert(0, os.path.join(benchdir, '..'))
+from lib.raobget import RAOBget  # noqa: E402
+from lib.raobroot import getrootdir  # noqa: E402
+from lib.stationlist import RAOBstation_list  # noqa: E402
+from uwyoserver import UWyoServer  # noqa: E402
+
+
+def percentile(values, pct):
+    """ Return the pct percentile of values (nearest rank) """
+    if len(values) == 0:
+        return(0.0)
+    values = sorted(values)
+    rank = int(round(pct / 100.0 * (len(values) - 1)))
+    return(values[rank])
+
+
+def get_stations(count):
+    """ Return the first count station numbers from the master list """
+    stationList = RAOBstation_list()
+    stationList.read(os.path.join(getrootdir(), 'config', 'snstns.tbl'))
+    stations = []
+    for station in stationList.station_list:
+        if station['number'].isdigit() and station['number'] != '99999' \
+                and station['number'] not in stations:
+            stations.append(station['number'])
+        if len(stations) == count:
+            break
+    return(stations)
+
+
+def configure(raob, mode, url, workdir):
+    """ Set up the request for the given benchmark mode """
+    request = raob.request
+    request.set_server(url)
+    request.set_stnlist_file('config/snstns.tbl')
+    request.set_region('')
+    request.set_freq('12')
+    request.set_type('TEXT:LIST')
+
+    if mode == 'mtp':
+        request.set_mtp(True)
+        request.set_mtp_dir(os.path.join(workdir, 'mtp'))
+        os.mkdir(request.get_mtp_dir())
+
+    elif mode == 'catalog':
+        request.set_type('GIF:SKEWT')
+        request.set_catalog(True)
+        cp_dir = os.path.join(workdir, 'catalog')
+        os.mkdir(cp_dir)
+        configfile = os.path.join(workdir, 'catalog.yml')
+        with open(configfile, 'w') as f:
+            f.write("station_list_file: 'config/snstns.tbl'\n")
+            f.write("ftp: False\n")
+            f.write("cp_dir: '" + cp_dir + "'\n")
+        request.set_config(configfile)
+
+
+def run(mode, stations, times, server):
+    """
+    Retrieve every station at every time once and time each retrieval.
+
+    Returns:
+        result: dictionary of benchmark statistics
+    """
+    cwd = os.getcwd()
+    workdir = tempfile.TemporaryDirectory()
+    os.chdir(workdir.name)
+
+    raob = RAOBget()
+    raob.log = ""
+    raob.widget = None
+    configure(raob, mode, server.get_url(), workdir.name)
+    server.reset()
+
+    latencies = []
+    ok = 0
+    start = time.perf_counter()
+    for valid in times:
+        raob.request.set_year(valid.strftime('%Y'))
+        raob.request.set_month(valid.strftime('%m'))
+        raob.request.set_begin(valid.strftime('%d'), valid.strftime('%H'))
+        raob.request.set_end(valid.strftime('%d'), valid.strftime('%H'))
+        for stn in stations:
+            raob.request.set_stnm(stn)
+            t0 = time.perf_counter()
+            status = raob.retrieve(None)
+            latencies.append(time.perf_counter() - t0)
+            if status:
+                ok += 1
+    elapsed = time.perf_counter() - start
+
+    os.chdir(cwd)
+    workdir.cleanup()
+
+    stats = server.get_stats()
+    return({'mode': mode,
+            'soundings': len(latencies),
+            'retrieved': ok,
+            'elapsed_s': elapsed,
+            'soundings_per_s': len(latencies) / elapsed if elapsed else 0.0,
+            'p50_ms': 1000 * percentile(latencies, 50),
+            'p99_ms': 1000 * percentile(latencies, 99),
+            'requests': stats['requests'],
+            'bytes': stats['bytes']})
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark RAOBget retrieval against a local UWyo " +
+                    "stand-in server")
+    parser.add_argument('--mode', type=str, default='all',
+                        choices=['all', 'cli', 'mtp', 'catalog'],
+                        help='Retrieval mode to benchmark [all]')
+    parser.add_argument('--stations', type=int, default=20,
+                        help='Number of stations to request [20]')
+    parser.add_argument('--times', type=int, default=2,
+                        help='Number of 12-hourly times to request [2]')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Server latency per request (seconds) [0]')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Max additional random latency (seconds) [0]')
+    parser.add_argument('--error_rate', type=float, default=0.0,
+                        help='Fraction of error pages served [0]')
+    parser.add_argument('--throttle', type=float, default=0.0,
+                        help='Server rate limit (requests/second) [0]')
+    parser.add_argument('--json', type=str, default='',
+                        help='Also write results to this JSON file')
+    args = parser.parse_args()
+
+    server = UWyoServer(latency=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate, throttle=args.throttle,
+                        seed=0)
+    server.start()
+
+    stations = get_stations(args.stations)
+    first = datetime(2019, 5, 28, 0)
+    times = [first + timedelta(hours=12 * i) for i in range(args.times)]
+
+    modes = ['cli', 'mtp', 'catalog'] if args.mode == 'all' else [args.mode]
+    results = [run(mode, stations, times, server) for mode in modes]
+    server.stop()
+
+    print('%-8s %9s %9s %10s %9s %9s %9s %11s' %
+          ('mode', 'soundings', 'retrieved', 'snd/s', 'p50 ms', 'p99 ms',
+           'requests', 'bytes'))
+    for r in results:
+        print('%-8s %9d %9d %10.2f %9.1f %9.1f %9d %11d' %
+              (r['mode'], r['soundings'], r['retrieved'],
+               r['soundings_per_s'], r['p50_ms'], r['p99_ms'],
+               r['requests'], r['bytes']))
+
+    if args.json != '':
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+
+    main()
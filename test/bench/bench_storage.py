@@ -0,0 +1,136 @@
+###############################################################################
+# Benchmark of compressed storage of TEXT:LIST files (lib/storage.py): size
+# on disk and read throughput of an archive stored plain, gzip and zstd
+# compressed. The archive is synthesized by varying the test/data fixtures,
+# so no retrieval is needed.
+#
+# To run (from the src dir):
+#   python3 ../test/bench/bench_storage.py [--files 2000] [--json out.json]
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+benchdir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchdir, '..', '..', 'src'))
+import lib.storage as storage  # noqa: E402
+from lib.raobroot import getrootdir  # noqa: E402
+from raobtype.sounding import read_textlist  # noqa: E402
+
+FIXTURES = ['7267220190528122812.ctrl', '7267220190528002800.ctrl']
+
+
+def synthesize(archive, count, seed=0):
+    """
+    Write count TEXT:LIST files to archive, made by perturbing the last
+    digit of the values in the fixtures so files are not identical.
+    """
+    texts = []
+    for fixture in FIXTURES:
+        with open(os.path.join(getrootdir(), 'test', 'data', fixture)) as f:
+            texts.append(f.read())
+    rng = random.Random(seed)
+    for i in range(count):
+        lines = []
+        for line in rng.choice(texts).splitlines(True):
+            if line[0:1] == ' ' and line[6:7].isdigit():
+                line = line[0:6] + str(rng.randint(0, 9)) + line[7:]
+            lines.append(line)
+        with open(os.path.join(archive, '%05d%s.txt' % (i, '2019052812')),
+                  'w') as f:
+            f.write(''.join(lines))
+
+
+def disk_usage(archive):
+    """ Return the bytes and disk blocks (in bytes) used by the files """
+    size = 0
+    blocks = 0
+    for name in os.listdir(archive):
+        st = os.stat(os.path.join(archive, name))
+        size += st.st_size
+        blocks += st.st_blocks * 512
+    return(size, blocks)
+
+
+def bench(plain, method, tmpdir):
+    """ Store a copy of the plain archive with method and time reading it """
+    if method == '':
+        archive = plain
+        write_s = 0.0
+    else:
+        archive = os.path.join(tmpdir, method)
+        shutil.copytree(plain, archive)
+        start = time.perf_counter()
+        for name in os.listdir(archive):
+            storage.compress(os.path.join(archive, name), method)
+        write_s = time.perf_counter() - start
+
+    size, blocks = disk_usage(archive)
+    files = sorted(os.listdir(plain))
+
+    # Read the raw text, then parse it as a reader would
+    start = time.perf_counter()
+    for name in files:
+        storage.read_text(os.path.join(archive, name))
+    read_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for name in files:
+        read_textlist(os.path.join(archive, name))
+    parse_s = time.perf_counter() - start
+
+    return({'bytes': size, 'disk_bytes': blocks, 'compress_s': write_s,
+            'read_files_per_s': len(files) / read_s,
+            'parse_files_per_s': len(files) / parse_s})
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark compressed storage of TEXT:LIST files")
+    parser.add_argument('--files', type=int, default=2000,
+                        help='Number of files in the archive [2000]')
+    parser.add_argument('--json', type=str, default='',
+                        help='Also write results to this JSON file')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        plain = os.path.join(tmpdir, 'plain')
+        os.mkdir(plain)
+        synthesize(plain, args.files)
+
+        results = {'files': args.files}
+        for method in ['', 'gzip', 'zstd']:
+            if not storage.available(method):
+                print('Skipping ' + method + ': zstandard not installed')
+                continue
+            results[method or 'plain'] = bench(plain, method, tmpdir)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    print('%-8s %12s %12s %10s %10s %10s' % ('method', 'bytes', 'disk_bytes',
+                                             'compress_s', 'read/s',
+                                             'parse/s'))
+    for method in ['plain', 'gzip', 'zstd']:
+        if method in results:
+            r = results[method]
+            print('%-8s %12d %12d %10.2f %10.0f %10.0f' %
+                  (method, r['bytes'], r['disk_bytes'], r['compress_s'],
+                   r['read_files_per_s'], r['parse_files_per_s']))
+
+    if args.json != '':
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+
+    main()
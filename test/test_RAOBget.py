@@ -29,6 +29,25 @@ class options():
     config = getrootdir() + "/" + "test/data/config_cp.yml"
     freq = "12"
     station_list_file = "config/snstns.tbl"
+    server = "http://weather.uwyo.edu"
+    report = ""
+    prometheus = ""
+    eventlog = ""
+    queue = ""
+    enqueue = False
+    rate = ""
+    compress = ""
+    cachedir = ""
+    launch_hours = ""
+    refresh = False
+    priority = ""
+    station_weights = ""
+    near = ""
+    deadline = ""
+    concurrency = ""
+    plan = False
+    inventory = ""
+    timeout = ""
 
 
 class TestRAOBget(unittest.TestCase):
@@ -0,0 +1,119 @@
+###############################################################################
+# Tests of retrieving soundings in memory, run against a local stand-in for
+# the UWyo archive (see uwyoserver.py)
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from lib.api import fetch, fetch_one, get_times
+from lib.raobroot import getrootdir
+from raobtype.sounding import read_textlist
+from raobtype.textlist import RAOBtextlist
+from uwyoserver import UWyoServer
+
+
+class TestAPI(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = UWyoServer(seed=0)
+        cls.url = cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.reset()
+        self.server.error_rate = 0.0
+
+        # Nothing should be written, so check the cwd stays empty
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmpdir.name)
+
+    def tearDown(self):
+        self.assertEqual(os.listdir('.'), [])
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def test_get_times(self):
+        self.assertEqual(get_times('2019053112', '2019060112', 12),
+                         [datetime(2019, 5, 31, 12), datetime(2019, 6, 1, 0),
+                          datetime(2019, 6, 1, 12)])
+
+    def test_fetch_one(self):
+        soundings = fetch_one('72672', '2019052812', server=self.url)
+        self.assertEqual(len(soundings), 1)
+        self.assertEqual(soundings[0].get_station(), '72672')
+        self.assertEqual(soundings[0].get_time(), datetime(2019, 5, 28, 12))
+        # Same as parsing the file RAOBget would have written
+        ctrl = read_textlist(getrootdir() +
+                             "/test/data/7267220190528122812.ctrl")[0]
+        self.assertEqual(soundings[0].columns, ctrl.columns)
+        np.testing.assert_array_equal(soundings[0].data, ctrl.data)
+
+    def test_csv(self):
+        # The CSV format gives the same data
+        textlist = fetch_one('72476', '2019052812', server=self.url)[0]
+        csv = fetch_one('72476', '2019052812', server=self.url,
+                        raobtype='TEXT:CSV')[0]
+        self.assertEqual(csv.get_station(), '72476')
+        self.assertEqual(csv.get_time(), datetime(2019, 5, 28, 12))
+        np.testing.assert_array_equal(csv.data, textlist.data)
+
+        with self.assertRaises(ValueError):
+            fetch_one('72476', '2019052812', server=self.url,
+                      raobtype='GIF:SKEWT')
+
+    def test_unparsable(self):
+        # A page that can't be parsed is skipped, not the rest of the RAOBs
+        def parse(text):
+            raise ValueError("could not convert string to float: '<PRE>'")
+
+        original = RAOBtextlist.parse
+        RAOBtextlist.parse = staticmethod(parse)
+        try:
+            soundings = list(fetch(['72672', '72476'], '2019052812',
+                                   '2019052812', server=self.url))
+        finally:
+            RAOBtextlist.parse = original
+        self.assertEqual(soundings, [])
+        self.assertEqual(self.server.get_stats()['requests'], 2)
+
+    def test_fetch(self):
+        # RIW is 72672, so is only retrieved once
+        soundings = list(fetch(['72672', 'RIW', '72476'],
+                               datetime(2019, 5, 28, 0),
+                               datetime(2019, 5, 28, 12), server=self.url))
+        self.assertEqual([(s.get_station(), s.get_time().hour)
+                          for s in soundings],
+                         [('72672', 0), ('72476', 0), ('72672', 12),
+                          ('72476', 12)])
+        self.assertEqual(self.server.get_stats()['requests'], 4)
+
+    def test_missing(self):
+        self.server.error_rate = 1.0
+        self.assertEqual(list(fetch('72672', '2019052812', '2019052812',
+                                    server=self.url)), [])
+
+    def test_threads(self):
+        stations = ['72672', '72476', '72469', '72681']
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(
+                lambda stn: fetch_one(stn, '2019052812', server=self.url),
+                stations))
+        self.assertEqual([r[0].get_station() for r in results], stations)
+
+
+if __name__ == "__main__":
+
+    unittest.main()
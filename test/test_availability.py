@@ -0,0 +1,100 @@
+###############################################################################
+# Unit tests for the record of which RAOBs exist
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import time
+import calendar
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from lib.availability import Availability, MissingCache, parse_launch_hours
+from lib.availability import get_ttl
+
+
+class TestAvailability(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_parse(self):
+        self.assertEqual(parse_launch_hours('0,12'), {'': {'00', '12'}})
+        self.assertEqual(parse_launch_hours('72672=00,12; 72476=6'),
+                         {'72672': {'00', '12'}, '72476': {'06'}})
+        self.assertEqual(parse_launch_hours(''), {})
+
+    def test_schedule(self):
+        availability = Availability(self.tmpdir.name, '00,12 72476=00,06')
+        self.assertTrue(availability.likely('72672', '12'))
+        self.assertFalse(availability.likely('72672', '06'))
+        self.assertTrue(availability.likely('72476', '06'))
+        self.assertFalse(availability.likely('72476', '12'))
+
+    def test_history(self):
+        availability = Availability(self.tmpdir.name)
+        for i in range(4):
+            availability.record('72672', '06', False)
+            availability.record('72672', '12', True)
+        self.assertTrue(availability.likely('72672', '06'))
+        availability.record('72672', '06', False)
+        # Just checked, so skip
+        self.assertFalse(availability.likely('72672', '06'))
+        self.assertTrue(availability.likely('72672', '12'))
+        self.assertTrue(availability.likely('72476', '06'))  # No history
+
+        # History persists, and other runs' counts are added to it
+        availability.save()
+        other = Availability(self.tmpdir.name)
+        other.record('72672', '12', True)
+        other.save()
+        availability.record('72672', '12', False)
+        availability.save()
+        reloaded = Availability(self.tmpdir.name)
+        self.assertEqual(reloaded.get('72672', '12')['attempts'], 6)
+        self.assertEqual(reloaded.get('72672', '12')['found'], 5)
+        self.assertFalse(reloaded.likely('72672', '06'))
+
+        # Skipped hours are checked again after a while
+        reloaded.table['72672']['06']['checked'] = time.time() - 8 * 86400
+        self.assertTrue(reloaded.likely('72672', '06'))
+
+    def test_ttl(self):
+        valid = datetime(2019, 5, 28, 12)
+        launch = calendar.timegm(valid.timetuple())
+        self.assertEqual(get_ttl(valid, launch + 3600), 900)
+        self.assertEqual(get_ttl(valid, launch + 86400), 7200)
+        self.assertEqual(get_ttl(valid, launch + 10 * 86400), 86400)
+        self.assertEqual(get_ttl(valid, launch + 100 * 86400),
+                         365 * 86400)
+
+    def test_missing(self):
+        old = datetime(2019, 5, 28, 12)
+        recent = datetime.utcnow().replace(minute=0, second=0,
+                                           microsecond=0) - timedelta(hours=1)
+        missing = MissingCache(self.tmpdir.name)
+        missing.add('72672', 'TEXT:LIST', old)
+        missing.add('72672', 'TEXT:LIST', recent)
+        self.assertTrue(missing.is_missing('72672', 'TEXT:LIST', old))
+        self.assertFalse(missing.is_missing('72672', 'GIF:SKEWT', old))
+        self.assertFalse(missing.is_missing('72476', 'TEXT:LIST', old))
+        missing.save()
+
+        # Remembered by later runs, but recent RAOBs only briefly
+        reloaded = MissingCache(self.tmpdir.name)
+        self.assertTrue(reloaded.is_missing('72672', 'TEXT:LIST', old))
+        self.assertTrue(reloaded.is_missing('72672', 'TEXT:LIST', recent))
+        key = reloaded.get_key('72672', 'TEXT:LIST', recent)
+        reloaded.table[key] -= 3600
+        self.assertFalse(reloaded.is_missing('72672', 'TEXT:LIST', recent))
+
+        # A RAOB that turns up is forgotten
+        reloaded.remove('72672', 'TEXT:LIST', old)
+        self.assertFalse(reloaded.is_missing('72672', 'TEXT:LIST', old))
+        reloaded.save()
+        self.assertEqual(list(MissingCache(self.tmpdir.name).table), [key])
@@ -0,0 +1,75 @@
+###############################################################################
+# Unit tests for the catalog product names of stations
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import unittest
+
+import userlib.catalog as catalog
+from lib.raobroot import getrootdir
+from lib.raobget import RAOBget
+from raobtype.gifskewt import RAOBgifskewt
+
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.stnlist = os.path.join(getrootdir(), 'config', 'snstns.tbl')
+
+    def test_names(self):
+        # US stations get the state, others the country
+        self.assertEqual(catalog.get_prod('72672', self.stnlist),
+                         'Riverton_WY')
+        self.assertEqual(catalog.get_prod('RIW', self.stnlist),
+                         'Riverton_WY')
+        self.assertEqual(catalog.get_prod('10035', self.stnlist),
+                         'Schleswig_DL')
+        # Parentheses are removed
+        self.assertEqual(catalog.get_prod('04202', self.stnlist),
+                         'Pituffik_Thule_A.B_GL')
+        # Named as the archive titles its pages: without the part after a
+        # slash, and keeping the case of names like McGrath
+        self.assertEqual(catalog.get_prod('72476', self.stnlist),
+                         'Grand_Junction_CO')
+        self.assertEqual(catalog.get_prod('96163', self.stnlist),
+                         'Padang_ID')
+        self.assertEqual(catalog.get_prod('70231', self.stnlist),
+                         'McGrath_AK')
+        self.assertEqual(catalog.get_prod('22550', self.stnlist),
+                         "Arhangel'sk_RS")
+        self.assertEqual(catalog.get_prod('06476', self.stnlist),
+                         'St-Hubert_BX')
+        self.assertEqual(catalog.get_name('Riverton Regional'),
+                         'Riverton Regional')
+        self.assertIsNone(catalog.get_prod('00000', self.stnlist))
+
+        # The names are built once per station list
+        self.assertIs(catalog.get_prod_names(self.stnlist),
+                      catalog.get_prod_names(self.stnlist))
+
+    def test_overrides(self):
+        overrides = catalog.parse_names('72672=Riverton_Regional_WY; ' +
+                                        '00000=Nowhere_XX')
+        self.assertEqual(catalog.get_prod('RIW', self.stnlist, overrides),
+                         'Riverton_Regional_WY')
+        self.assertEqual(catalog.get_prod('00000', self.stnlist, overrides),
+                         'Nowhere_XX')
+        # Overrides can also be a YAML mapping
+        overrides = catalog.parse_names({'RIW': 'Riverton_Regional_WY'})
+        self.assertEqual(catalog.get_prod('72672', self.stnlist, overrides),
+                         'Riverton_Regional_WY')
+
+    def test_no_page(self):
+        # The name doesn't need the HTML page from the archive
+        request = RAOBget().request
+        request.set_stnm('72476')
+        request.set_stnlist_file('config/snstns.tbl')
+        self.assertEqual(RAOBgifskewt().get_prod(request),
+                         'Grand_Junction_CO')
+
+
+if __name__ == "__main__":
+    unittest.main()
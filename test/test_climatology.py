@@ -0,0 +1,98 @@
+###############################################################################
+# Unit tests for the chunked climatology of an archive of soundings
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import csv
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from lib.raobroot import getrootdir
+from raobtype.sounding import read_textlist
+from analysis.interp import interpolate_soundings
+from analysis.climatology import RunningStats, Climatology, find_files, \
+    summarize, summarize_archive
+
+FIXTURES = ['7267220190528122812.ctrl', '7267220190528002800.ctrl']
+
+
+class TestClimatology(unittest.TestCase):
+
+    def setUp(self):
+        self.datadir = getrootdir() + "/test/data/"
+        self.tmpdir = tempfile.mkdtemp()
+        # An archive with several copies of each fixture
+        for i in range(5):
+            for fixture in FIXTURES:
+                shutil.copy(self.datadir + fixture,
+                            os.path.join(self.tmpdir, str(i) + fixture +
+                                         '.txt'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_running_stats(self):
+        # Statistics merged in chunks match those of all the values
+        rng = np.random.default_rng(0)
+        values = rng.normal(-20, 10, (1000, 2))
+        stats = RunningStats(2, -100, 60, 0.5)
+        for chunk in np.array_split(values, 7):
+            part = RunningStats(2, -100, 60, 0.5)
+            bins = part.get_bins(chunk)
+            hist = np.stack([np.bincount(bins[:, i], minlength=320)
+                             for i in range(2)])
+            mean = chunk.mean(axis=0)
+            part.combine(np.full(2, len(chunk)), mean,
+                         ((chunk - mean) ** 2).sum(axis=0), hist)
+            stats.merge(part)
+        np.testing.assert_array_equal(stats.count, [1000, 1000])
+        np.testing.assert_allclose(stats.get_mean(), values.mean(axis=0))
+        np.testing.assert_allclose(stats.get_std(),
+                                   values.std(axis=0, ddof=1))
+        quantiles = stats.get_quantiles([0.05, 0.5, 0.95])
+        expected = np.quantile(values, [0.05, 0.5, 0.95], axis=0).T
+        np.testing.assert_allclose(quantiles, expected, atol=0.5)
+
+    def test_add(self):
+        soundings = []
+        for fixture in FIXTURES:
+            soundings += read_textlist(self.datadir + fixture)
+        climatology = Climatology([850, 700, 500])
+        climatology.add(soundings)
+        self.assertEqual(sorted(climatology.stats),
+                         [('72672', 5, 0), ('72672', 5, 12)])
+
+        temp = interpolate_soundings(soundings, [850, 700, 500], ['TEMP'])
+        stats = climatology.stats[('72672', 5, 12)]['TEMP']
+        np.testing.assert_array_equal(stats.count, [0, 1, 1])
+        np.testing.assert_allclose(stats.get_mean()[1:], temp['TEMP'][0, 1:])
+
+    def test_chunks(self):
+        # Chunk size and number of processes don't change the result
+        files = find_files(self.tmpdir)
+        self.assertEqual(len(files), 10)
+        whole = summarize(files, chunksize=len(files))
+        for climatology in [summarize(files, chunksize=3),
+                            summarize_archive(files, chunksize=2,
+                                              processes=2)]:
+            self.assertEqual(climatology.soundings, 10)
+            self.assertEqual(list(climatology.rows()), list(whole.rows()))
+
+    def test_write(self):
+        climatology = summarize(find_files(self.tmpdir))
+        outfile = os.path.join(self.tmpdir, 'clim.csv')
+        climatology.write(outfile, [0.1, 0.9])
+        with open(outfile) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['station', 'month', 'hour', 'level',
+                                   'variable', 'count', 'mean', 'std', 'p10',
+                                   'p90'])
+        row = [r for r in rows if r[0:5] == ['72672', '5', '12', '500',
+                                             'TEMP']][0]
+        self.assertEqual(row[5], '5')
+        self.assertEqual(float(row[7]), 0)  # Copies of the same sounding
@@ -0,0 +1,85 @@
+###############################################################################
+# Unit tests for the adaptive limit on requests in flight
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import unittest
+import threading
+
+from lib.metrics import runmetrics
+from lib.concurrency import AIMDLimiter, parse_concurrency
+
+
+class TestConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        runmetrics.reset()
+
+    def answer(self, limiter, outcome='retrieved', latency=0.01):
+        """ Send a request that takes about latency seconds to answer """
+        start = limiter.acquire()
+        limiter.release(start - latency, outcome)
+
+    def test_parse(self):
+        self.assertEqual(parse_concurrency('8'), (1, 8))
+        self.assertEqual(parse_concurrency('2:8'), (2, 8))
+        for value in ['0', '4:2', 'many']:
+            with self.assertRaises(ValueError):
+                parse_concurrency(value)
+
+    def test_increase(self):
+        # The limit grows by one after each round of prompt answers
+        limiter = AIMDLimiter(1, 4)
+        self.answer(limiter)
+        self.assertEqual(limiter.get_limit(), 2)
+        self.answer(limiter)
+        self.assertEqual(limiter.get_limit(), 2)
+        self.answer(limiter)
+        self.assertEqual(limiter.get_limit(), 3)
+        for i in range(20):
+            self.answer(limiter)
+        self.assertEqual(limiter.get_limit(), 4)
+        # Requests that didn't reach the server don't count
+        limiter.set_limit(1)
+        self.answer(limiter, 'exists', latency=0.0)
+        self.assertEqual(limiter.get_limit(), 1)
+
+    def test_decrease(self):
+        # Errors and slow answers halve the limit, but not below the minimum
+        limiter = AIMDLimiter(2, 16)
+        limiter.set_limit(16)
+        self.answer(limiter)
+        self.answer(limiter, latency=1.0)
+        self.assertEqual(limiter.get_limit(), 8)
+        self.answer(limiter, 'error', latency=0.0)
+        self.assertEqual(limiter.get_limit(), 4)
+        for i in range(3):
+            self.answer(limiter, 'error', latency=0.0)
+        self.assertEqual(limiter.get_limit(), 2)
+        self.assertEqual(runmetrics.get_count('congestion'), 5)
+        series = runmetrics.get_report()['series']['concurrency']
+        self.assertEqual([value for (t, value) in series], [2, 16, 8, 4, 2])
+
+    def test_once_per_round(self):
+        # Requests in flight when the limit was cut don't cut it again
+        limiter = AIMDLimiter(1, 8)
+        limiter.set_limit(8)
+        starts = [limiter.acquire() for i in range(4)]
+        for start in starts:
+            limiter.release(start, 'error')
+        self.assertEqual(limiter.get_limit(), 4)
+
+    def test_limit(self):
+        # No more than the limit are in flight at once
+        limiter = AIMDLimiter(2, 2)
+        limiter.acquire()
+        limiter.acquire()
+        cancel = threading.Event()
+        cancel.set()
+        self.assertIsNone(limiter.acquire(cancel))
+
+
+if __name__ == "__main__":
+    unittest.main()
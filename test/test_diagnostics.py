@@ -0,0 +1,98 @@
+###############################################################################
+# Check the batch thermodynamic diagnostics against MetPy on the test
+# fixtures, and on copies of them made unstable
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import unittest
+import warnings
+import numpy as np
+import metpy.calc as mpcalc
+from metpy.units import units
+
+from lib.raobroot import getrootdir
+from raobtype.sounding import read_textlist, stack
+from analysis.diagnostics import diagnostics
+
+
+class TestDiagnostics(unittest.TestCase):
+
+    def setUp(self):
+        soundings = []
+        for fixture in ['7267220190528122812.ctrl',
+                        '7267220190528002800.ctrl']:
+            soundings += read_textlist(getrootdir() + "/test/data/" +
+                                       fixture)
+        s = stack(soundings)
+        pres, temp, dwpt = s['PRES'], s['TEMP'], s['DWPT']
+
+        # Warm and moisten the lower troposphere to make unstable copies
+        warm = np.where(pres > 600, 10 * (pres - 600) / 400, 0)
+        moist = np.minimum(dwpt + np.where(pres > 500,
+                                           15 * (pres - 500) / 500, 0), temp)
+        self.pres = np.vstack([pres, pres, pres])
+        self.temp = np.vstack([temp, temp + warm, temp])
+        self.dwpt = np.vstack([dwpt, np.minimum(dwpt + warm * 1.2,
+                                                temp + warm), moist])
+
+    def metpy(self, i):
+        """ Compute the diagnostics of sounding i with MetPy """
+        ok = np.isfinite(self.pres[i])
+        p = self.pres[i][ok] * units.hPa
+        t = self.temp[i][ok] * units.degC
+        td = self.dwpt[i][ok] * units.degC
+        profile = mpcalc.parcel_profile(p, t[0], td[0])
+        p_lcl, t_lcl = mpcalc.lcl(p[0], t[0], td[0])
+        cape, cin = mpcalc.cape_cin(p, t, td, profile)
+
+        # cape_cin finds the LFC and EL using virtual temperature
+        w = mpcalc.saturation_mixing_ratio(p, profile)
+        w[p > p_lcl] = mpcalc.saturation_mixing_ratio(p[0], td[0])
+        tv_parcel = mpcalc.virtual_temperature(profile, w)
+        tv_env = mpcalc.virtual_temperature_from_dewpoint(p, t, td)
+        lfc, _ = mpcalc.lfc(p, tv_env, td, tv_parcel, which='bottom')
+        el, _ = mpcalc.el(p, tv_env, td, tv_parcel, which='top')
+
+        return({'lcl_pressure': p_lcl.m_as('hPa'),
+                'lcl_temperature': t_lcl.m_as('degC'),
+                'lfc_pressure': lfc.m_as('hPa'),
+                'el_pressure': el.m_as('hPa'),
+                'cape': cape.m_as('J/kg'),
+                'cin': cin.m_as('J/kg'),
+                'pw': mpcalc.precipitable_water(p, td).m_as('mm'),
+                'li': np.squeeze(mpcalc.lifted_index(p, t, profile).m)})
+
+    def test_metpy(self):
+        result = diagnostics(self.pres, self.temp, self.dwpt)
+        self.assertGreater(np.max(result['cape']), 500)  # Test something
+
+        tolerance = {'lcl_pressure': 0.01, 'lcl_temperature': 0.01,
+                     'lfc_pressure': 0.5, 'el_pressure': 0.5, 'cape': 1.0,
+                     'cin': 1.0, 'pw': 0.01, 'li': 0.05}
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            for i in range(self.pres.shape[0]):
+                expected = self.metpy(i)
+                for key, tol in tolerance.items():
+                    if key in ['cape', 'cin']:
+                        tol = max(tol, 0.005 * abs(expected[key]))
+                    if np.isnan(expected[key]):
+                        self.assertTrue(np.isnan(result[key][i]),
+                                        key + " of sounding " + str(i))
+                    else:
+                        self.assertAlmostEqual(result[key][i], expected[key],
+                                               delta=tol,
+                                               msg=key + " of sounding " +
+                                               str(i))
+
+    def test_single(self):
+        # A single sounding can be passed as 1-D arrays
+        result = diagnostics(self.pres[0], self.temp[0], self.dwpt[0])
+        self.assertEqual(result['cape'].shape, (1,))
+
+
+if __name__ == "__main__":
+
+    unittest.main()
@@ -5,11 +5,20 @@
 #
 # COPYRIGHT:   University Corporation for Atmospheric Research, 2019
 ###############################################################################
+import os
+import gc
 import unittest
+import tracemalloc
 from lib.raobget import RAOBget
 from gui.configedit import GUIconfig
+from gui.RSLcreator import RSLWidget
+from gui.gallery import Gallery
+from gui.raobwidget import Widget
+from raobtype.skewt import SkewtPool
+from lib.stationlist import get_station_list
+from lib.raobroot import getrootdir
 from PyQt5.QtWidgets import QApplication, QGridLayout
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QItemSelectionModel, QEventLoop, QTimer
 from PyQt5.QtTest import QTest
 
 
@@ -17,7 +26,7 @@ class TESTgui(unittest.TestCase):
 
     def setUp(self):
         self.raob = RAOBget()
-        self.app = QApplication([])
+        self.app = QApplication.instance() or QApplication([])
         self.bset = None
 
     def test_default(self):
@@ -54,3 +63,102 @@ class TESTgui(unittest.TestCase):
         QTest.mouseClick(self.bset, Qt.LeftButton)  # Send a left mouse click
         self.assertEqual(config.btime.getStatus(), True)
         # Test if color is black - once figure out. See comment above.
+
+    def test_rsl_widget(self):
+        '''Test searching and selecting from the master station list'''
+        stationList = get_station_list(getrootdir() + "/config/snstns.tbl")
+        rsl = RSLWidget(stationList)
+        self.assertEqual(rsl.model.rowCount(),
+                         len(stationList.station_list))
+
+        # Typing in the search box filters the list
+        QTest.keyClicks(rsl.search, "walker")
+        self.assertEqual(rsl.model.rowCount(), 1)
+
+        # Select the station and move it to the RSL list
+        rsl.textbox.selectionModel().select(rsl.model.index(0),
+                                            QItemSelectionModel.Select)
+        rsl.select_station()
+        self.assertEqual(rsl.rslbox.count(), 1)
+        self.assertTrue(rsl.rslbox.item(0).text().startswith("GJT"))
+
+        # Clearing the search shows all stations again
+        rsl.search.clear()
+        self.assertEqual(rsl.model.rowCount(),
+                         len(stationList.station_list))
+
+        # A missing station list is reported in the list
+        rsl.display_station(get_station_list("missing.tbl"))
+        self.assertEqual(rsl.model.rowCount(), 1)
+        self.assertRegex(rsl.model.data(rsl.model.index(0)), "^ERROR:")
+
+    def test_gallery(self):
+        '''Test rendering thumbnails and full-size soundings'''
+        gallery = Gallery(self.raob.request)
+        model = gallery.model
+        gallery.add('TEXT:LIST', getrootdir() +
+                    "/test/data/7267220190528122812.ctrl")
+        gallery.add('GIF:SKEWT', getrootdir() + "/src/gui/message.gif")
+        self.assertEqual(model.rowCount(), 2)
+
+        # Thumbnails are rendered in the background when first asked for
+        loop = QEventLoop()
+        model.dataChanged.connect(
+            lambda: loop.quit() if len(model.thumbs) == 2 else None)
+        QTimer.singleShot(20000, loop.quit)
+        for row in range(2):
+            model.data(model.index(row), Qt.DecorationRole)
+        loop.exec_()
+        self.assertEqual(len(model.thumbs), 2)
+        thumb = model.data(model.index(0), Qt.DecorationRole)
+        self.assertEqual(max(thumb.width(), thumb.height()), model.size)
+
+        # Selecting a sounding renders it full size, then it is cached
+        loop = QEventLoop()
+        model.fullReady.connect(loop.quit)
+        QTimer.singleShot(20000, loop.quit)
+        gallery.view.setCurrentIndex(model.index(0))
+        loop.exec_()
+        self.assertGreater(gallery.image.pixmap().width(), model.size)
+        self.assertIsNotNone(model.get_full(0))
+
+    def test_skewt_reuse(self):
+        '''The GUI plots each sounding in the same figure'''
+        widget = Widget(self.raob, self.app)
+        datafile = getrootdir() + "/test/data/7267220190528122812.ctrl"
+        widget.resetImageWindow()
+        canvas = widget.canvas
+        widget.createSkewt(datafile)
+        lines = len(widget.skewt.skew.ax.lines)
+        widget.resetImageWindow()
+        widget.createSkewt(datafile)
+        self.assertIs(widget.canvas, canvas)
+        self.assertEqual(len(canvas.figure.axes), 1)
+        self.assertEqual(len(widget.skewt.skew.ax.lines), lines)
+
+    def test_skewt_memory(self):
+        '''Memory stays flat rendering many soundings from the pool. Set
+        RAOBGET_SOAK to render more, e.g. 5000'''
+        count = int(os.environ.get('RAOBGET_SOAK', 100))
+        pool = SkewtPool(2)
+        with pool.get() as skewt:
+            rdat = skewt.read_data(getrootdir() +
+                                   "/test/data/7267220190528122812.ctrl",
+                                   False)
+        tracemalloc.start()
+        try:
+            # Let the figure settle at both thumbnail and full size
+            for i in range(20):
+                with pool.get() as skewt:
+                    skewt.render(rdat, 160 / 9.0 if i % 2 else 100)
+            gc.collect()
+            start = tracemalloc.get_traced_memory()[0]
+            for i in range(count):
+                with pool.get() as skewt:
+                    skewt.render(rdat, 160 / 9.0 if i % 2 else 100)
+            gc.collect()
+            growth = tracemalloc.get_traced_memory()[0] - start
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(pool.count, 1)
+        self.assertLess(growth, 512 * 1024)
@@ -0,0 +1,84 @@
+###############################################################################
+# Unit tests for batched vertical interpolation of soundings
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import unittest
+import warnings
+import datetime
+import numpy as np
+from metpy.interpolate import log_interpolate_1d
+
+from lib.raobroot import getrootdir
+from raobtype.sounding import read_textlist
+from analysis.interp import interpolate, interpolate_soundings, \
+    SoundingCube
+
+
+class TestInterp(unittest.TestCase):
+
+    def setUp(self):
+        self.soundings = []
+        for fixture in ['7267220190528122812.ctrl',
+                        '7267220190528002800.ctrl']:
+            self.soundings += read_textlist(getrootdir() + "/test/data/" +
+                                            fixture)
+        self.grid = [1000, 850, 700, 500, 300, 250, 100, 50, 10, 5]
+
+    def test_interpolate(self):
+        # Rows of different lengths, unsorted, padded with NaN
+        x = np.array([[0, 1, 2, 3], [3, 1, np.nan, np.nan]], dtype=float)
+        y = np.array([[0, 10, 20, 30], [6, 2, np.nan, np.nan]], dtype=float)
+        result = interpolate(x, y, [-1, 0, 0.5, 1.5, 3, 4])
+        np.testing.assert_allclose(result[0], [np.nan, 0, 5, 15, 30, np.nan])
+        np.testing.assert_allclose(result[1],
+                                   [np.nan, np.nan, np.nan, 3, 6, np.nan])
+
+    def test_pressure(self):
+        result = interpolate_soundings(self.soundings, self.grid,
+                                       ['TEMP', 'SKNT'])
+        for i, sounding in enumerate(self.soundings):
+            for name in ['TEMP', 'SKNT']:
+                p = sounding.get('PRES')
+                values = sounding.get(name)
+                ok = np.isfinite(values)
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')  # Out of bounds points
+                    expected = log_interpolate_1d(
+                        np.array(self.grid, float), p[ok], values[ok])
+                np.testing.assert_allclose(result[name][i], expected,
+                                           rtol=1e-10)
+
+        # 1000 hPa is below ground, and 5 hPa above the top
+        self.assertTrue(np.isnan(result['TEMP'][0, 0]))
+        self.assertTrue(np.isnan(result['TEMP'][0, -1]))
+        # 850 hPa has a height but no temperature at 72672
+        self.assertTrue(np.isnan(result['TEMP'][0, 1]))
+
+    def test_height(self):
+        grid = [2000, 5000, 10000]
+        result = interpolate_soundings(self.soundings, grid, ['TEMP'],
+                                       coord='HGHT')
+        sounding = self.soundings[0]
+        ok = np.isfinite(sounding.get('TEMP'))
+        np.testing.assert_allclose(result['TEMP'][0],
+                                   np.interp(grid, sounding.get('HGHT')[ok],
+                                             sounding.get('TEMP')[ok]))
+
+    def test_cube(self):
+        cube = SoundingCube(self.soundings, self.grid, ['TEMP', 'DWPT'])
+        self.assertEqual(cube.stations, ['72672'])
+        self.assertEqual(cube.times, [datetime.datetime(2019, 5, 28, 0),
+                                      datetime.datetime(2019, 5, 28, 12)])
+        temp = cube.get('TEMP')
+        self.assertEqual(temp.shape, (1, 2, len(self.grid)))
+        self.assertTrue(temp.mask[0, 0, 0])
+        self.assertFalse(temp.mask[0, 1, 3])
+        self.assertAlmostEqual(temp[0, 1, 3], -18.9)  # 500 hPa at 12Z
+
+
+if __name__ == "__main__":
+
+    unittest.main()
@@ -0,0 +1,165 @@
+###############################################################################
+# Unit tests for the inventory of retrieved RAOBs
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import sqlite3
+import hashlib
+import tempfile
+import unittest
+
+import lib.storage as storage
+from lib.inventory import Inventory, verify
+from lib.scheduler import Journal, JOURNAL
+
+
+class TestInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.inventory = Inventory(os.path.join(self.tmpdir.name, 'inv',
+                                                'inventory.db'))
+        for stn in ['72672', '72476']:
+            for valid in ['2019052800', '2019052812']:
+                path = os.path.join(self.tmpdir.name, stn + valid + '.txt')
+                with open(path, 'w') as f:
+                    f.write("<HTML>" + stn + valid + "</HTML>\n")
+                self.inventory.add(stn, valid, 'TEXT:LIST', path,
+                                   'http://example/' + stn)
+
+    def tearDown(self):
+        self.inventory.close()
+        self.tmpdir.cleanup()
+
+    def test_get(self):
+        record = self.inventory.get('72672', '2019052812', 'TEXT:LIST')
+        self.assertEqual(record['path'], os.path.join(
+            self.tmpdir.name, '726722019052812.txt'))
+        self.assertEqual(record['size'], 29)
+        self.assertEqual(record['sha256'], hashlib.sha256(
+            b'<HTML>726722019052812</HTML>\n').hexdigest())
+        self.assertEqual(record['url'], 'http://example/72672')
+        self.assertTrue(self.inventory.has('72476', '2019052800',
+                                           'TEXT:LIST'))
+        self.assertFalse(self.inventory.has('72476', '2019052800',
+                                            'GIF:SKEWT'))
+        self.inventory.remove('72476', '2019052800', 'TEXT:LIST')
+        self.assertFalse(self.inventory.has('72476', '2019052800',
+                                            'TEXT:LIST'))
+
+    def test_dirs(self):
+        # The same RAOB stored in another dir has its own record
+        os.mkdir(os.path.join(self.tmpdir.name, 'mtp'))
+        mtp = os.path.join(self.tmpdir.name, 'mtp', '726722019052812.txt')
+        with open(mtp, 'w') as f:
+            f.write('"<HTML>726722019052812\n')
+        self.inventory.add('72672', '2019052812', 'TEXT:LIST', mtp,
+                           stripped=True)
+        self.assertEqual(len(self.inventory.query(station='72672',
+                                                  start='2019052812')), 2)
+        self.assertEqual(self.inventory.get('72672', '2019052812',
+                                            'TEXT:LIST', mtp)['path'], mtp)
+        self.assertIsNone(self.inventory.get(
+            '72672', '2019052812', 'TEXT:LIST',
+            os.path.join(self.tmpdir.name, 'inv', '726722019052812.txt')))
+
+        # The compressed file replaces the record of the plain one
+        path = os.path.join(self.tmpdir.name, '726722019052812.txt')
+        compressed = storage.compress(path, 'gzip')
+        self.inventory.add('72672', '2019052812', 'TEXT:LIST', compressed)
+        self.assertEqual(self.inventory.get('72672', '2019052812',
+                                            'TEXT:LIST', path)['path'],
+                         compressed)
+        self.assertEqual(len(self.inventory.query(station='72672',
+                                                  start='2019052812')), 2)
+
+        # Forgetting one file keeps the other
+        self.inventory.remove('72672', '2019052812', 'TEXT:LIST', path)
+        self.assertFalse(self.inventory.has('72672', '2019052812',
+                                            'TEXT:LIST', path))
+        self.assertTrue(self.inventory.has('72672', '2019052812',
+                                           'TEXT:LIST', mtp))
+
+        # Files stripped for the MTP aren't expected to end as pages do
+        self.assertEqual(verify(self.inventory, self.inventory.query()), [])
+
+    def test_upgrade(self):
+        # An inventory with an older schema is emptied, to be refilled
+        path = os.path.join(self.tmpdir.name, 'old.db')
+        db = sqlite3.connect(path)
+        db.execute('CREATE TABLE products (station TEXT, valid TEXT, ' +
+                   'raobtype TEXT, path TEXT, size INTEGER, sha256 TEXT, ' +
+                   'url TEXT, retrieved TEXT, ' +
+                   'PRIMARY KEY (station, valid, raobtype))')
+        db.execute("INSERT INTO products VALUES ('72672', '2019052812', " +
+                   "'TEXT:LIST', '/x', 1, '', '', '')")
+        db.commit()
+        db.close()
+        inventory = Inventory(path)
+        self.assertEqual(inventory.query(), [])
+        inventory.add('72672', '2019052812', 'TEXT:LIST',
+                      os.path.join(self.tmpdir.name, '726722019052812.txt'))
+        self.assertEqual(len(inventory.query()), 1)
+        inventory.close()
+
+    def test_query(self):
+        records = self.inventory.query(start='2019052806')
+        self.assertEqual([(r['station'], r['valid']) for r in records],
+                         [('72476', '2019052812'), ('72672', '2019052812')])
+        records = self.inventory.query(station='72672', end='2019052800')
+        self.assertEqual(len(records), 1)
+        self.assertEqual(len(self.inventory.query(raobtype='GIF:SKEWT')), 0)
+        self.assertEqual(self.inventory.get_keys('TEXT:LIST'),
+                         set([('72672', '2019052800'),
+                              ('72672', '2019052812'),
+                              ('72476', '2019052800'),
+                              ('72476', '2019052812')]))
+
+    def test_keys_in_dir(self):
+        # Only RAOBs stored in a dir, and still there, count for a plan there
+        self.assertEqual(len(self.inventory.get_keys('TEXT:LIST',
+                                                     self.tmpdir.name)), 4)
+        self.assertEqual(self.inventory.get_keys(
+            'TEXT:LIST', os.path.join(self.tmpdir.name, 'inv')), set())
+        os.remove(os.path.join(self.tmpdir.name, '726722019052812.txt'))
+        self.assertNotIn(('72672', '2019052812'), self.inventory.get_keys(
+            'TEXT:LIST', self.tmpdir.name))
+
+    def test_missing(self):
+        self.inventory.remove('72476', '2019052812', 'TEXT:LIST')
+        self.assertEqual(self.inventory.missing(['72672', '72476', '72469'],
+                                                '2019052812', 'TEXT:LIST'),
+                         ['72476', '72469'])
+
+    def test_verify(self):
+        # Files that changed, were cut short or are gone are requeued
+        records = self.inventory.query()
+        with open(records[0]['path'], 'a') as f:
+            f.write("<HTML>")
+        with open(records[1]['path'], 'w') as f:
+            f.write("<HTML>72476201905280")
+        self.inventory.add(records[1]['station'], records[1]['valid'],
+                           records[1]['raobtype'], records[1]['path'])
+        os.remove(records[2]['path'])
+
+        bad = verify(self.inventory, self.inventory.query())
+        self.assertEqual([r['path'] for r in bad],
+                         [r['path'] for r in records[0:3]])
+        self.assertFalse(os.path.isfile(records[0]['path']))
+        self.assertEqual(len(self.inventory.query()), 1)
+        tasks = Journal(os.path.join(self.tmpdir.name, JOURNAL)).load()
+        self.assertEqual([(t['stnm'], t['year'], t['month'], t['day'],
+                           t['hour']) for t in tasks],
+                         [('72476', '2019', '05', '28', '00'),
+                          ('72672', '2019', '05', '28', '00'),
+                          ('72476', '2019', '05', '28', '12')])
+
+        # Intact files are left alone
+        self.assertEqual(verify(self.inventory, self.inventory.query()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
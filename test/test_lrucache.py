@@ -0,0 +1,50 @@
+###############################################################################
+# Unit tests for the size-bounded LRU cache
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import unittest
+
+from lib.lrucache import LRUcache
+
+
+class TestLRUcache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LRUcache(10)  # Total length of cached strings
+
+    def test_get(self):
+        self.cache.put('a', 'aaaa')
+        self.assertEqual(self.cache.get('a'), 'aaaa')
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_evict(self):
+        self.cache.put('a', 'aaaa')
+        self.cache.put('b', 'bbbb')
+        self.cache.get('a')  # b is now least recently used
+        self.cache.put('c', 'cccc')
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+        self.assertIn('c', self.cache)
+        self.assertEqual(self.cache.get_size(), 8)
+
+    def test_replace(self):
+        self.cache.put('a', 'aaaa')
+        self.cache.put('a', 'aaaaaa')
+        self.assertEqual(self.cache.get_size(), 6)
+        self.cache.remove('a')
+        self.assertEqual(self.cache.get_size(), 0)
+
+    def test_too_big(self):
+        self.cache.put('a', 'a' * 11)
+        self.assertNotIn('a', self.cache)
+        self.assertEqual(len(self.cache), 0)
+
+
+if __name__ == "__main__":
+
+    unittest.main()
@@ -0,0 +1,66 @@
+###############################################################################
+# Unit tests for delivery of log messages to sinks by the event bus
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import io
+import unittest
+from contextlib import redirect_stderr
+
+from lib.messageHandler import RAOBevent, RAOBeventbus
+
+
+class Listsink():
+
+    def __init__(self):
+        self.events = []
+
+    def accepts(self, event):
+        return(True)
+
+    def write(self, event):
+        self.events.append(event)
+
+    def flush(self):
+        pass
+
+
+class Brokensink(Listsink):
+
+    def write(self, event):
+        raise OSError("disk full")
+
+
+class TestEventbus(unittest.TestCase):
+
+    def setUp(self):
+        self.eventbus = RAOBeventbus()
+        self.broken = self.eventbus.add_sink(Brokensink())
+        self.working = self.eventbus.add_sink(Listsink())
+
+    def test_deliver(self):
+        self.eventbus.publish(RAOBevent('info', "Retrieved 72672"))
+        self.eventbus.flush()
+        self.assertEqual([e.msg for e in self.working.events],
+                         ["Retrieved 72672"])
+
+    def test_broken_sink(self):
+        # A sink that fails is reported once and removed. The others still
+        # receive every event.
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            self.eventbus.publish(RAOBevent('info', "first"))
+            self.eventbus.publish(RAOBevent('info', "second"))
+            self.eventbus.flush()
+
+        self.assertEqual(stderr.getvalue(), "WARNING: Stopped logging to " +
+                         "Brokensink after error: disk full\n")
+        self.assertNotIn(self.broken, self.eventbus.sinks)
+        self.assertEqual([e.msg for e in self.working.events],
+                         ["first", "second"])
+
+
+if __name__ == "__main__":
+    unittest.main()
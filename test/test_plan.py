@@ -0,0 +1,81 @@
+###############################################################################
+# Unit tests for planning the stations to request
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from lib.raobroot import getrootdir
+from lib.stationlist import get_station_list
+from lib.availability import Availability, MissingCache
+from lib.plan import canonical_station, plan_stations, list_files, Plan
+from raobtype.textlist import RAOBtextlist
+
+
+class TestPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.stationList = get_station_list(getrootdir() +
+                                            "/config/snstns.tbl")
+
+    def test_canonical(self):
+        self.assertEqual(canonical_station('72672', self.stationList),
+                         '72672')
+        self.assertEqual(canonical_station('riw', self.stationList), '72672')
+        self.assertEqual(canonical_station('RIW       72672 RIVERTON',
+                                           self.stationList), '72672')
+        self.assertEqual(canonical_station('1001', self.stationList),
+                         '01001')
+        self.assertEqual(canonical_station(' \r\n', self.stationList), '')
+        # Stations not in the master list are kept as given
+        self.assertEqual(canonical_station('99999', self.stationList),
+                         '99999')
+        self.assertEqual(canonical_station('xyzzy', self.stationList),
+                         'XYZZY')
+
+    def test_plan(self):
+        stnlist = ['DNR', '72672', '', 'RIW', 'GJT', '72469', 'riw', 'DNR']
+        self.assertEqual(plan_stations(stnlist, self.stationList),
+                         ['72469', '72672', '72476'])
+
+    def test_dry_run(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ['7267220190528122812.txt',
+                         '7247620190528122812.txt.gz']:
+                open(os.path.join(tmpdir, name), 'w').close()
+            self.assertEqual(list_files(tmpdir),
+                             set(['7267220190528122812.txt',
+                                  '7247620190528122812.txt']))
+            availability = Availability(tmpdir, '00,12')
+            missing = MissingCache(tmpdir)
+            missing.add('72469', 'TEXT:LIST', datetime(2019, 5, 28, 12))
+
+            plan = Plan(RAOBtextlist, availability, missing, tmpdir)
+            for hour in ['06', '12']:
+                for stn in ['72672', '72476', '72469']:
+                    plan.add(stn, '2019', '05', '28', hour)
+        self.assertEqual(plan.get_count('downloaded'), 2)
+        self.assertEqual(plan.get_count('unavailable'), 3)
+        self.assertEqual(plan.get_count('missing'), 1)
+        self.assertEqual(plan.get_count('retrieve'), 0)
+        self.assertEqual(plan.stations['72672'],
+                         {'downloaded': 1, 'unavailable': 1, 'missing': 0,
+                          'retrieve': 0})
+
+        # Estimates
+        plan = Plan(RAOBtextlist, path=getrootdir())
+        for day in range(1, 21):
+            plan.add('72672', '2019', '05', '%02d' % day, '12')
+        self.assertEqual(plan.get_count('retrieve'), 20)
+        self.assertEqual(plan.get_seconds(), 40)
+        self.assertEqual(plan.get_seconds(concurrency=4), 10)
+        self.assertEqual(plan.get_seconds(rate=0.5), 80)
+        summary = plan.get_summary()
+        self.assertIn("  To retrieve: 20 (40 requests, about 0.3 MB)",
+                      summary)
+        self.assertEqual(summary[-1], "  72672: 20/0/0/0")
@@ -0,0 +1,613 @@
+###############################################################################
+# Tests of the network retrieval path, run against a local stand-in for the
+# UWyo archive (see uwyoserver.py)
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import unittest
+import os
+import json
+import time
+import tempfile
+import threading
+
+from lib.raobget import RAOBget
+from lib.rwget import RAOBwget
+from lib.raobroot import getrootdir
+from lib.storage import read_text
+from lib.metrics import runmetrics
+from lib.scheduler import JOURNAL
+from lib.inventory import Inventory, INVENTORY
+from raobtype.textlist import RAOBtextlist
+from raobtype.gifskewt import RAOBgifskewt
+from raobtype.sounding import parse_csv
+from gui.raobworker import RAOBworker
+from uwyoserver import UWyoServer
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QEventLoop, QTimer, Qt
+
+
+class TestRAOBwget(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = UWyoServer(seed=0)
+        cls.url = cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.reset()
+        self.server.error_rate = 0.0
+        self.server.launch_hours = None
+        self.server.latency = 0.0
+        self.server.throttle = 0.0
+        self.server.gzip = True
+        self.server.ranges = True
+        self.server.truncate = 1.0
+        self.server.trickle = 0.0
+
+        # Write all retrieved files to a scratch dir
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmpdir.name)
+
+        self.raob = RAOBget()
+        request = self.raob.request
+        request.set_server(self.url)
+        request.set_region('North America')
+        request.set_type('TEXT:LIST')
+        request.set_year('2019')
+        request.set_month('05')
+        request.set_begin('28', '12')
+        request.set_end('28', '12')
+        request.set_stnm('72672')
+        request.set_stnlist_file('config/snstns.tbl')
+        request.set_cachedir(self.tmpdir.name)
+
+    def compare(self, ctrlfile, outfile):
+        with open(ctrlfile) as ctrl, open(outfile) as out:
+            self.assertTrue([row1 for row1 in ctrl] == [row for row in out],
+                            "files " + ctrlfile + " and " + outfile +
+                            " differ ")
+
+    def test_get_url(self):
+        ctrlurl = self.url + "/cgi-bin/sounding?region=naconf&" + \
+                  "TYPE=TEXT%3ALIST&YEAR=2019&MONTH=05&FROM=2812&TO=2812&" + \
+                  "STNM=72672"
+        rwget = RAOBwget()
+        self.assertEqual(rwget.get_url(self.raob.request), ctrlurl)
+
+    def test_TEXT_LIST(self):
+        textlist = RAOBtextlist()
+        status, outfile = textlist.retrieve(None, self.raob.request)
+        self.assertTrue(status)
+        self.compare(getrootdir() + "/test/data/7267220190528122812.ctrl",
+                     outfile)
+        self.assertGreater(self.server.get_stats()['bytes'], 0)
+
+        # A second request for the same file is skipped
+        status, outfile = textlist.retrieve(None, self.raob.request)
+        self.assertFalse(status)
+
+    def test_refresh(self):
+        self.raob.request.set_report('report.json')
+        self.raob.get(None, None)
+        size = os.path.getsize('7267220190528122812.txt')
+        # The page was sent gzip compressed
+        self.assertLess(self.server.get_stats()['bytes'], size)
+        self.assertGreater(runmetrics.get_count('bytes_avoided'), 0)
+        self.assertTrue(os.path.isfile('7267220190528122812.txt.meta'))
+
+        # Requested again, but not sent again as it hasn't changed (to the
+        # probe or the download)
+        self.raob.request.set_refresh(True)
+        self.raob.request.set_begin('28', '12')
+        self.raob.request.set_end('28', '12')
+        self.raob.get(None, None)
+        self.assertEqual(self.server.get_stats()['not_modified'], 2)
+        with open('report.json') as f:
+            report = json.load(f)
+        self.assertEqual(report['counters']['not_modified'], 1)
+        self.assertEqual(report['counters']['bytes_avoided'], size)
+        self.assertNotIn('downloads', report['counters'])
+
+        # A changed file is downloaded again
+        with open('7267220190528122812.txt.meta', 'w') as f:
+            json.dump({'etag': '"old"', 'size': size}, f)
+        textlist = RAOBtextlist()
+        status, outfile = textlist.retrieve(None, self.raob.request)
+        self.assertTrue(status)
+        self.compare(getrootdir() + "/test/data/7267220190528122812.ctrl",
+                     outfile)
+
+    def test_resume(self):
+        # A download cut short is resumed from where it stopped
+        runmetrics.reset()
+        self.server.gzip = False
+        self.server.truncate = 0.5
+        textlist = RAOBtextlist()
+        status, outfile = textlist.retrieve(None, self.raob.request)
+        self.assertTrue(status)
+        self.compare(getrootdir() + "/test/data/7267220190528122812.ctrl",
+                     outfile)
+        self.assertEqual(self.server.get_stats()['partial'], 1)
+        self.assertEqual(runmetrics.get_count('resumed'), 1)
+        self.assertFalse(os.path.isfile(outfile + '.part'))
+
+        # So is a part left by an interrupted run
+        os.remove(outfile)
+        with open(getrootdir() + "/test/data/7267220190528122812.ctrl",
+                  'rb') as f:
+            data = f.read()
+        with open(outfile + '.part', 'wb') as f:
+            f.write(data[:1000])
+        self.server.truncate = 1.0
+        status, outfile = textlist.retrieve(None, self.raob.request)
+        self.assertTrue(status)
+        self.compare(getrootdir() + "/test/data/7267220190528122812.ctrl",
+                     outfile)
+        self.assertEqual(self.server.get_stats()['partial'], 2)
+
+    def test_incomplete(self):
+        # A compressed download cut short can't be resumed, nor can one from
+        # a server without Range requests. Nothing is kept.
+        outfile = '7267220190528122812.txt'
+        self.server.truncate = 0.5
+        for ranges in [True, False]:
+            self.server.gzip = ranges
+            self.server.ranges = ranges
+            textlist = RAOBtextlist()
+            status, stored = textlist.retrieve(None, self.raob.request)
+            self.assertFalse(status)
+            self.assertEqual(textlist.rwget.outcome, 'error')
+            self.assertFalse(os.path.isfile(outfile))
+            self.assertFalse(os.path.isfile(outfile + '.part'))
+        self.assertEqual(self.server.get_stats()['partial'], 0)
+
+        # So the next run retrieves it
+        self.server.truncate = 1.0
+        status, stored = textlist.retrieve(None, self.raob.request)
+        self.assertTrue(status)
+
+    def test_compress(self):
+        self.raob.request.set_compress('gzip')
+        textlist = RAOBtextlist()
+        status, outfile = textlist.retrieve(None, self.raob.request)
+        self.assertTrue(status)
+        self.assertEqual(outfile, '7267220190528122812.txt.gz')
+        self.assertFalse(os.path.isfile('7267220190528122812.txt'))
+        with open(getrootdir() + "/test/data/7267220190528122812.ctrl") as f:
+            self.assertEqual(read_text(outfile), f.read())
+
+        # The compressed file counts as already downloaded
+        status, outfile = textlist.retrieve(None, self.raob.request)
+        self.assertFalse(status)
+
+    def test_TEXT_CSV(self):
+        self.raob.request.set_type('TEXT:CSV')
+        self.raob.get(None, None)
+        self.compare(getrootdir() + "/test/data/7267220190528122812.csv.ctrl",
+                     '7267220190528122812.csv')
+
+        # Synthetic CSV soundings parse like the TEXT:LIST ones
+        self.raob.request.set_stnm('72476')
+        self.raob.request.set_begin('28', '12')
+        self.raob.request.set_end('28', '12')
+        self.raob.get(None, None)
+        with open('7247620190528122812.csv') as f:
+            sounding = parse_csv(f.read())[0]
+        self.assertEqual(sounding.columns[0:2], ['PRES', 'HGHT'])
+        self.assertEqual(sounding.get('PRES')[-1], 20.0)
+
+    def test_mtp_dir(self):
+        # A missing MTP dir can't be asked for from a background thread. The
+        # RAOB is skipped with an error instead.
+        self.app = QApplication.instance() or QApplication([])
+        self.raob.request.set_mtp(True)
+        self.raob.request.set_mtp_dir('nowhere')
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            RAOBtextlist().retrieve(None, self.raob.request)))
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [(False, False)])
+        self.assertEqual(self.server.get_stats()['requests'], 0)
+
+    def test_synthetic(self):
+        self.raob.request.set_stnm('72476')
+        textlist = RAOBtextlist()
+        status, outfile = textlist.retrieve(None, self.raob.request)
+        self.assertTrue(status)
+        with open(outfile) as out:
+            self.assertIn('72476 GJT', out.read())
+
+    def test_cant_get(self):
+        self.server.error_rate = 1.0
+        textlist = RAOBtextlist()
+        status, outfile = textlist.retrieve(None, self.raob.request)
+        self.assertFalse(status)
+        self.assertFalse(os.path.isfile(outfile))
+        # Each request for a sounding gets (and counts) one error page
+        stats = self.server.get_stats()
+        self.assertEqual(stats['errors'], stats['requests'])
+
+    def test_coalesce(self):
+        # Concurrent requests for the same RAOB share one download
+        self.server.latency = 0.2
+        results = []
+
+        def retrieve():
+            textlist = RAOBtextlist()
+            results.append(textlist.retrieve(None, self.raob.request))
+
+        threads = [threading.Thread(target=retrieve) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.server.latency = 0.0
+
+        self.assertEqual(sorted([status for status, outfile in results]),
+                         [False, False, True])
+        self.assertEqual(self.server.get_stats()['requests'], 2)  # probe, get
+
+    def test_dedup(self):
+        # Stations listed more than once, by number or id, are requested once
+        with open('test.RSL', 'w') as rsl:
+            rsl.write("72672\nRIW\n\n72476\nriw\n")
+        self.raob.request.set_rsl('test.RSL')
+        self.raob.get(None, None)
+        self.assertEqual(self.raob.total, 2)
+        self.assertEqual(self.server.get_stats()['requests'], 4)
+
+    def test_GIF_SKEWT(self):
+        gifskewt = RAOBgifskewt()
+        status, outfile = gifskewt.retrieve(None, self.raob.request)
+        self.assertTrue(status)
+        self.assertEqual(outfile,
+                         'upperair.SkewT.201905281200.Riverton_WY.gif')
+        with open(outfile, 'rb') as gif:
+            self.assertEqual(gif.read(6), b'GIF87a')
+        gifskewt.cleanup()
+        self.assertFalse(os.path.isfile(gifskewt.get_outfile_html()))
+
+    def test_unable_to_generate(self):
+        self.server.error_rate = 1.0
+        gifskewt = RAOBgifskewt()
+        status, outfile = gifskewt.retrieve(None, self.raob.request)
+        self.assertFalse(status)
+
+    def test_report(self):
+        self.raob.request.set_report('report.json')
+        self.raob.request.set_prometheus('raobget.prom')
+        self.raob.get(None, None)
+
+        with open('report.json') as f:
+            report = json.load(f)
+        for phase in ['build_url', 'probe', 'download', 'validate',
+                      'retrieve']:
+            self.assertEqual(report['phases'][phase]['count'], 1)
+        self.assertIn('download', report['stations']['72672'])
+        self.assertEqual(report['counters']['downloads'], 1)
+
+        with open('raobget.prom') as f:
+            prom = f.read()
+        self.assertIn('raobget_phase_seconds_count{phase="download"} 1',
+                      prom)
+
+    def test_eventlog(self):
+        self.raob.request.set_eventlog('events.jsonl')
+        self.raob.get(None, None)
+
+        with open('events.jsonl') as f:
+            events = [json.loads(line) for line in f]
+        retrieved = [e for e in events if e['msg'].startswith('Retrieved')]
+        self.assertEqual(len(retrieved), 1)
+        self.assertEqual(retrieved[0]['level'], 'info')
+        self.assertEqual(retrieved[0]['station'], '72672')
+        self.assertEqual(retrieved[0]['phase'], 'retrieve')
+
+    def test_queue(self):
+        # Plan once, then share the retrievals between two workers
+        with open('test.RSL', 'w') as rsl:
+            rsl.write("72672\n72476\n72469\n")
+        self.raob.request.set_rsl('test.RSL')
+        self.raob.request.set_queue('queue')
+        self.raob.request.set_enqueue(True)
+        self.raob.get(None, None)
+        self.assertEqual(len(os.listdir('queue/todo')), 3)
+
+        workers = []
+        for i in range(2):
+            worker = RAOBget()
+            worker.request.set_server(self.url)
+            worker.request.set_queue('queue')
+            worker.request.set_rate('0')
+            worker.request.set_cachedir(self.tmpdir.name)
+            workers.append(threading.Thread(target=worker.get,
+                                            args=(None, None)))
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(len(os.listdir('queue/done')), 3)
+        self.assertEqual(len(os.listdir('queue/todo')), 0)
+        self.assertTrue(os.path.isfile('7247620190528122812.txt'))
+
+    def test_queue_exists(self):
+        # Each request to the server takes a turn from the shared rate
+        self.raob.request.set_queue('queue')
+        self.raob.request.set_enqueue(True)
+        self.raob.get(None, None)
+        worker = RAOBget()
+        worker.request.set_server(self.url)
+        worker.request.set_queue('queue')
+        worker.request.set_rate('1000')
+        worker.request.set_cachedir(self.tmpdir.name)
+        worker.get(None, None)
+        self.assertEqual(len(os.listdir('queue/done')), 1)
+        self.assertEqual(len(os.listdir('queue/slots')), 2)  # probe, get
+
+        # Working on the queue again in a dir that already has the file
+        # needs no requests, and the task is done rather than failed
+        os.rename('queue/done/' + os.listdir('queue/done')[0],
+                  'queue/todo/' + os.listdir('queue/done')[0])
+        worker.get(None, None)
+        self.assertEqual(len(os.listdir('queue/done')), 1)
+        self.assertEqual(len(os.listdir('queue/failed')), 0)
+        self.assertEqual(len(os.listdir('queue/slots')), 2)
+
+        # A rate that isn't a number is reported, and nothing is retrieved
+        os.rename('queue/done/' + os.listdir('queue/done')[0],
+                  'queue/todo/' + os.listdir('queue/done')[0])
+        worker.request.set_rate('abc')
+        worker.get(None, None)
+        self.assertEqual(len(os.listdir('queue/todo')), 1)
+
+    def test_availability(self):
+        # Requests for hours a station doesn't launch at are skipped
+        self.server.launch_hours = [0, 12]
+        self.raob.request.set_freq('6')
+        self.raob.request.set_begin('28', '00')
+        self.raob.request.set_end('29', '18')
+        self.raob.request.set_launch_hours('72672=00,12')
+        self.raob.get(None, None)
+        self.assertEqual(runmetrics.get_count('skipped_unavailable'), 4)
+        self.assertEqual(runmetrics.get_count('downloads'), 4)
+
+        # Without a schedule, every hour is requested and the outcomes are
+        # remembered
+        self.raob.request.set_launch_hours('')
+        self.raob.request.set_stnm('72476')
+        self.raob.request.set_begin('28', '00')
+        self.raob.request.set_end('29', '18')
+        self.raob.get(None, None)
+        self.assertEqual(runmetrics.get_count('skipped_unavailable'), 0)
+        with open(os.path.join(self.tmpdir.name, 'availability.json')) as f:
+            table = json.load(f)
+        self.assertEqual(table['72476']['06']['attempts'], 2)
+        self.assertEqual(table['72476']['06']['found'], 0)
+        self.assertEqual(table['72476']['12']['found'], 2)
+
+    def test_known_missing(self):
+        # RAOBs the archive reported missing aren't requested again
+        self.server.error_rate = 1.0
+        self.raob.request.set_freq('12')
+        self.raob.request.set_begin('28', '00')
+        self.raob.request.set_end('29', '12')
+        self.raob.get(None, None)
+        self.assertEqual(self.server.get_stats()['requests'], 8)  # probe, get
+
+        self.server.reset()
+        self.raob.request.set_begin('28', '00')
+        self.raob.request.set_end('29', '12')
+        self.raob.get(None, None)
+        self.assertEqual(runmetrics.get_count('skipped_known_missing'), 4)
+        self.assertEqual(self.server.get_stats()['requests'], 0)
+
+    def test_deadline(self):
+        # Nothing can be retrieved before a deadline that has passed, so
+        # everything is left for the next run
+        with open('test.RSL', 'w') as rsl:
+            rsl.write("72672\n72476\n72469\n")
+        self.raob.request.set_rsl('test.RSL')
+        self.raob.request.set_deadline('0')
+        self.raob.get(None, None)
+        self.assertEqual(runmetrics.get_count('deferred'), 3)
+        self.assertEqual(self.server.get_stats()['requests'], 0)
+        self.assertTrue(os.path.isfile(JOURNAL))
+
+        # The next run retrieves them, nearest the point first
+        order = []
+        self.raob.progress = lambda done, total, stn: order.append(stn)
+        self.raob.request.set_deadline('')
+        self.raob.request.set_stnm('72476')
+        self.raob.request.set_rsl('')
+        self.raob.request.set_priority('near')
+        self.raob.request.set_near('43.06,-108.48')
+        self.raob.get(None, None)
+        self.assertEqual(order, ['72672', '72476', '72469'])
+        self.assertFalse(os.path.isfile(JOURNAL))
+
+    def test_concurrency(self):
+        # Retrieve several RAOBs at once, more as the server keeps up
+        with open('test.RSL', 'w') as rsl:
+            rsl.write("72672\n72476\n72469\n")
+        self.server.latency = 0.02
+        self.raob.request.set_rsl('test.RSL')
+        self.raob.request.set_begin('28', '00')
+        self.raob.request.set_end('29', '12')
+        self.raob.request.set_concurrency('1:4')
+        self.raob.request.set_report('report.json')
+        done = []
+        self.raob.progress = lambda done_, total, stn: done.append(done_)
+        self.raob.get(None, None)
+        self.assertEqual(done, list(range(1, 13)))
+        self.assertEqual(runmetrics.get_count('downloads'), 12)
+        self.assertTrue(os.path.isfile('7246920190529122912.txt'))
+        with open('report.json') as f:
+            report = json.load(f)
+        limits = [value for (t, value) in report['series']['concurrency']]
+        self.assertEqual(limits[0], 1)
+        self.assertGreater(max(limits), 1)
+
+        # Back off when the server throttles requests
+        self.server.reset()
+        self.server.throttle = 20
+        self.raob.request.set_refresh(True)
+        self.raob.get(None, None)
+        self.assertGreater(self.server.get_stats()['throttled'], 0)
+        self.assertGreater(runmetrics.get_count('congestion'), 0)
+
+    def test_timeout(self):
+        # A server that doesn't answer costs the read timeout
+        self.server.latency = 1.0
+        self.raob.request.set_timeout('5,0.2')
+        start = time.time()
+        self.raob.get(None, None)
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual(self.raob.outcome, 'error')
+        self.assertEqual(runmetrics.get_count('timeouts_probe'), 1)
+        self.assertFalse(os.path.isfile('7267220190528122812.txt'))
+
+        # Work in flight at the deadline times out by then, and is left for
+        # the next run
+        with open('test.RSL', 'w') as rsl:
+            rsl.write("72672\n72476\n")
+        self.raob.request.set_rsl('test.RSL')
+        self.raob.request.set_timeout('')
+        self.raob.request.set_deadline('0.5')
+        start = time.time()
+        self.raob.get(None, None)
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual(runmetrics.get_count('timeouts'), 1)
+        with open(JOURNAL) as f:
+            self.assertEqual(len(json.load(f)['tasks']), 2)
+
+        # A server that sends a little at a time, well within the read
+        # timeout, can't keep a download going past the deadline
+        os.remove(JOURNAL)
+        self.server.latency = 0.0
+        self.server.gzip = False
+        self.server.trickle = 0.2
+        self.raob.request.set_rsl('')
+        self.raob.request.set_deadline('0.5')
+        start = time.time()
+        self.raob.get(None, None)
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual(self.raob.outcome, 'error')
+        self.assertEqual(runmetrics.get_count('timeouts_download'), 1)
+        self.assertFalse(os.path.isfile('7267220190528122812.txt'))
+
+    def test_plan(self):
+        # A dry run doesn't contact the server or write any RAOBs
+        with open('test.RSL', 'w') as rsl:
+            rsl.write("72672\n72476\n72469\n")
+        self.raob.request.set_rsl('test.RSL')
+        self.raob.request.set_begin('28', '00')
+        self.raob.request.set_end('29', '12')
+        self.raob.request.set_plan(True)
+        self.raob.get(None, None)
+        self.assertEqual(self.server.get_stats()['requests'], 0)
+        self.assertEqual([f for f in os.listdir('.') if f.endswith('.txt')],
+                         [])
+
+    def test_inventory(self):
+        # Retrieved RAOBs are registered, and not requested again
+        with open('test.RSL', 'w') as rsl:
+            rsl.write("72672\n72476\n")
+        self.raob.request.set_rsl('test.RSL')
+        self.raob.get(None, None)
+        inventory = Inventory(os.path.join(self.tmpdir.name, INVENTORY))
+        records = inventory.query()
+        self.assertEqual([(r['station'], r['valid']) for r in records],
+                         [('72476', '2019052812'), ('72672', '2019052812')])
+        self.assertEqual(records[1]['path'], os.path.abspath(
+            '7267220190528122812.txt'))
+        self.assertIn('STNM=72672', records[1]['url'])
+
+        self.server.reset()
+        self.raob.get(None, None)
+        self.assertEqual(self.server.get_stats()['requests'], 0)
+
+        # Files downloaded before there was an inventory are added
+        inventory.remove('72476', '2019052812', 'TEXT:LIST')
+        self.raob.get(None, None)
+        self.assertEqual(self.server.get_stats()['requests'], 0)
+        self.assertTrue(inventory.has('72476', '2019052812', 'TEXT:LIST'))
+
+        # A RAOB retrieved to another dir is retrieved to this one too
+        self.raob.request.set_rsl('')
+        self.raob.request.set_stnm('72672')
+        os.mkdir('other')
+        os.chdir('other')
+        self.server.reset()
+        self.raob.get(None, None)
+        self.assertTrue(os.path.isfile('7267220190528122812.txt'))
+        self.assertEqual(inventory.get('72672', '2019052812',
+                                       'TEXT:LIST')['path'],
+                         os.path.abspath('7267220190528122812.txt'))
+        # and the first is still in the inventory
+        self.assertTrue(inventory.has('72672', '2019052812', 'TEXT:LIST',
+                                      '../7267220190528122812.txt'))
+
+        # So is one whose file has been removed since
+        os.remove('7267220190528122812.txt')
+        self.raob.get(None, None)
+        self.assertTrue(os.path.isfile('7267220190528122812.txt'))
+        self.assertGreater(self.server.get_stats()['requests'], 2)
+        inventory.close()
+
+    def run_worker(self, cancel_after=0):
+        """ Retrieve in a background worker and collect its signals """
+        self.app = QApplication.instance() or QApplication([])
+        with open('test.RSL', 'w') as rsl:
+            rsl.write("72672\n72476\n72469\n")
+        self.raob.request.set_rsl('test.RSL')
+
+        worker = RAOBworker(self.raob)
+        progress = []
+        retrieved = []
+
+        def on_progress(done, total, stn, eta):
+            progress.append((done, total, stn))
+            if cancel_after and done == cancel_after:
+                worker.cancel()
+
+        # Direct connection, so cancel is called from the worker thread
+        # before it moves on to the next station
+        worker.progress.connect(on_progress, Qt.DirectConnection)
+        worker.retrieved.connect(lambda t, f: retrieved.append((t, f)))
+        loop = QEventLoop()
+        worker.thread.finished.connect(loop.quit)
+        QTimer.singleShot(20000, loop.quit)  # Don't hang if something breaks
+        worker.begin()
+        loop.exec_()
+        return(progress, retrieved)
+
+    def test_worker(self):
+        progress, retrieved = self.run_worker()
+        self.assertEqual(progress[-1], (3, 3, '72469'))
+        self.assertEqual(len(retrieved), 3)
+        self.assertEqual(retrieved[0],
+                         ('TEXT:LIST', '7267220190528122812.txt'))
+
+    def test_worker_cancel(self):
+        progress, retrieved = self.run_worker(cancel_after=1)
+        self.assertEqual(len(progress), 1)
+        self.assertEqual(len(retrieved), 1)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+
+    unittest.main()
@@ -0,0 +1,85 @@
+###############################################################################
+# Unit tests for scheduling retrievals by priority
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import calendar
+import tempfile
+import unittest
+
+from lib.raobroot import getrootdir
+from lib.stationlist import get_station_list
+from lib.scheduler import Scheduler, Journal, parse_priority, parse_weights
+from lib.scheduler import parse_point, parse_deadline, distance
+
+
+def task(stnm, day='28', hour='12'):
+    return({'stnm': stnm, 'raobtype': 'TEXT:LIST', 'region': '',
+            'year': '2019', 'month': '05', 'day': day, 'hour': hour})
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_priority('recent, near'), ['recent', 'near'])
+        self.assertEqual(parse_priority(''), [])
+        with self.assertRaises(ValueError):
+            parse_priority('soonest')
+        self.assertEqual(parse_weights('72672=4; 72476=0.5'),
+                         {'72672': 4.0, '72476': 0.5})
+        self.assertEqual(parse_point('40.0,-105.2'), (40.0, -105.2))
+
+        now = calendar.timegm((2019, 5, 28, 11, 30, 0))
+        self.assertEqual(parse_deadline('600', now), now + 600)
+        self.assertEqual(parse_deadline('12:00', now), now + 1800)
+        self.assertEqual(parse_deadline('11:00', now), now + 84600)
+
+    def test_distance(self):
+        # Denver to Riverton, WY
+        self.assertAlmostEqual(distance(39.77, -104.87, 43.06, -108.48),
+                               480, delta=10)
+
+    def test_order(self):
+        # Without priorities, tasks keep their planned order
+        scheduler = Scheduler()
+        for stn in ['72672', '72476', '72469']:
+            self.assertTrue(scheduler.push(task(stn)))
+        self.assertFalse(scheduler.push(task('72476')))  # Already scheduled
+        self.assertEqual([t['stnm'] for t in scheduler.drain()],
+                         ['72672', '72476', '72469'])
+
+    def test_recent(self):
+        now = calendar.timegm((2019, 5, 29, 0, 0, 0))
+        scheduler = Scheduler(['recent'], now=now)
+        for (day, hour) in [('28', '00'), ('28', '12'), ('29', '00')]:
+            scheduler.push(task('72672', day, hour))
+        self.assertEqual([(t['day'], t['hour']) for t in scheduler.drain()],
+                         [('29', '00'), ('28', '12'), ('28', '00')])
+
+    def test_weight_near(self):
+        stationList = get_station_list(getrootdir() + "/config/snstns.tbl")
+        scheduler = Scheduler(['weight', 'near'], {'72672': 4.0},
+                              (39.11, -108.53), stationList)
+        for stn in ['72469', '72476', '72672', 'NOSUCH']:
+            scheduler.push(task(stn))
+        # Grand Junction is at the point. Riverton is further than Denver,
+        # but weighted up.
+        self.assertEqual([t['stnm'] for t in scheduler.drain()],
+                         ['72672', '72476', '72469', 'NOSUCH'])
+
+    def test_journal(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            journal = Journal(os.path.join(tmpdir, 'journal.json'))
+            self.assertEqual(journal.load(), [])
+            journal.save([task('72672')])
+            self.assertEqual(journal.load(), [task('72672')])
+            journal.save([])
+            self.assertFalse(journal.exists())
+
+
+if __name__ == "__main__":
+
+    unittest.main()
@@ -0,0 +1,99 @@
+###############################################################################
+# Unit tests for parsing TEXT:LIST soundings into arrays
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import unittest
+import datetime
+import numpy as np
+
+from lib.raobroot import getrootdir
+from raobtype.sounding import read_textlist, parse_textlist, parse_csv
+from raobtype.sounding import stack
+
+
+class TestSounding(unittest.TestCase):
+
+    def setUp(self):
+        self.datadir = getrootdir() + "/test/data/"
+
+    def test_read(self):
+        soundings = read_textlist(self.datadir + "7267220190528122812.ctrl")
+        self.assertEqual(len(soundings), 1)
+        sounding = soundings[0]
+        self.assertEqual(sounding.title,
+                         "72672 RIW Riverton Observations at 12Z 28 May 2019")
+        self.assertEqual(sounding.columns[0:4],
+                         ['PRES', 'HGHT', 'TEMP', 'DWPT'])
+        self.assertEqual(sounding.units[0:4], ['hPa', 'm', 'C', 'C'])
+        self.assertEqual(sounding.data.shape, (132, 11))
+        self.assertEqual(sounding.get('PRES')[3], 824.0)
+        self.assertEqual(sounding.get('DWPT')[3], 3.9)
+
+        # Blank values are missing
+        self.assertTrue(np.isnan(sounding.get('TEMP')[0]))
+        self.assertTrue(np.isnan(sounding.get('DRCT')[-1]))
+        self.assertTrue(np.all(np.isnan(sounding.get('NOTACOLUMN'))))
+
+        # Station information
+        self.assertEqual(sounding.get_station(), '72672')
+        self.assertEqual(sounding.get_stnid(), 'RIW')
+        self.assertEqual(sounding.get_time(),
+                         datetime.datetime(2019, 5, 28, 12))
+        self.assertEqual(sounding.get_index('Station elevation'), 1703.0)
+
+    def test_mtp(self):
+        # Files stripped for the MTP parse the same
+        mtp = read_textlist(self.datadir + "726722019052812.ctrl.mtp")[0]
+        ctrl = read_textlist(self.datadir + "7267220190528122812.ctrl")[0]
+        np.testing.assert_array_equal(mtp.data, ctrl.data)
+
+    def test_csv(self):
+        # TEXT:CSV holds the same data as TEXT:LIST
+        with open(self.datadir + "7267220190528122812.csv.ctrl") as f:
+            soundings = parse_csv(f.read())
+        self.assertEqual(len(soundings), 1)
+        ctrl = read_textlist(self.datadir + "7267220190528122812.ctrl")[0]
+        self.assertEqual(soundings[0].columns, ctrl.columns)
+        self.assertEqual(soundings[0].units, ctrl.units)
+        np.testing.assert_array_equal(soundings[0].data, ctrl.data)
+        self.assertEqual(parse_csv(''), [])
+
+        # HTML around the data is ignored, and rows that don't match the
+        # header are skipped
+        text = "<HTML>\n<PRE>PRES,HGHT,TEMP\nhPa,m,C\n1000.0,83,\n" + \
+               "925.0,740\n850.0,abc,1.0\n700.0,3000,-5.1\n</PRE>\n</HTML>\n"
+        sounding = parse_csv(text)[0]
+        self.assertEqual(sounding.columns, ['PRES', 'HGHT', 'TEMP'])
+        self.assertEqual(sounding.units, ['hPa', 'm', 'C'])
+        self.assertEqual(sounding.get('PRES').tolist(), [1000.0, 700.0])
+        self.assertEqual(sounding.skipped, 2)
+        self.assertEqual(parse_csv("<HTML>\n<PRE>\n</PRE>\n</HTML>\n"), [])
+
+    def test_multiple(self):
+        with open(self.datadir + "7267220190528122812.ctrl") as f:
+            text = f.read()
+        soundings = parse_textlist(text + text)
+        self.assertEqual(len(soundings), 2)
+
+    def test_stack(self):
+        soundings = read_textlist(self.datadir + "7267220190528122812.ctrl")
+        soundings += read_textlist(self.datadir + "7267220190528002800.ctrl")
+        s = stack(soundings)
+        self.assertEqual(s['PRES'].shape[0], 2)
+        # Levels without temperature are dropped, so rows start at 824 hPa
+        self.assertEqual(s['PRES'][0, 0], 824.0)
+        for name in ['PRES', 'TEMP', 'DWPT']:
+            self.assertTrue(np.all(np.isfinite(s[name][:, 0])))
+        # The shorter sounding is padded with NaN
+        lengths = np.sum(np.isfinite(s['PRES']), axis=1)
+        self.assertEqual(max(lengths), s['PRES'].shape[1])
+        if lengths[0] != lengths[1]:
+            self.assertTrue(np.isnan(s['PRES'][np.argmin(lengths), -1]))
+
+
+if __name__ == "__main__":
+
+    unittest.main()
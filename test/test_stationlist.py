@@ -1,7 +1,9 @@
 import unittest
 import os
+import time
 
-from lib.stationlist import RAOBstation_list
+from lib.stationlist import RAOBstation_list, RAOBstation_index, \
+    get_station_list
 from lib.raobroot import getrootdir
 
 
@@ -100,6 +102,57 @@ class TestRAOBstation_list(unittest.TestCase):
         self.assertEqual(len(station), 1)
         self.assertDictEqual(station[0], self.stn2['GJT'])
 
+    def test_registry(self):
+        # The station list is only read once
+        stationList = get_station_list(self.stnlist2)
+        self.assertIs(get_station_list(self.stnlist2), stationList)
+        self.assertEqual(stationList.error, "")
+
+        stationList = get_station_list(getrootdir() + "/config/missing.tbl")
+        self.assertRegex(stationList.error, "^ERROR:")
+        self.assertEqual(stationList.station_list, [])
+
+    def test_search(self):
+        stationList = get_station_list(self.stnlist2)
+        stations = stationList.station_list
+
+        # Search by id, number, a word of the name, and name and state
+        found = stationList.search('gjt')
+        self.assertIn(stations.index(self.stn2['GJT']), found)
+        found = stationList.search('72476')
+        self.assertEqual([stations[i]['id'] for i in found], ['GJT     '])
+        found = stationList.search('walker')
+        self.assertEqual([stations[i]['id'] for i in found], ['GJT     '])
+        found = stationList.search('junction co')
+        self.assertIn(stations.index(self.stn2['GJT']), found)
+        for i in found:
+            self.assertEqual(stations[i]['state'], 'CO')
+
+        # Empty search matches everything, nonsense matches nothing
+        self.assertEqual(len(stationList.search('  ')), len(stations))
+        self.assertEqual(stationList.search('zzzqqq'), [])
+
+    def test_search_speed(self):
+        # Filtering a 10k-station table must keep up with typing
+        stations = []
+        for i in range(10000):
+            stations.append({
+                'id': ('K%03d' % (i % 1000)).ljust(8),
+                'number': '%05d' % (10000 + i),
+                'description': ('STATION_%d/FIELD %s' %
+                                (i, 'ABCDEFGHIJ'[i % 10] * 3)).ljust(30),
+                'state': 'CO', 'country': 'US',
+                'lat': ' 3911', 'lon': '-10853', 'elev': ' 1475'})
+        index = RAOBstation_index(stations)
+
+        text = 'station_12 field'
+        start = time.perf_counter()
+        for n in range(1, len(text) + 1):
+            found = index.search(text[0:n])
+        elapsed = (time.perf_counter() - start) / len(text)
+        self.assertEqual(len(found), 111)  # 12, 120-129, 1200-1299
+        self.assertLess(elapsed, 0.016)
+
 
 if __name__ == "__main__":
 
@@ -0,0 +1,92 @@
+###############################################################################
+# Unit tests for compressed storage of retrieved files
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import shutil
+import tempfile
+import unittest
+
+import lib.storage as storage
+from lib.raobroot import getrootdir
+from raobtype.skewt import Skewt
+from raobtype.sounding import read_textlist
+
+
+class TestStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.ctrl = getrootdir() + "/test/data/7267220190528122812.ctrl"
+        self.plain = os.path.join(self.tmpdir.name, '7267220190528122812.txt')
+        shutil.copyfile(self.ctrl, self.plain)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def roundtrip(self, method):
+        size = os.path.getsize(self.plain)
+        outfile = storage.compress(self.plain, method)
+        self.assertEqual(outfile, self.plain + storage.SUFFIX[method])
+        self.assertFalse(os.path.exists(self.plain))
+        self.assertLess(os.path.getsize(outfile), size / 2)
+
+        # Readers can use the plain name
+        self.assertEqual(storage.find_file(self.plain), outfile)
+        with open(self.ctrl) as f:
+            self.assertEqual(storage.read_text(self.plain), f.read())
+
+    def test_gzip(self):
+        self.roundtrip('gzip')
+
+    @unittest.skipIf(not storage.available('zstd'),
+                     'zstandard package not installed')
+    def test_zstd(self):
+        self.roundtrip('zstd')
+
+    def test_missing(self):
+        self.assertIsNone(storage.find_file(self.plain + '.x'))
+        with self.assertRaises(FileNotFoundError):
+            storage.open_text(self.plain + '.x')
+
+    def test_is_complete(self):
+        # Files cut short don't end as a complete file of their kind does
+        with open(self.ctrl, 'rb') as f:
+            data = f.read()
+        self.assertTrue(storage.is_complete(data, self.plain))
+        self.assertFalse(storage.is_complete(data[:-20], self.plain))
+        gif = getrootdir() + \
+            "/test/data/upperair.SkewT.201905280000.Riverton_WY.gif.ctrl"
+        with open(gif, 'rb') as f:
+            data = f.read()
+        self.assertTrue(storage.is_complete(data, 'skewt.gif'))
+        self.assertFalse(storage.is_complete(data[:-1], 'skewt.gif'))
+        # Tables must end with a whole row
+        csv = getrootdir() + "/test/data/7267220190528122812.csv.ctrl"
+        with open(csv, 'rb') as f:
+            data = f.read()
+        self.assertTrue(storage.is_complete(data, 'sounding.csv'))
+        self.assertFalse(storage.is_complete(data[:-1], 'sounding.csv'))
+        self.assertFalse(storage.is_complete(data[:-20], 'sounding.csv'))
+        self.assertFalse(storage.is_complete(b'PRES,HGHT', 'sounding.csv'))
+        # Others have no end marker to check
+        self.assertTrue(storage.is_complete(b'PNG', 'skewt.png'))
+
+        # Stored files are checked as they were retrieved
+        outfile = storage.compress(self.plain, 'gzip')
+        self.assertTrue(storage.is_complete(storage.read_bytes(outfile),
+                                            outfile))
+
+    def test_readers(self):
+        skewt = Skewt(None)
+        plain = skewt.read_data(self.plain, False)
+        sounding = read_textlist(self.plain)[0]
+        storage.compress(self.plain, 'gzip')
+
+        self.assertTrue(skewt.read_data(self.plain, False).equals(plain))
+        self.assertTrue(skewt.read_data(self.plain + '.gz', False)
+                        .equals(plain))
+        self.assertEqual(read_textlist(self.plain)[0].info, sounding.info)
@@ -0,0 +1,45 @@
+###############################################################################
+# Unit tests for the timeouts on network operations
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import time
+import socket
+import unittest
+from urllib.error import URLError
+
+from lib.timeouts import Timeouts, parse_timeout, is_timeout, CONNECT, READ
+from lib.timeouts import MINIMUM
+
+
+class TestTimeouts(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_timeout(''), (CONNECT, READ))
+        self.assertEqual(parse_timeout('5'), (5.0, READ))
+        self.assertEqual(parse_timeout('5,30'), (5.0, 30.0))
+        for value in ['0', '5,-1', '1,2,3', 'soon']:
+            with self.assertRaises(ValueError):
+                parse_timeout(value)
+
+    def test_deadline(self):
+        # Timeouts are cut to the time left before the deadline
+        timeouts = Timeouts()
+        timeouts.set(10.0, 60.0, time.time() + 30.0)
+        self.assertEqual(timeouts.get_connect(), 10.0)
+        self.assertAlmostEqual(timeouts.get_read(), 30.0, places=1)
+        timeouts.set_deadline(time.time() - 1.0)
+        self.assertEqual(timeouts.get_read(), MINIMUM)
+        timeouts.set_deadline(None)
+        self.assertEqual(timeouts.get_read(), 60.0)
+
+    def test_is_timeout(self):
+        self.assertTrue(is_timeout(socket.timeout('timed out')))
+        self.assertTrue(is_timeout(URLError(socket.timeout('timed out'))))
+        self.assertFalse(is_timeout(URLError('refused')))
+
+
+if __name__ == "__main__":
+    unittest.main()
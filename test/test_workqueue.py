@@ -0,0 +1,127 @@
+###############################################################################
+# Unit tests for the shared directory work queue
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import time
+import tempfile
+import threading
+import unittest
+
+from lib.workqueue import WorkQueue, Heartbeat
+
+
+def make_tasks(stations, hours=('00', '12'), raobtype='TEXT:LIST'):
+    return([{'stnm': stn, 'raobtype': raobtype, 'region': '',
+             'year': '2019', 'month': '05', 'day': '28', 'hour': hr}
+            for hr in hours for stn in stations])
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.queuedir = os.path.join(self.tmpdir.name, 'queue')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_enqueue(self):
+        queue = WorkQueue(self.queuedir, rate=0)
+        tasks = make_tasks(['72672', '72476'])
+        self.assertEqual(queue.enqueue(tasks), 4)
+        self.assertEqual(queue.get_counts()['todo'], 4)
+
+        # Enqueuing an overlapping plan only adds the new tasks, even once
+        # tasks have been claimed or done
+        name, task = queue.claim()
+        self.assertEqual(name, '2019052800_72476_TEXT-LIST.json')
+        self.assertEqual(task['stnm'], '72476')
+        queue.complete(name, 'done')
+        queue.claim()
+        self.assertEqual(queue.enqueue(make_tasks(['72672', '72469'])), 2)
+        self.assertEqual(queue.get_counts(),
+                         {'todo': 4, 'claimed': 1, 'done': 1, 'failed': 0})
+
+        # The same stations and times as another type are separate tasks
+        self.assertEqual(queue.enqueue(make_tasks(['72672'], ['12'],
+                                                  'GIF:SKEWT')), 1)
+        self.assertEqual(queue.find('2019052812_72672_GIF-SKEWT.json'),
+                         'todo')
+
+    def test_claim(self):
+        # Workers racing for tasks each get different ones
+        WorkQueue(self.queuedir).enqueue(
+            make_tasks([str(stn) for stn in range(100)]))
+        claimed = []
+
+        def work(worker):
+            queue = WorkQueue(self.queuedir, rate=0, worker=worker)
+            while True:
+                name, task = queue.claim()
+                if name is None:
+                    return
+                claimed.append(name)
+                queue.complete(name, 'done')
+
+        threads = [threading.Thread(target=work, args=('w' + str(i),))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(claimed), 200)
+        self.assertEqual(len(set(claimed)), 200)
+        self.assertEqual(WorkQueue(self.queuedir).get_counts()['done'], 200)
+
+    def test_requeue(self):
+        dead = WorkQueue(self.queuedir, lease=10, worker='dead')
+        dead.enqueue(make_tasks(['72672'], ['12']))
+        name, task = dead.claim()
+
+        live = WorkQueue(self.queuedir, lease=10, worker='live')
+        self.assertEqual(live.claim(), (None, None))
+        self.assertEqual(live.requeue_stale(), 0)  # Lease not expired yet
+
+        # Heartbeat stops
+        past = time.time() - 11
+        os.utime(dead.get_claimed(name), (past, past))
+        self.assertEqual(live.requeue_stale(), 1)
+        self.assertEqual(live.claim()[0], name)
+
+        # The dead worker can't complete a task it has lost
+        dead.complete(name, 'done')
+        self.assertEqual(live.get_counts()['done'], 0)
+
+    def test_heartbeat(self):
+        queue = WorkQueue(self.queuedir, lease=0.3)
+        queue.enqueue(make_tasks(['72672'], ['12']))
+        name, task = queue.claim()
+        with Heartbeat(queue, name):
+            time.sleep(0.5)
+            self.assertEqual(queue.requeue_stale(), 0)
+        time.sleep(0.4)
+        self.assertEqual(queue.requeue_stale(), 1)
+
+    def test_rate(self):
+        # Requests from all workers are spread out to the shared rate
+        times = []
+
+        def work(worker):
+            queue = WorkQueue(self.queuedir, rate=20, worker=worker)
+            for i in range(3):
+                queue.wait_turn()
+                times.append(time.time())
+
+        threads = [threading.Thread(target=work, args=('w' + str(i),))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        times.sort()
+        # 12 requests at 20/sec take at least 10 intervals
+        self.assertGreaterEqual(times[-1] - times[0], 0.5)
@@ -0,0 +1,471 @@
+###############################################################################
+# A local stand-in for the University of Wyoming Radiosonde Archive. Serves
+# the cgi-bin/sounding and upperair/images endpoints used by RAOBget so that
+# the network path can be tested and benchmarked offline, e.g.
+#   http://localhost:8080/cgi-bin/sounding?region=naconf&TYPE=TEXT%3ALIST&
+#       YEAR=2019&MONTH=05&FROM=2812&TO=2812&STNM=72672
+#
+# Requests that match the fixtures in test/data are answered with those files.
+# All other stations/times are answered with a synthetic sounding built from
+# the station metadata in config/snstns.tbl. Latency, the rate of "Can't get"
+# error pages, and throttling are configurable.
+#
+# Responses carry an ETag, and conditional requests (If-None-Match) for an
+# unchanged response get a 304 Not Modified. Text is gzip compressed for
+# clients that accept it. Uncompressed responses support Range requests, and
+# responses can be cut short (truncate) to test resuming downloads, or sent
+# slowly (trickle) to test that downloads stop at the deadline.
+#
+# To run standalone (from the src dir):
+#   python3 ../test/uwyoserver.py --port 8080 --latency 0.2
+#   python3 RAOBget.py --server http://localhost:8080 --stnm 72672 ...
+#
+# Written in Python 3
+#
+# COPYRIGHT:   University Corporation for Atmospheric Research, 2019
+###############################################################################
+import os
+import sys
+import gzip
+import math
+import hashlib
+import time
+import random
+import argparse
+import threading
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Allow running standalone from any dir; the RAOBget code lives in ../src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+from lib.raobroot import getrootdir  # noqa: E402
+from lib.stationlist import RAOBstation_list  # noqa: E402
+
+datadir = os.path.join(getrootdir(), 'test', 'data')
+
+# Fixtures served verbatim when the request matches them exactly
+fixtures = {
+    ('TEXT%3ALIST', '72672', '2019', '05', '2812'):
+        '7267220190528122812.ctrl',
+    ('GIF%3ASKEWT', '72672', '2019', '05', '2812'):
+        '7267220190528122812.html.ctrl',
+    ('TEXT%3ACSV', '72672', '2019', '05', '2812'):
+        '7267220190528122812.csv.ctrl',
+}
+gif_fixture = 'upperair.SkewT.201905280000.Riverton_WY.gif.ctrl'
+
+# Standard pressure levels used to build synthetic soundings
+levels = [1000.0, 925.0, 850.0, 700.0, 500.0, 400.0, 300.0, 250.0, 200.0,
+          150.0, 100.0, 70.0, 50.0, 30.0, 20.0]
+
+
+class UWyoServer():
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 throttle=0.0, seed=None):
+        """
+        Configure the stand-in server.
+
+        Parameters:
+            port: port to listen on. 0 picks a free port.
+            latency: seconds to wait before answering each request
+            jitter: maximum additional random wait (seconds)
+            error_rate: fraction [0-1] of sounding requests answered with an
+                        error page ("Can't get ..." or "Sorry, unable to
+                        generate ...")
+            throttle: maximum requests/second served. Requests over the limit
+                      get an HTTP 503. 0 turns throttling off.
+            seed: seed for the random number generator, for repeatable runs
+        """
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle = throttle
+        self.random = random.Random(seed)
+        self.launch_hours = None  # If set, hours (ints) that have soundings
+        self.gzip = True          # Compress text for clients that accept it
+        self.ranges = True        # Answer Range requests
+        self.truncate = 1.0       # Fraction of each full response body sent
+        self.trickle = 0.0        # Seconds to wait before each kB of a body
+
+        self.lock = threading.Lock()
+        self.reset()
+
+        self.stationList = RAOBstation_list()
+        self.stationList.read(os.path.join(getrootdir(), 'config',
+                                           'snstns.tbl'))
+
+        self.httpd = None
+        self.thread = None
+
+    def reset(self):
+        """ Zero the request counters """
+        with self.lock:
+            self.requests = 0       # Requests received
+            self.errors = 0         # Error pages served
+            self.throttled = 0      # Requests rejected with a 503
+            self.not_modified = 0   # Requests answered with a 304
+            self.partial = 0        # Range requests answered with a 206
+            self.bytes = 0          # Bytes of response bodies sent
+            self.last = 0.0         # Time of last request (for throttling)
+
+    def start(self):
+        """ Start serving in a background thread. Returns the base URL """
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', self.port),
+                                         UWyoHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.uwyo = self
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return(self.get_url())
+
+    def stop(self):
+        """ Stop serving """
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def get_url(self):
+        """ Return the base URL to pass to RAOBget --server """
+        return("http://127.0.0.1:" + str(self.port))
+
+    def get_stats(self):
+        """ Return a copy of the request counters """
+        with self.lock:
+            return({'requests': self.requests, 'errors': self.errors,
+                    'throttled': self.throttled, 'bytes': self.bytes,
+                    'not_modified': self.not_modified,
+                    'partial': self.partial})
+
+    def admit(self):
+        """
+        Count the request and decide whether it is throttled. Throttling
+        enforces a minimum spacing of 1/throttle seconds between requests.
+        """
+        with self.lock:
+            self.requests += 1
+            if self.throttle > 0:
+                now = time.time()
+                if now - self.last < 1.0 / self.throttle:
+                    self.throttled += 1
+                    return(False)
+                self.last = now
+        return(True)
+
+    def delay(self):
+        """ Simulate network/server latency """
+        wait = self.latency
+        if self.jitter > 0:
+            wait += self.random.uniform(0, self.jitter)
+        if wait > 0:
+            time.sleep(wait)
+
+    def is_error(self):
+        """ Randomly decide whether to answer with an error page """
+        if self.error_rate <= 0:
+            return(False)
+        with self.lock:
+            error = self.random.random() < self.error_rate
+            if error:
+                self.errors += 1
+        return(error)
+
+    def sent(self, nbytes):
+        with self.lock:
+            self.bytes += nbytes
+
+    def unchanged(self):
+        with self.lock:
+            self.not_modified += 1
+
+    def resumed(self):
+        with self.lock:
+            self.partial += 1
+
+    def get_station(self, stnm):
+        """ Find the station metadata for a station number or id """
+        if stnm.isdigit():
+            station = self.stationList.get_by_stnm(stnm)
+        else:
+            station = self.stationList.get_by_id(stnm.upper())
+        if len(station) == 0:
+            return(None)
+        return(station[0])
+
+    def title(self, station, valid):
+        """ Build the '72672 RIW Riverton Observations at ...' title """
+        name = station['description'].strip().replace('_', ' ').title()
+        return(station['number'] + " " + station['id'].strip() + " " +
+               name + " Observations at " + valid.strftime('%HZ %d %b %Y'))
+
+    def cant_get(self, stnm, valid):
+        """ The page UWyo returns when a sounding does not exist """
+        return("<HTML>\n<TITLE>University of Wyoming - Radiosonde Data" +
+               "</TITLE>\n<BODY BGCOLOR=\"white\">\n<H2>Can't get " + stnm +
+               " " + valid.strftime('%HZ %d %b %Y') + "</H2>\n" +
+               "</BODY>\n</HTML>\n")
+
+    def unable(self, stnm, valid):
+        """ The page UWyo returns when a skewt could not be generated """
+        return("<HTML>\n<TITLE>University of Wyoming - Radiosonde Data" +
+               "</TITLE>\n<BODY BGCOLOR=\"white\">\n" +
+               "Sorry, unable to generate skewt for " + stnm + " " +
+               valid.strftime('%HZ %d %b %Y') + "\n</BODY>\n</HTML>\n")
+
+    def profile(self, station):
+        """
+        Build the levels of a synthetic sounding for the station. The profile
+        is a standard atmosphere with a moist boundary layer, so it parses and
+        plots like a real sounding.
+
+        Returns a list of (PRES, HGHT, TEMP, DWPT, RELH, MIXR, DRCT, SKNT,
+        THTA, THTE, THTV) tuples
+        """
+        elev = float(station['elev'])
+        rows = []
+        for pres in levels:
+            # Standard atmosphere height, temperature up to the tropopause
+            hght = 44330.8 * (1 - (pres / 1013.25) ** 0.190263)
+            if hght < elev:
+                continue
+            temp = max(15.0 - 0.0065 * hght, -56.5)
+            dwpt = temp - 2.0 - 20.0 * (1 - pres / 1000.0)
+            es = 6.112 * math.exp(17.67 * temp / (temp + 243.5))
+            e = 6.112 * math.exp(17.67 * dwpt / (dwpt + 243.5))
+            relh = 100.0 * e / es
+            mixr = 1000.0 * 0.622 * e / (pres - e)
+            thta = (temp + 273.15) * (1000.0 / pres) ** 0.2857
+            thte = thta * math.exp(2.5e3 * mixr / 1000.0 /
+                                   (1.005 * (temp + 273.15)))
+            thtv = thta * (1 + 0.61 * mixr / 1000.0)
+            drct = 270
+            sknt = int(10 + hght / 500.0)
+            rows.append((pres, hght, temp, dwpt, relh, mixr, drct, sknt,
+                         thta, thte, thtv))
+        return(rows)
+
+    def textlist(self, station, valid):
+        """ Build a synthetic TEXT:LIST sounding for the station """
+        elev = float(station['elev'])
+        lines = ["<HTML>",
+                 "<TITLE>University of Wyoming - Radiosonde Data</TITLE>",
+                 "<BODY BGCOLOR=\"white\">",
+                 "<H2>" + self.title(station, valid) + "</H2>",
+                 "<PRE>",
+                 "-" * 77,
+                 "   PRES   HGHT   TEMP   DWPT   RELH   MIXR   DRCT   SKNT" +
+                 "   THTA   THTE   THTV",
+                 "    hPa     m      C      C      %    g/kg    deg   knot" +
+                 "     K      K      K ",
+                 "-" * 77]
+        for row in self.profile(station):
+            lines.append('%7.1f%7d%7.1f%7.1f%7d%7.2f%7d%7d%7.1f%7.1f%7.1f' %
+                         row)
+        lines += ["</PRE><H3>Station information and sounding indices</H3>" +
+                  "<PRE>",
+                  "                             Station number: " +
+                  station['number'],
+                  "                           Observation time: " +
+                  valid.strftime('%y%m%d/%H00'),
+                  "                           Station latitude: " +
+                  '%.2f' % (float(station['lat']) / 100.0),
+                  "                          Station longitude: " +
+                  '%.2f' % (float(station['lon']) / 100.0),
+                  "                          Station elevation: " +
+                  '%.1f' % elev,
+                  "</PRE>",
+                  "</BODY>",
+                  "</HTML>"]
+        return("\n".join(lines) + "\n")
+
+    def textcsv(self, station):
+        """ Build a synthetic TEXT:CSV sounding for the station """
+        lines = ["PRES,HGHT,TEMP,DWPT,RELH,MIXR,DRCT,SKNT,THTA,THTE,THTV",
+                 "hPa,m,C,C,%,g/kg,deg,knot,K,K,K"]
+        for row in self.profile(station):
+            lines.append('%.1f,%d,%.1f,%.1f,%d,%.2f,%d,%d,%.1f,%.1f,%.1f' %
+                         row)
+        return("\n".join(lines) + "\n")
+
+    def skewt_html(self, station, valid):
+        """ Build the HTML wrapper returned by a GIF:SKEWT request """
+        name = station['description'].strip().replace('_', ' ').title()
+        return("<TITLE>" + station['number'] + " " +
+               station['id'].strip() + " " + name + " Sounding</TITLE>\n" +
+               "<BODY BGCOLOR=\"white\"><CENTER>\n" +
+               "<IMG SRC=\"/upperair/images/" + valid.strftime('%Y%m%d%H') +
+               "." + station['number'] + ".skewt.parc.gif\">\n" +
+               "</BODY>\n</HTML>\n")
+
+    def sounding(self, query):
+        """
+        Return the body for a cgi-bin/sounding request.
+
+        Parameters:
+            query: dictionary of query parameters
+
+        Returns:
+            body: bytes to send
+        """
+        raobtype = query.get('TYPE', [''])[0].replace(':', '%3A')
+        year = query.get('YEAR', [''])[0]
+        month = query.get('MONTH', [''])[0]
+        begin = query.get('FROM', [''])[0]
+        stnm = query.get('STNM', [''])[0]
+
+        try:
+            valid = datetime(int(year), int(month), int(begin[0:2]),
+                             int(begin[2:4]))
+        except ValueError:
+            valid = datetime(1970, 1, 1)
+
+        # Decide once per request, so fixtures fail at the error rate too
+        error = self.is_error()
+        key = (raobtype, stnm, year, month, begin)
+        if key in fixtures and not error:
+            with open(os.path.join(datadir, fixtures[key]), 'rb') as f:
+                return(f.read())
+
+        station = self.get_station(stnm)
+        if self.launch_hours is not None and \
+                valid.hour not in self.launch_hours:
+            station = None  # No launch at this hour
+        if station is None or error:
+            if raobtype == 'GIF%3ASKEWT':
+                return(self.unable(stnm, valid).encode())
+            return(self.cant_get(stnm, valid).encode())
+
+        if raobtype == 'GIF%3ASKEWT':
+            return(self.skewt_html(station, valid).encode())
+        elif raobtype == 'TEXT%3ACSV':
+            return(self.textcsv(station).encode())
+        return(self.textlist(station, valid).encode())
+
+    def image(self):
+        """ Return the body for an upperair/images request """
+        with open(os.path.join(datadir, gif_fixture), 'rb') as f:
+            return(f.read())
+
+
+class UWyoHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        try:
+            self.answer()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up waiting, e.g. timed out
+
+    def answer(self):
+        uwyo = self.server.uwyo
+
+        if not uwyo.admit():
+            self.reply(503, b"Server busy. Please try again later.\n",
+                       "text/plain")
+            return
+
+        uwyo.delay()
+
+        url = urlparse(self.path)
+        if url.path == '/cgi-bin/sounding':
+            self.reply(200, uwyo.sounding(parse_qs(url.query)), "text/html")
+        elif url.path.startswith('/upperair/images/') and \
+                url.path.endswith('.gif'):
+            self.reply(200, uwyo.image(), "image/gif")
+        else:
+            self.reply(404, b"Not found\n", "text/plain")
+
+    def reply(self, code, body, content_type):
+        uwyo = self.server.uwyo
+        headers = {"Content-Type": content_type}
+        if code == 200:
+            headers["ETag"] = '"' + hashlib.md5(body).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == headers["ETag"]:
+                self.send_response(304)
+                self.send_header("ETag", headers["ETag"])
+                self.end_headers()
+                uwyo.unchanged()
+                return
+            if uwyo.gzip and content_type.startswith("text/") and \
+                    'gzip' in self.headers.get("Accept-Encoding", ''):
+                body = gzip.compress(body)
+                headers["Content-Encoding"] = "gzip"
+            elif uwyo.ranges:
+                headers["Accept-Ranges"] = "bytes"
+                code, body = self.get_range(body, headers)
+
+        self.send_response(code)
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if code == 200 and uwyo.truncate < 1.0:
+            # Cut the response short. The connection is closed after it.
+            body = body[:int(len(body) * uwyo.truncate)]
+        if uwyo.trickle > 0:
+            for start in range(0, len(body), 1024):
+                time.sleep(uwyo.trickle)
+                self.wfile.write(body[start:start + 1024])
+                self.wfile.flush()
+        else:
+            self.wfile.write(body)
+        uwyo.sent(len(body))
+
+    def get_range(self, body, headers):
+        """ If the request asks for a range of body from an offset (and,
+        with If-Range, of this version of it), return (206, the range).
+        Otherwise return (200, body). """
+        request = self.headers.get("Range", '')
+        if not request.startswith("bytes=") or not request.endswith("-"):
+            return(200, body)
+        if self.headers.get("If-Range", headers["ETag"]) != headers["ETag"]:
+            return(200, body)
+        offset = int(request[6:-1])
+        if offset >= len(body):
+            return(416, b"")
+        headers["Content-Range"] = "bytes " + str(offset) + "-" + \
+            str(len(body) - 1) + "/" + str(len(body))
+        self.server.uwyo.resumed()
+        return(206, body[offset:])
+
+    def log_message(self, format, *args):
+        """ Don't clutter the terminal/test output with access logs """
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the University of Wyoming " +
+                    "Radiosonde Archive")
+    parser.add_argument('--port', type=int, default=8080,
+                        help='Port to listen on [8080]')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds to wait before each reply [0]')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Max additional random wait (seconds) [0]')
+    parser.add_argument('--error_rate', type=float, default=0.0,
+                        help='Fraction of requests answered with an ' +
+                        'error page [0]')
+    parser.add_argument('--throttle', type=float, default=0.0,
+                        help='Max requests/second before replying 503. ' +
+                        '0 is unlimited [0]')
+    args = parser.parse_args()
+
+    server = UWyoServer(args.port, args.latency, args.jitter,
+                        args.error_rate, args.throttle)
+    print("Serving UWyo stand-in at " + server.start())
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+
+    main()